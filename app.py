@@ -1,28 +1,16 @@
 from sys import platform
 
+import time
+
+# Measured by --profile-startup
+STARTED = time.perf_counter()
+
 import os
 import shutil
 import signal
 import sys
 import subprocess
 import yaml
-from glob import glob
-
-# Processing includes
-import numpy as np
-
-if platform == "linux":
-    import cv2
-elif platform == "win32":
-    from cv2 import cv2
-else:
-    raise Exception("Unsupported platform")
-
-from enum import Enum
-
-# Dicom includes
-import pydicom
-import storescp
 
 # GUI imports
 import PySide6
@@ -32,36 +20,45 @@ from PySide6.QtCore import *
 from PySide6.QtGui import *
 import qdarktheme
 
-# App imports
-from app2 import LayoutView
-from layout_two import LayoutView as LayoutViewTwo
-from layout_eight import LayoutView as LayoutViewEight
-from layout_twelve import LayoutView as LayoutViewTwelve
+# App imports, the heavy ones (opencv, numpy, pydicom, the layout views) are
+# imported on first use so the window comes up quickly
+from archive_layout import iter_instances
+from archive_model import ArchiveModel, SortingModel
+from formats import Format
+from framecache import FrameCache, fileKey
 
 
-class Format(Enum):
-    BMP = 0
-    TIF = 1
-    PNG = 2
-    JPG = 3
+def importCv2():
+    if platform == "linux":
+        import cv2
+    elif platform == "win32":
+        from cv2 import cv2
+    else:
+        raise Exception("Unsupported platform")
+
+    return cv2
 
 
 def launchLayoutViewTwo(path):
+    from layout_two import LayoutView as LayoutViewTwo
     view = LayoutViewTwo(path)
     view.show()
 
 
 def launchLayoutViewFour(path):
+    from app2 import LayoutView
     view = LayoutView(path)
     view.show()
 
 
 def launchLayoutViewEight(path):
+    from layout_eight import LayoutView as LayoutViewEight
     view = LayoutViewEight(path)
     view.show()
 
 
 def launchLayoutViewTwelve(path):
+    from layout_twelve import LayoutView as LayoutViewTwelve
     view = LayoutViewTwelve(path)
     view.show()
 
@@ -70,6 +67,23 @@ class View(QMainWindow):
         super().__init__()
         # Setting default formate
         self.format = Format.BMP
+        self.convertThread = None
+        self.player = None
+
+        # Previews load off the GUI thread, a newer click supersedes older ones
+        self.previewPool = QThreadPool()
+        self.previewPool.setMaxThreadCount(2)
+        self.previewLoader = None
+        self.previewRequest = 0
+        self.frameCache = None
+        self.studyBrowser = None
+
+        # The index is committed when an association ends, so the studies
+        # stored since are merged in once instances stop arriving
+        self.studiesTimer = QTimer(self)
+        self.studiesTimer.setSingleShot(True)
+        self.studiesTimer.setInterval(2000)
+        self.studiesTimer.timeout.connect(self.refreshStudies)
         self.reset()
 
     def reset(self):
@@ -84,12 +98,18 @@ class View(QMainWindow):
                 print(exc)
 
         self.paths = self.verifyAndCreatePaths()
+
+        # Decoded and scaled frames, so revisiting and resizing is instant
+        if self.frameCache is None:
+            self.frameCache = FrameCache(self.config['frame_cache_mb'] * 1024 * 1024)
+        self.frameCache.clear()
         for path in self.paths.values():
             print(path)
 
-        self.frameCounter = 0
-        self.frames = None
+        self.cancelPreview()
+        self.stopVideo()
         self.currentFrame = None
+        self.currentKey = None
         self.frameWidth = 800
         self.frameHeight = 600
 
@@ -100,11 +120,17 @@ class View(QMainWindow):
 
         # self.tree_view.expanded.connect(self.onExpand)
         self.tree_view.clicked.connect(self.on_click)
+        self.leftTabs = QTabWidget(self._w_main)
         self.label = QLabel(self._w_main)
         self.buttonLayout = QHBoxLayout()
         self.formatLabel = QLabel("Save Format:")
         self.convertAllButton = QPushButton("Convert All")
         self.convertAllButton.clicked.connect(self.convertAll)
+        self.cancelConvertButton = QPushButton("Cancel")
+        self.cancelConvertButton.clicked.connect(self.cancelConvert)
+        self.cancelConvertButton.hide()
+        self.convertProgress = QProgressBar()
+        self.convertProgress.hide()
         self.clearAllButton = QPushButton("Clear All")
         self.clearAllButton.clicked.connect(self.clearAll)
 
@@ -120,9 +146,20 @@ class View(QMainWindow):
         self.layoutButtonTwelve = QPushButton("Layout Image Twelve")
         self.layoutButtonTwelve.clicked.connect(self.launchLayoutViewTwelve)
 
+        # Cine playback controls, only shown while a cine is loaded
+        self.playbackLayout = QHBoxLayout()
+        self.playButton = QPushButton("Pause")
+        self.playButton.clicked.connect(self.togglePlayback)
+        self.seekSlider = QSlider(Qt.Horizontal)
+        self.seekSlider.sliderMoved.connect(self.seekVideo)
+        self.playbackLabel = QLabel()
+        self.playbackLayout.addWidget(self.playButton)
+        self.playbackLayout.addWidget(self.seekSlider)
+        self.playbackLayout.addWidget(self.playbackLabel)
+        self.showPlaybackControls(False)
+
         # Loading image
-        self.nullImage = np.zeros((self.frameHeight, self.frameWidth, 3))
-        self.showImage(self.nullImage)
+        self.showImage(None)
 
         # Creating combo box
         self.comboBox = QComboBox()
@@ -134,6 +171,8 @@ class View(QMainWindow):
         self.buttonLayout.addWidget(self.formatLabel, alignment=Qt.AlignRight)
         self.buttonLayout.addWidget(self.comboBox)
         self.buttonLayout.addWidget(self.convertAllButton)
+        self.buttonLayout.addWidget(self.convertProgress)
+        self.buttonLayout.addWidget(self.cancelConvertButton)
         self.buttonLayout.addWidget(self.clearAllButton)
         self.buttonLayout.addWidget(self.layoutButtonTwo)
         self.buttonLayout.addWidget(self.layoutButton)
@@ -145,24 +184,33 @@ class View(QMainWindow):
         self._rightLayout = QVBoxLayout()
         self._rightLayout.addLayout(self.buttonLayout)
         self._rightLayout.addWidget(self.label)
-        self._layout.addWidget(self.tree_view)
+        self._rightLayout.addLayout(self.playbackLayout)
+        self._layout.addWidget(self.leftTabs)
         self._layout.addLayout(self._rightLayout)
         self._w_main.setLayout(self._layout)
 
-        # Creating and configuring model
-        self.model = QFileSystemModel()
-        self.model.setRootPath('./' + self.paths['DCM'])
-        self.model.setFilter(QDir.NoDot | QDir.AllEntries)
-        self.model.sort(0, Qt.SortOrder.AscendingOrder)
+        # Creating and configuring model, new files are added by onInstanceStored
+        self.model = ArchiveModel('./' + self.paths['DCM'])
 
         self.sorting_model = SortingModel()
         self.sorting_model.setSourceModel(self.model)
 
         self.tree_view.setModel(self.sorting_model)
-        self.tree_view.setRootIndex(self.sorting_model.mapFromSource(self.model.index('./' + self.paths['DCM'])))
         self.tree_view.header().setSortIndicator(0, Qt.AscendingOrder)
         self.tree_view.setSortingEnabled(True)
 
+        # Studies from the instance index, the file tree stays as a tab
+        if self.studyBrowser is not None:
+            self.studyBrowser.model.instanceIndex.close()
+            self.studyBrowser = None
+        if self.config['index_path']:
+            from instance_index import InstanceIndex
+            from study_browser import StudyBrowser
+            self.studyBrowser = StudyBrowser(InstanceIndex(self.config['index_path']))
+            self.studyBrowser.instanceSelected.connect(self.showFile)
+            self.leftTabs.addTab(self.studyBrowser, "Studies")
+        self.leftTabs.addTab(self.tree_view, "Files")
+
     def launchLayoutViewTwo(self):
         launchLayoutViewTwo(self.paths[self.format.name])
 
@@ -191,6 +239,9 @@ class View(QMainWindow):
                 print("CREATING " + path)
                 os.makedirs(path)
 
+        # Record of converted files, hidden so Clear All leaves it to us
+        self.manifestPath = self.config['archive_path'] + '/' + '.convert_manifest.json'
+
         # Creating a path for video files
         self.videosPath = self.config['archive_path'] + '/' + 'Videos'
         if not os.path.exists(self.videosPath):
@@ -216,12 +267,25 @@ class View(QMainWindow):
         index = self.tree_view.currentIndex()
         mappedIndex = self.sorting_model.mapToSource(index)
 
-        # Getting the path of selected item
-        path = QFileSystemModel(self.model).filePath(mappedIndex)
-        filetype = QFileSystemModel(self.model).type(mappedIndex)
+        # Patient/study/series folders of the archive layout
+        if self.model.isDir(mappedIndex):
+            return
+
+        self.showFile(self.model.filePath(mappedIndex))
+
+    def showFile(self, path):
+        from pydicom.misc import is_dicom
+        if not os.path.exists(path):
+            self.statusBar().showMessage("Missing " + path, 5000)
+            return
+
+        filetype = "DICOM" if is_dicom(path) else "Image"
         extension = path.split('.')[-1]
 
-        if "dicom" in filetype or "DICOM" in filetype or "Dicom" in filetype:
+        self.cancelPreview()
+        self.stopVideo()
+
+        if filetype == "DICOM":
             print("file is dicom")
 
             self.showDicomImage(path)
@@ -234,65 +298,153 @@ class View(QMainWindow):
         print("File Type:   ", filetype)
         print("File Ext:    ", extension)
 
+    def onInstanceStored(self, path):
+        # A single row, rather than rescanning the archive
+        self.model.addFile(path)
+        self.studiesTimer.start()
+        self.statusBar().showMessage("Received " + os.path.basename(path), 5000)
+
+    def refreshStudies(self):
+        if self.studyBrowser is not None:
+            self.studyBrowser.mergeChanges()
+
     def index_changed(self, index):
         self.format = Format(index)
         print("FORMAT SELECTED: ", self.format.name)
 
-    # Expects opencv frame
-    def showImage(self, frame):
+    # Expects opencv frame or None for a blank image, key identifies a cached frame
+    def showImage(self, frame, key=None):
 
         # Updating current frame (used for resizing)
         self.currentFrame = frame
+        self.currentKey = key
 
-        # Resizing frame to current acceptable framesize
-        frame = cv2.resize(frame, (self.frameWidth, self.frameHeight), cv2.INTER_AREA)
+        # Drawn without opencv, so it isn't loaded before the window shows
+        if frame is None:
+            pixmap = QPixmap(self.frameWidth, self.frameHeight)
+            pixmap.fill(Qt.black)
+            self.label.setPixmap(pixmap)
+            return
+
+        cv2 = importCv2()
 
-        # Creating image from frame
+        # Resizing frame to current acceptable framesize
+        scaledKey = None if key is None else key + (self.frameWidth, self.frameHeight)
+        scaled = None if key is None else self.frameCache.get(scaledKey)
+        if scaled is None:
+            scaled = cv2.resize(frame, (self.frameWidth, self.frameHeight), cv2.INTER_AREA)
+            if key is not None:
+                self.frameCache.put(scaledKey, scaled)
+        frame = scaled
+
+        # Creating image from frame, copied so the image owns its data rather
+        # than pointing into a read-only cached frame
         image = QImage(frame, frame.shape[1], frame.shape[0],
-                       frame.strides[0], QImage.Format_RGB888)
+                       frame.strides[0], QImage.Format_RGB888).copy()
 
         pixmap = QPixmap.fromImage(image)
         self.label.setPixmap(pixmap)
 
     def showJpegImage(self, path):
-        frame = cv2.imread(path)
-
-        self.showImage(frame)
+        cv2 = importCv2()
+        key = fileKey(path)
+        frame = self.frameCache.get(key)
+        if frame is None:
+            frame = cv2.imread(path)
+            if frame is None:
+                print("ERROR! COULD NOT READ IMAGE: " + path)
+                return
+            self.frameCache.put(key, frame)
+
+        self.showImage(frame, key)
 
     def showDicomImage(self, path):
-        dataset = pydicom.dcmread(path)
+        from preview import PreviewLoader
+        self.previewLoader = PreviewLoader(self.previewRequest, path, self.frameCache)
+        self.previewLoader.signals.cineLoaded.connect(self.onCineLoaded)
+        self.previewLoader.signals.imageLoaded.connect(self.onImageLoaded)
+        self.previewLoader.signals.failed.connect(self.onPreviewFailed)
+        self.previewPool.start(self.previewLoader)
+
+    def cancelPreview(self):
+        # Results of older requests are ignored even if already queued
+        self.previewRequest += 1
+        if self.previewLoader is not None:
+            self.previewLoader.cancel()
+            self.previewLoader = None
+        self.previewPool.clear()
+
+    def onCineLoaded(self, request, reader, key, frame):
+        if request != self.previewRequest:
+            return
 
-        if (len(dataset.pixel_array.shape) == 4):
-            print("STARTING VIDEO...")
-            frame = dataset.pixel_array
-            self.showVideo(frame)
+        print("STARTING VIDEO...")
+        self.showImage(frame, key)
+        self.showVideo(reader)
 
-        else:
-            frame = dataset.pixel_array[:, :, :]
-            self.showImage(frame)
+    def onImageLoaded(self, request, key, frame):
+        if request != self.previewRequest:
+            return
+
+        self.showImage(frame[:, :, :], key)
+
+    def onPreviewFailed(self, request, message):
+        if request != self.previewRequest:
+            return
+
+        print("ERROR! COULD NOT LOAD PREVIEW")
+        print(message)
+
+    def showVideo(self, reader):
+        from playback import FramePlayer
+        # Frames are decoded and scaled ahead of time off the GUI thread
+        self.player = FramePlayer(reader, self.frameWidth, self.frameHeight)
+        self.player.frameShown.connect(self.showVideoFrame)
+        self.player.finished.connect(self.onVideoFinished)
+
+        self.seekSlider.setRange(0, reader.numberOfFrames - 1)
+        self.seekSlider.setValue(0)
+        self.playButton.setText("Pause")
+        self.showPlaybackControls(True)
+        self.player.play()
 
-    def showVideo(self, frame):
-        self.frameCounter = 0
-        self.frames = frame
+    def showVideoFrame(self, image, index):
+        self.label.setPixmap(QPixmap.fromImage(image))
 
-        # intialize a thread timer
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.getNextFrame)
-        self.timer.start(33)
+        self.seekSlider.blockSignals(True)
+        self.seekSlider.setValue(index)
+        self.seekSlider.blockSignals(False)
+        self.playbackLabel.setText("Frame %d/%d  Dropped %d" % (
+            index + 1, self.player.reader.numberOfFrames, self.player.droppedFrames))
 
-    def getNextFrame(self):
-        """Read frame from camera and repaint QLabel widget.
-        """
-        curr = self.frames[self.frameCounter, :, :, :]
-        curr = cv2.cvtColor(curr, cv2.COLOR_YUV2RGB)
+    def onVideoFinished(self):
+        self.playButton.setText("Play")
+
+    def togglePlayback(self):
+        if self.player is None:
+            return
+
+        if self.player.playing:
+            self.player.pause()
+            self.playButton.setText("Play")
+        else:
+            self.player.play()
+            self.playButton.setText("Pause")
 
-        self.showImage(curr)
+    def seekVideo(self, index):
+        if self.player is not None:
+            self.player.seek(index)
 
-        # incrementing frame counter
-        self.frameCounter += 1
+    def stopVideo(self):
+        if self.player is not None:
+            self.player.stop()
+            self.player = None
+            self.showPlaybackControls(False)
 
-        if self.frameCounter >= self.frames.shape[0]:
-            self.timer.stop()
+    def showPlaybackControls(self, visible):
+        self.playButton.setVisible(visible)
+        self.seekSlider.setVisible(visible)
+        self.playbackLabel.setVisible(visible)
 
     # Event
     def resizeEvent(self, event):
@@ -308,69 +460,47 @@ class View(QMainWindow):
         self.label.setFixedSize(self.frameWidth, self.frameHeight)
 
         # Updating the image by calling show image
-        self.showImage(self.currentFrame)
+        if self.player is not None:
+            self.player.setSize(self.frameWidth, self.frameHeight)
+        else:
+            self.showImage(self.currentFrame, self.currentKey)
 
     def convertAll(self):
+        if self.convertThread is not None and self.convertThread.isRunning():
+            return
+
         print("CONVERTING FILES")
         print("Dumping ", self.format.name)
-        for f in glob('./' + self.paths['DCM'] + '/*'):
-            dataset = pydicom.dcmread(f)
-
-            # Creating file path
-            filename = f.split("/")[-1]
-            filename = filename[4:]
-            print(filename)
-
-            # try:
-            if len(dataset.pixel_array.shape) == 4:
-                filepath = self.videosPath + '/' + filename + '.mp4'
-                print(filepath)
-
-                # Have to dump a video
-                _, H, W, C = dataset.pixel_array.shape
-                self._capture = cv2.VideoCapture(0)
-                self._outVideo = cv2.VideoWriter(filepath + '.mp4', cv2.VideoWriter_fourcc(*'MP4V'), 10, (W, H))
-
-                for ind, data in enumerate(dataset.pixel_array):
-                    # Vida frames are in YUV color space
-                    # Have to swtich color channels before saving with opencv
-                    data = cv2.cvtColor(data, cv2.COLOR_YUV2RGB)
-                    data = data[:, :, ::-1]
-
-                    self._outVideo.write(data)
-
-                # Close the video file
-                self._outVideo.release()
-
-                #     if(self.format == Format.JPG):
-                #         cv2.imwrite(filepath + str(ind) + '.jpg', data, [cv2.IMWRITE_JPEG_QUALITY, 100])
-                #     elif self.format == Format.BMP:
-                #         cv2.imwrite(filepath + str(ind) + '.bmp', data)
-                #     elif self.format == Format.TIF:
-                #         cv2.imwrite(filepath + str(ind) + '.tif', data)
-                #     elif self.format == Format.PNG:
-                #         cv2.imwrite(filepath + str(ind) + '.png', data)
-
-                # print("4D IMAGE NOT SUPPORTED FOR CONVERSION YET...")
-            else:
-                filepath = self.paths[self.format.name] + '/' + filename + '.' + self.format.name.lower()
-                print(filepath)
-
-                # Have to swtich color channels before saving with opencv
-                data = dataset.pixel_array[:, :, ::-1]
-
-                if (self.format == Format.JPG):
-                    cv2.imwrite(filepath + '.jpg', data, [cv2.IMWRITE_JPEG_QUALITY, 100])
-                elif self.format == Format.BMP:
-                    cv2.imwrite(filepath + '.bmp', data)
-                elif self.format == Format.TIF:
-                    cv2.imwrite(filepath + '.tif', data)
-                elif self.format == Format.PNG:
-                    cv2.imwrite(filepath + '.png', data)
-
-            # except:
-            #     print("ERROR! COULD NOT SAVE THIS FILE: " + f)
-            #     pass
+
+        paths = list(iter_instances('./' + self.paths['DCM']))
+        self.convertThread = ConvertThread(paths, self.format, self.paths[self.format.name],
+                                           self.videosPath, self.config['convert_workers'],
+                                           self.manifestPath)
+        self.convertThread.progress.connect(self.onConvertProgress)
+        self.convertThread.finished.connect(self.onConvertFinished)
+
+        self.convertAllButton.setEnabled(False)
+        self.convertProgress.setRange(0, len(paths))
+        self.convertProgress.setValue(0)
+        self.convertProgress.show()
+        self.cancelConvertButton.show()
+        self.convertThread.start()
+
+    def cancelConvert(self):
+        if self.convertThread is not None:
+            print("CANCELLING CONVERSION")
+            self.convertThread.cancel()
+
+    def onConvertProgress(self, done, total):
+        # Total excludes the files skipped as already converted
+        self.convertProgress.setMaximum(total)
+        self.convertProgress.setValue(done)
+
+    def onConvertFinished(self):
+        print("CONVERSION FINISHED")
+        self.convertAllButton.setEnabled(True)
+        self.convertProgress.hide()
+        self.cancelConvertButton.hide()
 
     def clearAll(self):
 
@@ -385,6 +515,10 @@ class View(QMainWindow):
         paths.append('archive/')
         for folder in paths:
             for filename in os.listdir(folder):
+                # Hidden entries belong to the running server (spool files)
+                if filename.startswith('.'):
+                    continue
+
                 file_path = os.path.join(folder, filename)
                 try:
                     if os.path.isfile(file_path) or os.path.islink(file_path):
@@ -394,9 +528,44 @@ class View(QMainWindow):
                 except Exception as e:
                     print('Failed to delete %s. Reason: %s' % (file_path, e))
 
+        # Everything has to be converted again
+        if os.path.exists(self.manifestPath):
+            os.unlink(self.manifestPath)
+
+        # The index lives in a hidden file, so only its rows are removed
+        if self.config['index_path'] and os.path.exists(self.config['index_path']):
+            from instance_index import InstanceIndex
+            index = InstanceIndex(self.config['index_path'])
+            index.clear()
+            index.close()
+
         self.reset()
 
 
+class ConvertThread(QThread):
+    """Runs a BatchConverter off the GUI thread."""
+    progress = Signal(int, int)
+
+    def __init__(self, paths, format, imagesPath, videosPath, workers, manifestPath):
+        from converter import BatchConverter
+        super().__init__()
+        self.paths = paths
+        self.format = format
+        self.imagesPath = imagesPath
+        self.videosPath = videosPath
+        self.manifestPath = manifestPath
+        self.converter = BatchConverter(workers)
+
+    def run(self):
+        from converter import ConversionManifest
+        manifest = ConversionManifest(self.manifestPath)
+        self.converter.run(self.paths, self.format, self.imagesPath, self.videosPath,
+                           progress=self.progress.emit, manifest=manifest)
+
+    def cancel(self):
+        self.converter.cancel()
+
+
 class DeleteConfirmationDialog(QDialog):
     def __init__(self):
         super().__init__()
@@ -416,42 +585,76 @@ class DeleteConfirmationDialog(QDialog):
         self.setLayout(self.layout)
 
 
-class SortingModel(QSortFilterProxyModel):
-    def lessThan(self, source_left, source_right):
-        file_info1 = self.sourceModel().fileInfo(source_left)
-        file_info2 = self.sourceModel().fileInfo(source_right)
-
-        if file_info1.fileName() == "..":
-            return self.sortOrder() == Qt.SortOrder.AscendingOrder
-
-        if file_info2.fileName() == "..":
-            return self.sortOrder() == Qt.SortOrder.DescendingOrder
-
-        if (file_info1.isDir() and file_info2.isDir()) or (file_info1.isFile() and file_info2.isFile()):
-            return super().lessThan(source_left, source_right)
-
-        return file_info1.isDir() and self.sortOrder() == Qt.SortOrder.AscendingOrder
-
-
 if __name__ == "__main__":
 
+    # Reports the import cost of each module and the time to the first window
+    if '--profile-startup' in sys.argv:
+        from startup_profile import profileStartup
+        sys.exit(profileStartup(__file__))
+
     app = QtWidgets.QApplication([])
     app.setStyleSheet(qdarktheme.load_stylesheet())
 
     view = View()
 
+    if '--startup-probe' in sys.argv:
+        view.show()
+        app.processEvents()
+        print("First window shown after %.1f ms" % ((time.perf_counter() - STARTED) * 1000))
+        sys.exit()
+
     # Starting server
-    process = subprocess.Popen(['python', 'storescp.py',
-                                str(view.config['port']),
-                                '-ba', view.config['ip'],
-                                '-od', view.paths['DCM'],
-                                '-aet', view.config['ae_title'],
-                                '-v'],
-                               stdout=subprocess.PIPE,
-                               universal_newlines=True)
+    args = [str(view.config['port']),
+            '-ba', view.config['ip'],
+            '-od', view.paths['DCM'],
+            '-aet', view.config['ae_title'],
+            '--layout', view.config['archive_layout'],
+            '-w', str(view.config['store_writers']),
+            '-qs', str(view.config['store_queue_size']),
+            '--workers', str(view.config['server_workers']),
+            '-v']
+    if view.config['raw_store']:
+        args.append('--raw-store')
+    if view.config['spool']:
+        args.append('--spool')
+    if view.config['index_path']:
+        args += ['--index-db', view.config['index_path']]
+    for rule in view.config['export_rules']:
+        args += ['--export', rule]
+    if view.config['export_videos']:
+        args += ['--export-videos', view.config['export_videos']]
+    args += ['--export-workers', str(view.config['export_workers'])]
+    # Exported files are skipped by Convert All
+    args += ['--export-manifest', view.manifestPath]
+    if view.config['metrics_port']:
+        args += ['--metrics-port', str(view.config['metrics_port'])]
+
+    # Several workers need their own processes, and spooling changes process-wide
+    # tempfile and pynetdicom settings for as long as the server runs
+    inProcess = (view.config['in_process_server'] and view.config['server_workers'] <= 1
+                 and not view.config['spool'])
+    if not inProcess:
+        args += ['--notify-port', str(view.config['notify_port'])]
+
+    # Stored files are pushed to the tree, from the server's threads or a socket
+    from server_events import NotificationClient, ServerEvents, startServer
+    events = ServerEvents()
+    events.instanceStored.connect(view.onInstanceStored)
+
+    if inProcess:
+        server = startServer(args, events)
+    else:
+        # Output isn't piped, nothing would read it and a full pipe blocks the server
+        process = subprocess.Popen(['python', 'storescp.py'] + args)
+        clients = [NotificationClient(view.config['notify_port'] + ii, events)
+                   for ii in range(max(1, view.config['server_workers']))]
 
     view.show()
     app.exec()
-    os.kill(process.pid, signal.SIGTERM)
+    if inProcess:
+        server.stop()  # Finishes writing queued datasets
+    else:
+        os.kill(process.pid, signal.SIGTERM)
+        process.wait()  # Let the server finish writing queued datasets
     sys.exit()
 
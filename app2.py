@@ -1,11 +1,6 @@
 from sys import platform
 
-import os
 import sys
-from glob import glob
-
-# Processing includes
-import numpy as np
 
 if platform == "linux":
     import cv2
@@ -23,6 +18,10 @@ from PySide6.QtCore import *
 from PySide6.QtGui import *
 import qdarktheme
 
+from gallery import Gallery
+from mosaic import composeMosaic, gridFromCorners
+from thumbnails import defaultCache
+
 frameWidth = 800
 frameHeight = 600
 
@@ -57,59 +56,10 @@ class LayoutView(QMainWindow):
 
         self._w_main.setLayout(self.stackedLayout)
 
-    def HorzCat(self, imageA, imageB):
-        width = imageA.shape[1] + imageB.shape[1]
-        height = max(imageA.shape[0], imageB.shape[0])
-
-        image = np.zeros((height, width, imageA.shape[2]), dtype=np.uint8)
-        image[:imageA.shape[0], :imageA.shape[1], :] = imageA
-        image[:imageB.shape[0], imageA.shape[1]:imageA.shape[1]+imageB.shape[1], :] = imageB
-
-        return image
-
-    def VertCat(self, imageA, imageB):
-        width = max(imageA.shape[1], imageB.shape[1])
-        height = imageA.shape[0] + imageB.shape[0]
-
-        image = np.zeros((height, width, imageA.shape[2]), dtype=np.uint8)
-        image[:imageA.shape[0], :imageA.shape[1], :] = imageA
-        image[imageA.shape[0]:, :imageB.shape[1], :] = imageB
-
-        return image
-
     def concatAndSave(self):
-        topRow = self.HorzCat(
-            self.quadImageGroupBox.images[Corner.TL.name],
-            self.quadImageGroupBox.images[Corner.TR.name],
-        )
-
-        bottomRow = self.HorzCat(
-            self.quadImageGroupBox.images[Corner.BL.name],
-            self.quadImageGroupBox.images[Corner.BR.name],
-        )
-
-        fullImage = self.VertCat(
-            topRow,
-            bottomRow,
-        )
-
-        # fullImage = np.zeros((2 * maxHeight, 2 * maxWidth, 3), dtype=np.uint8)
-
-        # fullImage[:maxHeight, :maxWidth, :] = self.quadImageGroupBox.images[Corner.TL.name]
-        # fullImage[:maxHeight, maxWidth:, :] = self.quadImageGroupBox.images[Corner.TR.name]
-        # fullImage[maxHeight:, :maxWidth, :] = self.quadImageGroupBox.images[Corner.BL.name]
-        # fullImage[maxHeight:, maxWidth:, :] = self.quadImageGroupBox.images[Corner.BR.name]
-
-        bordersize = 20
-        bordered = cv2.copyMakeBorder(
-            fullImage,
-            top=bordersize,
-            bottom=bordersize,
-            left=bordersize,
-            right=bordersize,
-            borderType=cv2.BORDER_CONSTANT,
-            value=[255, 255, 255]
-        )
+        # One allocation for the whole layout, border included
+        grid = gridFromCorners(self.quadImageGroupBox.images, Corner)
+        bordered = composeMosaic(grid, border=20)
 
         cv2.imwrite('archive/' + self.saveForm.filename.text(), bordered)
 
@@ -197,16 +147,8 @@ class QuadImageGroupBox(QGroupBox):
 
         self.images[self.currentCorner.name] = image
 
-        # Saving preview image
-        if not os.path.exists('cache'):
-            os.mkdir('cache')
-
-        imgName = path.split('/')[-1]
-        imgName = imgName[4:]
-        previewPath = 'cache/' + imgName
-        prev = image.copy()
-        prev = cv2.resize(prev, (int(frameWidth/2), int(frameHeight/2)), cv2.INTER_AREA)
-        cv2.imwrite(previewPath, prev)
+        # Preview image from the shared thumbnail cache
+        previewPath = defaultCache().thumbnail(path, int(frameWidth/2), int(frameHeight/2))
 
         button = self.buttons[self.currentCorner.name]
         button.setFixedSize(frameWidth/2, frameHeight/2)
@@ -218,25 +160,6 @@ class QuadImageGroupBox(QGroupBox):
         print("Setting image to", self.currentCorner)
 
 
-class Gallery(QScrollArea):
-    def __init__(self, parent):
-
-        super().__init__()
-
-        self.parent = parent
-        self.vertLayout = QVBoxLayout()
-        self.thumbnails = QGroupBox()
-
-        # FIlling vertlayout
-        images_path = 'archive/PNG'
-        for path in glob('./' + images_path + '/*'):
-            self.vertLayout.addWidget(DragLabel(path, self))
-
-        self.thumbnails.setLayout(self.vertLayout)
-        self.setWidget(self.thumbnails)
-        self.setMaximumWidth(350)
-
-
 class BigButton(QPushButton):
     def __init__(self, title, corner):
         super().__init__()
@@ -249,26 +172,6 @@ class BigButton(QPushButton):
         self.setFixedSize(frameWidth/2, frameHeight/2)
 
 
-class DragLabel(QLabel):
-    def __init__(self, path, parent):
-        super(DragLabel, self).__init__()
-
-        self.parent = parent
-        self.filePath = path
-
-        frame = cv2.imread(self.filePath)[:, :, ::-1]
-        frame = cv2.resize(frame, (300, 300), cv2.INTER_AREA)
-        image = QImage(frame, frame.shape[1], frame.shape[0],
-                       frame.strides[0], QImage.Format_RGB888)
-
-        # Create a label widget and add to vertical layout
-        self.setPixmap(QPixmap.fromImage(image))
-
-    def mousePressEvent(self, event):
-        self.parent.parent.stackedLayout.setCurrentIndex(0)  # change page to grid view
-        self.parent.parent.quadImageGroupBox.setImage(self.filePath)
-
-
 if __name__ == "__main__":
 
     app = QtWidgets.QApplication([])
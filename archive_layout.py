@@ -0,0 +1,95 @@
+"""Storage layouts for the DICOM archive.
+
+* ``flat`` stores every instance directly in the archive directory.
+* ``hierarchy`` stores instances in PatientID/StudyInstanceUID/
+  SeriesInstanceUID sub-directories.
+* ``hashed`` stores instances in two levels of sub-directories named after
+  the SHA-1 of the SOP Instance UID, so an instance can be found from its
+  UID alone.
+
+In every layout the directory holding an instance can be computed directly,
+so finding an instance never requires listing the whole archive.
+"""
+
+import hashlib
+import os
+import re
+
+
+LAYOUTS = ("flat", "hierarchy", "hashed")
+
+# Characters that aren't safe in a directory name on Linux or Windows
+_UNSAFE = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def instance_directory(
+    layout, sop_instance, patient_id=None, study_uid=None, series_uid=None
+):
+    """Return the directory of an instance, relative to the archive root.
+
+    Parameters
+    ----------
+    layout : str
+        One of :data:`LAYOUTS`.
+    sop_instance : str
+        The instance's SOP Instance UID.
+    patient_id, study_uid, series_uid : str, optional
+        The instance's Patient ID, Study Instance UID and Series Instance
+        UID, required by the ``hierarchy`` layout.
+    """
+    if layout == "flat":
+        return ""
+
+    if layout == "hashed":
+        digest = hashlib.sha1(str(sop_instance).encode("ascii")).hexdigest()
+        return os.path.join(digest[:2], digest[2:4])
+
+    if layout == "hierarchy":
+        return os.path.join(
+            _component(patient_id), _component(study_uid), _component(series_uid)
+        )
+
+    raise ValueError(f"Unknown archive layout '{layout}'")
+
+
+def find_instance(root, layout, sop_instance, **kwargs):
+    """Return the path of a stored instance, or ``None`` if not found.
+
+    Only the instance's own directory is listed, see
+    :func:`instance_directory` for the parameters.
+    """
+    directory = os.path.join(
+        root, instance_directory(layout, sop_instance, **kwargs)
+    )
+    suffix = f".{sop_instance}"
+    try:
+        for entry in os.scandir(directory):
+            if entry.name.endswith(suffix) and not entry.name.startswith("."):
+                return entry.path
+    except FileNotFoundError:
+        pass
+
+    return None
+
+
+def iter_instances(root):
+    """Yield the path of every stored instance below `root`.
+
+    Hidden files and directories (spool and partially written files) are
+    skipped.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if not filename.startswith("."):
+                yield os.path.join(dirpath, filename)
+
+
+def _component(value):
+    """Return `value` made safe for use as a directory name."""
+    value = _UNSAFE.sub("_", str(value or "").strip())
+    # A leading '.' would hide the directory, or escape it for '..'
+    if value.startswith("."):
+        value = "_" + value[1:]
+
+    return value or "UNKNOWN"
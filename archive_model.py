@@ -0,0 +1,117 @@
+import os
+
+# GUI imports
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+PathRole = Qt.UserRole + 1
+IsDirRole = Qt.UserRole + 2
+# Keys putting ".." then directories first for either sort order
+AscendingKeyRole = Qt.UserRole + 3
+DescendingKeyRole = Qt.UserRole + 4
+
+
+def sortKeys(name, isDir):
+    """The ascending and descending sort keys of a tree entry."""
+    if name == '..':
+        return '', '\uffff'
+
+    if isDir:
+        return '1' + name, '2' + name
+
+    return '2' + name, '1' + name
+
+
+class ArchiveModel(QStandardItemModel):
+    """Tree of the files in the archive, updated one file at a time.
+
+    The directory is listed once, after that the storage server tells us
+    about new files (see server_events) and each is inserted as a single
+    row, so the cost of a new file doesn't depend on the archive size.
+    Hidden files (spool, partial writes, index) are left out.
+    """
+
+    def __init__(self, root):
+        super().__init__()
+        self.root = os.path.abspath(root)
+        self.setHorizontalHeaderLabels(['Name'])
+        self._dirs = {self.root: self.invisibleRootItem()}
+        self._files = set()
+        self.populate()
+
+    def populate(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            parent = self._dirs[dirpath]
+
+            items = []
+            for dirname in dirnames:
+                path = os.path.join(dirpath, dirname)
+                item = self._makeItem(path, True)
+                self._dirs[path] = item
+                items.append(item)
+
+            for filename in sorted(filenames):
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                self._files.add(path)
+                items.append(self._makeItem(path, False))
+
+            # One insertion per directory rather than per row
+            if items:
+                parent.appendRows(items)
+
+    def addFile(self, path):
+        path = os.path.abspath(path)
+        if (not path.startswith(self.root + os.sep) or path in self._files
+                or os.path.basename(path).startswith('.')):
+            return
+
+        parent = self._directory(os.path.dirname(path))
+        self._files.add(path)
+        parent.appendRow(self._makeItem(path, False))
+
+    def filePath(self, index):
+        return index.data(PathRole)
+
+    def isDir(self, index):
+        return bool(index.data(IsDirRole))
+
+    def _directory(self, path):
+        item = self._dirs.get(path)
+        if item is None:
+            parent = self._directory(os.path.dirname(path))
+            item = self._makeItem(path, True)
+            parent.appendRow(item)
+            self._dirs[path] = item
+
+        return item
+
+    def _makeItem(self, path, isDir):
+        item = QStandardItem(os.path.basename(path))
+        item.setEditable(False)
+        item.setData(path, PathRole)
+        item.setData(isDir, IsDirRole)
+        ascending, descending = sortKeys(item.text(), isDir)
+        item.setData(ascending, AscendingKeyRole)
+        item.setData(descending, DescendingKeyRole)
+
+        return item
+
+
+class SortingModel(QSortFilterProxyModel):
+    """Sorts the archive tree with ".." and directories first.
+
+    Rather than overriding lessThan, which Qt would call back into Python
+    for every comparison, the sort role is switched to keys stored on the
+    items, so the comparisons stay in C++.
+    """
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if order == Qt.AscendingOrder:
+            self.setSortRole(AscendingKeyRole)
+        else:
+            self.setSortRole(DescendingKeyRole)
+
+        super().sort(column, order)
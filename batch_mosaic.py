@@ -0,0 +1,338 @@
+"""Headless batch generation of layout mosaics.
+
+Composes 2/4/8/12-up (or any rows x columns) layout images without Qt,
+either one mosaic set per study or series selected from the instance index
+(or found by scanning an archive), or from an explicit list of files.
+Studies are composed in parallel on a process pool.
+
+Examples::
+
+    python batch_mosaic.py --index-db archive/.index.sqlite --grid 2x2 \\
+        --all-studies -o reports
+    python batch_mosaic.py --grid 1x2 -o reports a.png b.png
+"""
+
+import argparse
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from archive_layout import iter_instances
+from converter import readFrame
+from instance_index import InstanceIndex, read_row
+from mosaic import composeMosaic
+
+try:
+    import cv2
+except ImportError:
+    from cv2 import cv2
+
+
+def _setup_argparser():
+    """Setup the command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Compose layout mosaics of studies, series or files.",
+        usage="batch_mosaic [options] [files ...]",
+    )
+
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="DICOM or image files to compose, instead of a selection",
+    )
+
+    sel_opts = parser.add_argument_group("Selection Options")
+    sel_opts.add_argument(
+        "--index-db",
+        metavar="[f]ile",
+        help="select instances from the SQLite instance index f",
+        type=str,
+    )
+    sel_opts.add_argument(
+        "--archive",
+        metavar="[d]irectory",
+        help="select instances by reading the headers of the archive in d",
+        type=str,
+    )
+    sel_opts.add_argument(
+        "--study",
+        metavar="[u]id",
+        help="compose the study with Study Instance UID u, may be repeated",
+        action="append",
+        default=[],
+    )
+    sel_opts.add_argument(
+        "--series",
+        metavar="[u]id",
+        help="compose the series with Series Instance UID u, may be repeated",
+        action="append",
+        default=[],
+    )
+    sel_opts.add_argument(
+        "--patient-id",
+        metavar="[i]d",
+        help="compose every study of patient i, may be repeated",
+        action="append",
+        default=[],
+    )
+    sel_opts.add_argument(
+        "--all-studies",
+        help="compose every study",
+        action="store_true",
+    )
+    sel_opts.add_argument(
+        "--modality",
+        metavar="[m]odality",
+        help="only compose instances with Modality m, may be repeated",
+        action="append",
+        default=[],
+    )
+    sel_opts.add_argument(
+        "--date-from",
+        metavar="YYYYMMDD",
+        help="only compose studies from this Study Date on",
+        type=str,
+    )
+    sel_opts.add_argument(
+        "--date-to",
+        metavar="YYYYMMDD",
+        help="only compose studies up to this Study Date",
+        type=str,
+    )
+    sel_opts.add_argument(
+        "--per-series",
+        help="compose one mosaic set per series instead of per study",
+        action="store_true",
+    )
+
+    out_opts = parser.add_argument_group("Output Options")
+    out_opts.add_argument(
+        "--grid",
+        metavar="[r]owsx[c]olumns",
+        help="layout grid, e.g. 1x2, 2x2, 4x2 or 6x2 (default: 2x2)",
+        type=str,
+        default="2x2",
+    )
+    out_opts.add_argument(
+        "--cell",
+        metavar="[w]idthx[h]eight",
+        help="resize every image to w x h (default: keep image sizes)",
+        type=str,
+    )
+    out_opts.add_argument(
+        "--border",
+        metavar="[n]umber",
+        help="white border of n pixels (default: 20)",
+        type=int,
+        default=20,
+    )
+    out_opts.add_argument(
+        "--format",
+        metavar="[e]xtension",
+        help="output image format (default: png)",
+        type=str,
+        default="png",
+    )
+    out_opts.add_argument(
+        "-o",
+        "--output-directory",
+        metavar="[d]irectory",
+        help="write the mosaics to directory d (default: .)",
+        type=str,
+        default=".",
+    )
+    out_opts.add_argument(
+        "-j",
+        "--workers",
+        metavar="[n]umber",
+        help="compose n studies at once (default: number of CPUs)",
+        type=int,
+        default=os.cpu_count(),
+    )
+
+    return parser.parse_args()
+
+
+def _parse_size(value, option):
+    match = re.fullmatch(r"(\d+)x(\d+)", value or "")
+    if not match or not all(int(size) for size in match.groups()):
+        sys.exit(f"Invalid {option} '{value}', expected e.g. 2x2")
+
+    return int(match.group(1)), int(match.group(2))
+
+
+def _where(args):
+    """Return the WHERE clause and parameters selecting the instances."""
+    conditions = []
+    parameters = []
+    if not args.all_studies:
+        chosen = []
+        for column, values in (
+            ("study_instance_uid", args.study),
+            ("series_instance_uid", args.series),
+            ("patient_id", args.patient_id),
+        ):
+            if values:
+                chosen.append(f"{column} IN ({', '.join('?' * len(values))})")
+                parameters += values
+        conditions.append(f"({' OR '.join(chosen)})" if chosen else "0")
+
+    if args.modality:
+        conditions.append(f"modality IN ({', '.join('?' * len(args.modality))})")
+        parameters += args.modality
+    if args.date_from:
+        conditions.append("study_date >= ?")
+        parameters.append(args.date_from)
+    if args.date_to:
+        conditions.append("study_date <= ?")
+        parameters.append(args.date_to)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, parameters
+
+
+def _selected(args, row):
+    """Return True if the header `row` is selected, as :func:`_where`."""
+    # As in SQL, a missing date is neither before nor after any date
+    date = row["study_date"]
+    return (
+        (
+            args.all_studies
+            or row["study_instance_uid"] in args.study
+            or row["series_instance_uid"] in args.series
+            or row["patient_id"] in args.patient_id
+        )
+        and (not args.modality or row["modality"] in args.modality)
+        and (not args.date_from or (date is not None and date >= args.date_from))
+        and (not args.date_to or (date is not None and date <= args.date_to))
+    )
+
+
+def select_rows(args):
+    """Return the index rows of the selected instances.
+
+    With an index only the selected rows are queried, using its indexes on
+    the study, series, patient, modality and date columns.
+    """
+    if args.index_db:
+        where, parameters = _where(args)
+        index = InstanceIndex(args.index_db)
+        try:
+            return index.query(
+                f"SELECT * FROM instances {where} ORDER BY study_instance_uid, "
+                "series_instance_uid, path",
+                parameters,
+            )
+        finally:
+            index.close()
+
+    rows = []
+    for path in iter_instances(args.archive):
+        try:
+            row = read_row(path, path, os.path.getsize(path))
+        except Exception as exc:
+            print(f"Skipping {path}: {exc}", file=sys.stderr)
+            continue
+
+        if _selected(args, row):
+            rows.append(row)
+
+    return rows
+
+
+def group_rows(rows, per_series):
+    """Return {name: [path, ...]} with one group per study or series."""
+    key = "series_instance_uid" if per_series else "study_instance_uid"
+    groups = {}
+    for row in rows:
+        groups.setdefault(row[key] or "UNKNOWN", []).append(row["path"])
+
+    return groups
+
+
+def compose_group(name, paths, grid, cell, border, output_directory, ext):
+    """Compose and write the mosaics of one group, runs in a worker process.
+
+    Groups with more images than grid cells are split over several pages.
+
+    Returns
+    -------
+    list of str
+        The written files.
+    """
+    rows, columns = grid
+    per_page = rows * columns
+    pages = [paths[ii:ii + per_page] for ii in range(0, len(paths), per_page)]
+
+    outputs = []
+    for number, page in enumerate(pages, 1):
+        images = [readFrame(path) for path in page]
+        images += [None] * (per_page - len(images))
+        mosaic = composeMosaic(
+            [images[ii:ii + columns] for ii in range(0, per_page, columns)],
+            border=border,
+            cellSize=cell,
+        )
+
+        suffix = f"_{number:03d}" if len(pages) > 1 else ""
+        filename = os.path.join(output_directory, f"{name}{suffix}.{ext}")
+        if not cv2.imwrite(filename, mosaic):
+            raise OSError(f"Could not write {filename}")
+        outputs.append(filename)
+
+    return outputs
+
+
+def main(args=None):
+    """Compose the selected mosaics."""
+    if args is not None:
+        sys.argv = args
+
+    args = _setup_argparser()
+    grid = _parse_size(args.grid, "--grid")
+    cell = _parse_size(args.cell, "--cell") if args.cell else None
+
+    if args.files:
+        groups = {"mosaic": args.files}
+    elif args.index_db or args.archive:
+        if not (args.all_studies or args.study or args.series or args.patient_id):
+            sys.exit("Select studies with --study, --series, --patient-id or --all-studies")
+        groups = group_rows(select_rows(args), args.per_series)
+    else:
+        sys.exit("Give files to compose, --index-db or --archive")
+
+    if not groups:
+        sys.exit("Nothing selected")
+
+    os.makedirs(args.output_directory, exist_ok=True)
+
+    failed = 0
+    with ProcessPoolExecutor(args.workers) as pool:
+        futures = {
+            pool.submit(
+                compose_group,
+                name,
+                paths,
+                grid,
+                cell,
+                args.border,
+                args.output_directory,
+                args.format,
+            ): name
+            for name, paths in groups.items()
+        }
+        for future in as_completed(futures):
+            try:
+                for filename in future.result():
+                    print(filename)
+            except Exception as exc:
+                failed += 1
+                print(f"Failed to compose {futures[future]}: {exc}", file=sys.stderr)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark of the cine color conversion.
+
+Compares the per-frame ``cvtColor(COLOR_YUV2RGB)`` + ``[:, :, ::-1]`` loop
+the converter and viewer used with the batched conversion in colorspace.py,
+producing the contiguous BGR frames cv2.VideoWriter needs and the RGB frames
+QImage needs. The batched conversion uses the YBR_FULL equations rather
+than OpenCV's YUV ones, only the speed is compared.
+
+Example::
+
+    python bench_colorspace.py --frames 120 --size 600x800
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from colorspace import yuvToBgr, yuvToRgb
+
+try:
+    import cv2
+except ImportError:
+    from cv2 import cv2
+
+
+def _setup_argparser():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--frames", type=int, default=120, help="frames in the cine (default: 120)"
+    )
+    parser.add_argument(
+        "--size",
+        default="600x800",
+        help="frame size as ROWSxCOLUMNS (default: 600x800)",
+    )
+    parser.add_argument(
+        "--batch", type=int, default=8, help="frames per batch (default: 8)"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="best of n runs (default: 5)"
+    )
+
+    return parser.parse_args()
+
+
+def loop_bgr(frames):
+    for frame in frames:
+        data = cv2.cvtColor(frame, cv2.COLOR_YUV2RGB)
+        # VideoWriter copies non-contiguous frames before encoding
+        np.ascontiguousarray(data[:, :, ::-1])
+
+
+def loop_rgb(frames):
+    for frame in frames:
+        cv2.cvtColor(frame, cv2.COLOR_YUV2RGB)
+
+
+def batched(convert, size):
+    def run(frames):
+        out = None
+        for start in range(0, len(frames), size):
+            batch = frames[start:start + size]
+            out = convert(batch, None if out is None else out[:len(batch)])
+
+    return run
+
+
+def best_of(function, frames, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(frames)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def main():
+    args = _setup_argparser()
+    rows, columns = (int(value) for value in args.size.split("x"))
+    frames = np.random.randint(
+        0, 256, (args.frames, rows, columns, 3), dtype=np.uint8
+    )
+
+    cases = [
+        ("BGR per-frame loop", loop_bgr),
+        ("BGR batched", batched(yuvToBgr, args.batch)),
+        ("RGB per-frame loop", loop_rgb),
+        ("RGB batched", batched(yuvToRgb, args.batch)),
+    ]
+    print(f"{args.frames} frames of {rows}x{columns}, batch {args.batch}")
+    for name, function in cases:
+        elapsed = best_of(function, frames, args.repeat)
+        print(
+            f"{name:<20} {elapsed * 1000:8.1f} ms"
+            f" {elapsed * 1000 / args.frames:6.2f} ms/frame"
+        )
+
+
+if __name__ == "__main__":
+    main()
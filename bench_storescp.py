@@ -0,0 +1,351 @@
+"""Receive-side benchmark for the storescp application.
+
+Starts storescp.py locally, sends synthetic datasets to it from a pool of
+concurrent Storage SCUs and appends the C-STORE latency percentiles,
+throughput and server memory use to a JSON lines results file.
+
+Example::
+
+    python bench_storescp.py --datasets single,cine --concurrency 1,4 \\
+        --server-args="" --server-args="--raw-store -w 4"
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import (
+    ExplicitVRLittleEndian,
+    ImplicitVRLittleEndian,
+    ExplicitVRBigEndian,
+    generate_uid,
+)
+
+from pynetdicom import AE
+from pynetdicom.sop_class import (
+    UltrasoundImageStorage,
+    UltrasoundMultiFrameImageStorage,
+    XRayAngiographicImageStorage,
+)
+
+
+# name: (SOP Class UID, frames, rows, columns, samples per pixel)
+DATASETS = {
+    "single": (UltrasoundImageStorage, 0, 600, 800, 3),
+    "multi": (XRayAngiographicImageStorage, 30, 512, 512, 1),
+    "cine": (UltrasoundMultiFrameImageStorage, 120, 600, 800, 3),
+}
+
+TRANSFER_SYNTAXES = [
+    ExplicitVRLittleEndian,
+    ImplicitVRLittleEndian,
+    ExplicitVRBigEndian,
+]
+
+
+def _setup_argparser():
+    """Setup the command line arguments"""
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark how many instances and bytes per second storescp.py "
+            "can receive, and the C-STORE latency seen by the SCUs."
+        ),
+        usage="bench_storescp [options]",
+    )
+
+    bench_opts = parser.add_argument_group("Benchmark Options")
+    bench_opts.add_argument(
+        "--datasets",
+        metavar="[n]ames",
+        help=(
+            "comma separated datasets to send, from "
+            f"{', '.join(DATASETS)} (default: single,multi)"
+        ),
+        type=str,
+        default="single,multi",
+    )
+    bench_opts.add_argument(
+        "--concurrency",
+        metavar="[n]umbers",
+        help="comma separated numbers of concurrent SCUs (default: 1,4)",
+        type=str,
+        default="1,4",
+    )
+    bench_opts.add_argument(
+        "--count",
+        metavar="[n]umber",
+        help="number of instances sent by each SCU (default: 20)",
+        type=int,
+        default=20,
+    )
+    bench_opts.add_argument(
+        "--server-args",
+        metavar="[a]rguments",
+        help=(
+            "storescp options to benchmark, may be used multiple times to "
+            "compare configurations, e.g. --server-args='-pdu 0 -xe'"
+        ),
+        action="append",
+    )
+    bench_opts.add_argument(
+        "--port",
+        metavar="[p]ort",
+        help="TCP/IP port for the storescp server (default: 11113)",
+        type=int,
+        default=11113,
+    )
+    bench_opts.add_argument(
+        "-o",
+        "--output",
+        metavar="[f]ile",
+        help="append results to JSON lines file f (default: bench_results.jsonl)",
+        type=str,
+        default="bench_results.jsonl",
+    )
+
+    return parser.parse_args()
+
+
+def make_dataset(name):
+    """Return a synthetic dataset for the named benchmark dataset."""
+    sop_class, frames, rows, columns, samples = DATASETS[name]
+
+    ds = Dataset()
+    ds.SOPClassUID = sop_class
+    ds.SOPInstanceUID = generate_uid()
+    ds.PatientName = "Bench^Mark"
+    ds.PatientID = "BENCH"
+    ds.StudyInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    ds.Modality = "XA" if sop_class == XRayAngiographicImageStorage else "US"
+    ds.Rows = rows
+    ds.Columns = columns
+    ds.SamplesPerPixel = samples
+    ds.PhotometricInterpretation = "RGB" if samples == 3 else "MONOCHROME2"
+    if samples == 3:
+        ds.PlanarConfiguration = 0
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PixelRepresentation = 0
+
+    shape = (rows, columns, samples)
+    if frames:
+        ds.NumberOfFrames = frames
+        ds.FrameTime = 33.3
+        shape = (frames,) + shape
+
+    rng = np.random.default_rng(0)
+    ds.PixelData = rng.integers(0, 256, shape, dtype=np.uint8).tobytes()
+
+    ds.file_meta = FileMetaDataset()
+
+    return ds
+
+
+def percentile(values, pct):
+    """Return the `pct` percentile of the sorted `values` (nearest rank)."""
+    if not values:
+        return None
+
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def _get_rss(pid):
+    """Return the resident set size in bytes of `pid` and its children."""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+
+    return total
+
+
+class RSSSampler(threading.Thread):
+    """Track the peak resident set size of the server process tree."""
+
+    def __init__(self, pid, interval=0.05):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, _get_rss(self.pid))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def start_server(port, server_args, output_directory):
+    """Start storescp.py and wait until it accepts associations."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(here, "storescp.py")
+    cmd = [sys.executable, script, str(port), "-ba", "127.0.0.1", "-q"]
+    cmd += ["-od", output_directory] + shlex.split(server_args)
+    process = subprocess.Popen(cmd)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError("storescp did not start listening within 30 s")
+
+
+def stop_server(process):
+    """Terminate storescp.py and wait for it to finish writing."""
+    process.terminate()
+    process.wait()
+
+
+def run_client(port, name, count, results):
+    """Send `count` instances of dataset `name` over a single association."""
+    ds = make_dataset(name)
+    nbytes = len(ds.PixelData)
+
+    ae = AE(ae_title="BENCHSCU")
+    ae.add_requested_context(ds.SOPClassUID, TRANSFER_SYNTAXES)
+    ae.acse_timeout = ae.dimse_timeout = ae.network_timeout = 120
+    assoc = ae.associate("127.0.0.1", port)
+    if not assoc.is_established:
+        results.append((None, "Association rejected", 0))
+        return
+
+    # Encode using the transfer syntax the server preferred
+    cx = assoc.accepted_contexts[0]
+    ds.file_meta.TransferSyntaxUID = cx.transfer_syntax[0]
+    ds.is_little_endian = cx.transfer_syntax[0] != ExplicitVRBigEndian
+    ds.is_implicit_VR = cx.transfer_syntax[0] == ImplicitVRLittleEndian
+
+    for _ in range(count):
+        ds.SOPInstanceUID = generate_uid()
+        start = time.perf_counter()
+        status = assoc.send_c_store(ds)
+        elapsed = time.perf_counter() - start
+        results.append((elapsed, getattr(status, "Status", None), nbytes))
+
+    assoc.release()
+
+
+def run_scenario(port, server_args, name, concurrency, count):
+    """Benchmark one server configuration, dataset and concurrency."""
+    output_directory = tempfile.mkdtemp(prefix="bench_storescp_")
+    process = start_server(port, server_args, output_directory)
+    sampler = RSSSampler(process.pid)
+    sampler.start()
+
+    results = []
+    clients = [
+        threading.Thread(target=run_client, args=(port, name, count, results))
+        for _ in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+
+    for client in clients:
+        client.join()
+
+    duration = time.perf_counter() - start
+    sampler.stop()
+    stop_server(process)
+    shutil.rmtree(output_directory, ignore_errors=True)
+
+    latencies = sorted(r[0] for r in results if r[0] is not None)
+    succeeded = [r for r in results if r[1] == 0x0000]
+    received = sum(r[2] for r in succeeded)
+
+    return {
+        "server_args": server_args,
+        "dataset": name,
+        "concurrency": concurrency,
+        "instances": len(results),
+        "failures": len(results) - len(succeeded),
+        "duration_s": duration,
+        "instances_per_s": len(succeeded) / duration,
+        "mb_per_s": received / duration / 1e6,
+        "latency_p50_ms": _to_ms(percentile(latencies, 50)),
+        "latency_p95_ms": _to_ms(percentile(latencies, 95)),
+        "latency_p99_ms": _to_ms(percentile(latencies, 99)),
+        "server_peak_rss_mb": sampler.peak / 1e6,
+    }
+
+
+def _to_ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def main(args=None):
+    """Run the benchmark."""
+    if args is not None:
+        sys.argv = args
+
+    args = _setup_argparser()
+    names = args.datasets.split(",")
+    for name in names:
+        if name not in DATASETS:
+            sys.exit(f"Unknown dataset '{name}'")
+
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "count": args.count,
+        "results": [],
+    }
+    for server_args in args.server_args or [""]:
+        for name in names:
+            for concurrency in map(int, args.concurrency.split(",")):
+                result = run_scenario(
+                    args.port, server_args, name, concurrency, args.count
+                )
+                record["results"].append(result)
+                print(
+                    f"[{server_args or 'default'}] {name} x{concurrency}: "
+                    f"{result['instances_per_s']:.1f} inst/s, "
+                    f"{result['mb_per_s']:.1f} MB/s, "
+                    f"p50 {result['latency_p50_ms']} ms, "
+                    f"p99 {result['latency_p99_ms']} ms, "
+                    f"peak RSS {result['server_peak_rss_mb']:.0f} MB, "
+                    f"{result['failures']} failures"
+                )
+
+    with open(args.output, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
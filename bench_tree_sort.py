@@ -0,0 +1,121 @@
+"""Benchmark of sorting the archive tree.
+
+Compares the proxy model the viewer used, with ".." and directories put
+first by a Python ``lessThan`` override, with archive_model.SortingModel,
+which sorts on precomputed key roles without calling back into Python.
+Each case sorts a flat directory of N entries, a tenth of them directories.
+
+Example::
+
+    python bench_tree_sort.py --entries 1000 10000 100000
+
+Sorting both ways, on one core with PySide6 6.8 (offscreen)::
+
+    entries   Python lessThan   sort key roles
+    1000              35.7 ms           2.3 ms
+    10000            565.5 ms          57.5 ms
+    100000          7737.6 ms        1400.3 ms
+"""
+
+import argparse
+import random
+import time
+
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+from archive_model import (
+    AscendingKeyRole,
+    DescendingKeyRole,
+    IsDirRole,
+    SortingModel,
+    sortKeys,
+)
+
+
+def _setup_argparser():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--entries",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="entries in the directory (default: 1000 10000 100000)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="best of n runs (default: 3)"
+    )
+
+    return parser.parse_args()
+
+
+class LessThanModel(QSortFilterProxyModel):
+    """The previous proxy, comparing in Python."""
+
+    def lessThan(self, source_left, source_right):
+        name1 = source_left.data()
+        name2 = source_right.data()
+        isDir1 = source_left.data(IsDirRole)
+        isDir2 = source_right.data(IsDirRole)
+
+        if name1 == "..":
+            return self.sortOrder() == Qt.SortOrder.AscendingOrder
+
+        if name2 == "..":
+            return self.sortOrder() == Qt.SortOrder.DescendingOrder
+
+        if isDir1 == isDir2:
+            return super().lessThan(source_left, source_right)
+
+        return isDir1 and self.sortOrder() == Qt.SortOrder.AscendingOrder
+
+
+def make_model(entries):
+    model = QStandardItemModel()
+    items = []
+    for ii in range(entries):
+        is_dir = ii % 10 == 0
+        name = ("%08d" % random.randrange(10 ** 8)) + ("" if is_dir else ".dcm")
+        item = QStandardItem(name)
+        item.setData(is_dir, IsDirRole)
+        ascending, descending = sortKeys(name, is_dir)
+        item.setData(ascending, AscendingKeyRole)
+        item.setData(descending, DescendingKeyRole)
+        items.append(item)
+
+    model.invisibleRootItem().appendRows(items)
+    return model
+
+
+def best_of(proxy_class, model, repeat):
+    timings = []
+    for _ in range(repeat):
+        proxy = proxy_class()
+        proxy.setSourceModel(model)
+
+        start = time.perf_counter()
+        proxy.sort(0, Qt.AscendingOrder)
+        proxy.sort(0, Qt.DescendingOrder)
+        timings.append((time.perf_counter() - start) / 2)
+
+    return min(timings)
+
+
+def main():
+    args = _setup_argparser()
+    app = QCoreApplication([])
+
+    cases = [
+        ("Python lessThan", LessThanModel),
+        ("Sort key roles", SortingModel),
+    ]
+    for entries in args.entries:
+        model = make_model(entries)
+        print(f"{entries} entries")
+        for name, proxy_class in cases:
+            elapsed = best_of(proxy_class, model, args.repeat)
+            print(f"  {name:<16} {elapsed * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
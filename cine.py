@@ -0,0 +1,294 @@
+import struct
+
+import numpy as np
+
+# Dicom includes
+import pydicom
+from pydicom.encaps import encapsulate
+from pydicom.uid import JPEGTransferSyntaxes
+
+# Used when a cine has neither a Cine Rate nor a Frame Time
+DEFAULT_FRAME_RATE = 10
+
+_ITEM = 0xFFFEE000
+_SEQUENCE_DELIMITER = 0xFFFEE0DD
+
+
+def frameRate(dataset):
+    """Playback rate of a multi-frame dataset in frames per second."""
+    if dataset.get('CineRate'):
+        return float(dataset.CineRate)
+
+    # Frame Time is the time between frames in ms
+    if dataset.get('FrameTime'):
+        return 1000.0 / float(dataset.FrameTime)
+
+    return DEFAULT_FRAME_RATE
+
+
+def decodedColorSpace(dataset):
+    """Photometric Interpretation of the dataset's decoded pixel data.
+
+    pydicom's handlers return YBR data as stored, e.g. Pillow decodes JPEG
+    Baseline YBR_FULL_422 as YCbCr, unless the handler it decodes with asks
+    for it to be converted to RGB.
+    """
+    photometric = dataset.get('PhotometricInterpretation', '')
+    transferSyntax = dataset.file_meta.TransferSyntaxUID
+    for handler in pydicom.config.pixel_data_handlers:
+        if handler.is_available() and handler.supports_transfer_syntax(transferSyntax):
+            return 'RGB' if handler.needs_to_convert_to_RGB(dataset) else photometric
+
+    return photometric
+
+
+class CineReader:
+    """Reads the frames of a DICOM file one at a time.
+
+    Only the header is parsed up front. Pixel data is read and decoded a
+    frame at a time, so memory use doesn't depend on the number of frames.
+    Encapsulated frames are found with the Basic Offset Table, or with a
+    single pass over the fragments when there isn't one, so seeking to a
+    frame doesn't read the frames before it.
+
+    Frames are returned as decoded, i.e. still in the YBR color space for
+    ultrasound cines, see isYbr().
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self.dataset = pydicom.dcmread(f, stop_before_pixels=True)
+            # Positioned at the Pixel Data element, if there is one
+            self._pixelDataOffset = f.tell()
+
+        ds = self.dataset
+        self.numberOfFrames = int(ds.get('NumberOfFrames') or 1)
+        self.rows = ds.Rows
+        self.columns = ds.Columns
+        self.samplesPerPixel = ds.get('SamplesPerPixel', 1)
+        self.frameRate = frameRate(ds)
+        self.transferSyntax = ds.file_meta.TransferSyntaxUID
+        self.photometricInterpretation = ds.get('PhotometricInterpretation', '')
+        self.colorSpace = decodedColorSpace(ds)
+        self._frameStarts = None
+
+    def isCine(self):
+        return self.numberOfFrames > 1 and self.samplesPerPixel == 3
+
+    def isYbr(self):
+        """Whether frames are YBR_FULL, to convert with colorspace.yuvToRgb()."""
+        # YBR_FULL_422 frames are upsampled when read
+        return self.colorSpace in ('YBR_FULL', 'YBR_FULL_422')
+
+    def frames(self, first=0):
+        """Yield every frame in order, starting from frame `first`."""
+        if self.transferSyntax.is_compressed:
+            yield from self._encapsulatedFrames(first)
+        else:
+            yield from self._nativeFrames(first)
+
+    def batches(self, size):
+        """Yield the frames in (N, H, W, C) batches of up to `size` frames.
+
+        The same buffer is reused for every batch, so use a batch before
+        asking for the next one.
+        """
+        batch = None
+        count = 0
+        for frame in self.frames():
+            if batch is None:
+                batch = np.empty((size,) + frame.shape, frame.dtype)
+
+            batch[count] = frame
+            count += 1
+            if count == size:
+                yield batch
+                count = 0
+
+        if count:
+            yield batch[:count]
+
+    def frame(self, index):
+        """Return a single frame, for seeking."""
+        if not self.transferSyntax.is_compressed:
+            return next(self._nativeFrames(index, index + 1))
+
+        for frame in self._encapsulatedFrames(index, index + 1):
+            return frame
+
+        raise IndexError('frame %d out of range' % index)
+
+    def _pixelDataValue(self, f):
+        """Seek `f` to the Pixel Data value and return its length."""
+        ds = self.dataset
+        endian = '<' if ds.is_little_endian else '>'
+        f.seek(self._pixelDataOffset)
+
+        group, element = struct.unpack(endian + 'HH', f.read(4))
+        if (group << 16 | element) != 0x7FE00010:
+            raise ValueError('No Pixel Data in ' + self.path)
+
+        if ds.is_implicit_VR:
+            return struct.unpack(endian + 'L', f.read(4))[0]
+
+        # OB and OW have two reserved bytes and a 4 byte length
+        f.read(4)
+        return struct.unpack(endian + 'L', f.read(4))[0]
+
+    def _nativeFrames(self, first=0, last=None):
+        ds = self.dataset
+        if ds.BitsAllocated not in (8, 16, 32):
+            raise NotImplementedError('%d bits allocated' % ds.BitsAllocated)
+
+        dtype = np.dtype('%s%d' % ('i' if ds.PixelRepresentation else 'u', ds.BitsAllocated // 8))
+        dtype = dtype.newbyteorder('<' if ds.is_little_endian else '>')
+
+        # Pairs of pixels are stored as Y Y Cb Cr, so a frame is 2/3 the size
+        ybr422 = self.samplesPerPixel == 3 and self.photometricInterpretation == 'YBR_FULL_422'
+
+        planar = self.samplesPerPixel > 1 and ds.get('PlanarConfiguration', 0) == 1
+        if ybr422:
+            planar = False
+            shape = (self.rows, self.columns // 2, 4)
+        elif self.samplesPerPixel == 1:
+            shape = (self.rows, self.columns)
+        elif planar:
+            shape = (self.samplesPerPixel, self.rows, self.columns)
+        else:
+            shape = (self.rows, self.columns, self.samplesPerPixel)
+
+        count = shape[0] * shape[1] * shape[2] if len(shape) == 3 else shape[0] * shape[1]
+        last = self.numberOfFrames if last is None else min(last, self.numberOfFrames)
+        if not 0 <= first < last:
+            raise IndexError('frame %d out of range' % first)
+
+        # Read a frame at a time rather than mapping the file, so the whole
+        # cine never becomes resident
+        with open(self.path, 'rb') as f:
+            self._pixelDataValue(f)
+            f.seek(first * count * dtype.itemsize, 1)
+            for _ in range(first, last):
+                frame = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+                if ybr422:
+                    yield _expandYbr422(frame)
+                else:
+                    yield frame.transpose(1, 2, 0).copy() if planar else frame
+
+    def _encapsulatedFrames(self, first=0, last=None):
+        # A dataset holding one frame at a time, decoded by pydicom
+        single = pydicom.Dataset(self.dataset)
+        single.file_meta = self.dataset.file_meta
+        single.NumberOfFrames = 1
+
+        for data in self._encapsulatedFrameData(first, last):
+            single.PixelData = encapsulate([data])
+            yield single.pixel_array
+
+    def _encapsulatedFrameData(self, first=0, last=None):
+        """Yield the encoded data of frames `first` to `last`."""
+        with open(self.path, 'rb') as f:
+            starts = self._encapsulatedFrameStarts(f)
+            last = len(starts) if last is None else min(last, len(starts))
+
+            for ii in range(first, last):
+                end = starts[ii + 1] if ii + 1 < len(starts) else None
+                f.seek(starts[ii])
+                yield b''.join(fragment for _, fragment in self._fragments(f, end))
+
+    def _encapsulatedFrameStarts(self, f):
+        """Return the file position of each frame's first fragment.
+
+        Taken from the Basic Offset Table if there is one, otherwise found
+        by reading the item headers once. Either way they are cached.
+        """
+        if self._frameStarts is not None:
+            return self._frameStarts
+
+        self._pixelDataValue(f)
+        # The first item is the Basic Offset Table
+        group, element, length = struct.unpack('<HHL', f.read(8))
+        if (group << 16 | element) != _ITEM:
+            raise ValueError('No Basic Offset Table in ' + self.path)
+
+        offsetTable = f.read(length)
+        # Offsets are relative to the first fragment
+        first = f.tell()
+        if offsetTable:
+            offsets = struct.unpack('<%dL' % (len(offsetTable) // 4), offsetTable)
+            self._frameStarts = [first + offset for offset in offsets]
+            return self._frameStarts
+
+        # Without an offset table frames end at a JPEG EOI marker, or have
+        # one fragment each. Only the end of each fragment is read.
+        isJpeg = self.transferSyntax in JPEGTransferSyntaxes
+        starts = []
+        start = None
+        while True:
+            position = f.tell()
+            header = f.read(8)
+            if len(header) < 8:
+                break
+
+            group, element, length = struct.unpack('<HHL', header)
+            tag = group << 16 | element
+            if tag == _SEQUENCE_DELIMITER:
+                break
+            if tag != _ITEM:
+                raise ValueError('Unexpected tag in encapsulated Pixel Data of ' + self.path)
+
+            if start is None:
+                start = position
+
+            end = position + 8 + length
+            if isJpeg:
+                # The EOI marker may be followed by a padding byte
+                f.seek(max(position + 8, end - 3))
+                ended = f.read(end - f.tell()).rstrip(b'\x00').endswith(b'\xff\xd9')
+            else:
+                ended = True
+
+            if ended:
+                starts.append(start)
+                start = None
+            f.seek(end)
+
+        if start is not None:
+            starts.append(start)
+
+        self._frameStarts = starts
+        return starts
+
+    def _fragments(self, f, end=None):
+        """Yield the position and value of each encapsulated item before `end`."""
+        while True:
+            position = f.tell()
+            if end is not None and position >= end:
+                return
+
+            header = f.read(8)
+            if len(header) < 8:
+                return
+
+            group, element, length = struct.unpack('<HHL', header)
+            tag = group << 16 | element
+            if tag == _SEQUENCE_DELIMITER:
+                return
+
+            if tag != _ITEM:
+                raise ValueError('Unexpected tag in encapsulated Pixel Data of ' + self.path)
+
+            yield position, f.read(length)
+
+
+def _expandYbr422(frame):
+    """Expand (rows, columns / 2, [Y Y Cb Cr]) pixel pairs to YBR_FULL pixels."""
+    rows, pairs, _ = frame.shape
+    pixels = np.empty((rows, pairs, 2, 3), frame.dtype)
+    pixels[:, :, 0, 0] = frame[:, :, 0]
+    pixels[:, :, 1, 0] = frame[:, :, 1]
+    pixels[:, :, :, 1] = frame[:, :, 2, None]
+    pixels[:, :, :, 2] = frame[:, :, 3, None]
+
+    return pixels.reshape(rows, pairs * 2, 3)
@@ -0,0 +1,52 @@
+from sys import platform
+
+import numpy as np
+
+if platform == "linux":
+    import cv2
+elif platform == "win32":
+    from cv2 import cv2
+else:
+    raise Exception("Unsupported platform")
+
+
+# Frames converted per call when streaming a cine, larger batches don't
+# convert faster and only cost memory
+BATCH_SIZE = 8
+
+# YBR_FULL (Y, Cb, Cr) to RGB, the JPEG equations pydicom's
+# convert_color_space() uses for still images, as an affine transform
+_YBR_TO_RGB = np.array([[1, 0, 1.402, -1.402 * 128],
+                        [1, -0.114 * 1.772 / 0.587, -0.299 * 1.402 / 0.587,
+                         (0.114 * 1.772 + 0.299 * 1.402) / 0.587 * 128],
+                        [1, 1.772, 0, -1.772 * 128]], np.float32)
+_YBR_TO_BGR = np.ascontiguousarray(_YBR_TO_RGB[::-1])
+
+
+def yuvToRgb(frames, out=None):
+    """Convert YBR_FULL frames to RGB, e.g. for a QImage.
+
+    `frames` is a single (H, W, 3) frame or a (N, H, W, 3) batch. The whole
+    batch is converted in one pass into a contiguous buffer, `out` if given.
+    """
+    return _convert(frames, _YBR_TO_RGB, out)
+
+
+def yuvToBgr(frames, out=None):
+    """Convert YBR_FULL frames to BGR, e.g. for cv2.VideoWriter.
+
+    Same as yuvToRgb() followed by [..., ::-1] but without the extra copy.
+    """
+    return _convert(frames, _YBR_TO_BGR, out)
+
+
+def _convert(frames, matrix, out):
+    frames = np.ascontiguousarray(frames)
+    if out is None:
+        out = np.empty_like(frames)
+
+    # A batch is converted as one tall image, the conversion is per pixel
+    shape = (-1, frames.shape[-2], frames.shape[-1])
+    cv2.transform(frames.reshape(shape), matrix, dst=out.reshape(shape))
+
+    return out
@@ -0,0 +1,299 @@
+from sys import platform
+
+import json
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Processing includes
+import numpy as np
+
+if platform == "linux":
+    import cv2
+elif platform == "win32":
+    from cv2 import cv2
+else:
+    raise Exception("Unsupported platform")
+
+# Dicom includes
+import pydicom
+from pydicom.misc import is_dicom
+from pydicom.pixel_data_handlers.util import convert_color_space
+
+from cine import CineReader, decodedColorSpace
+from colorspace import BATCH_SIZE, yuvToBgr
+from formats import Format
+
+
+def outputName(path):
+    # Archive files are named '<modality prefix>.<sop instance uid>'
+    return os.path.basename(path).split('.', 1)[-1]
+
+
+# A post-store export, see exporter.py
+ExportRule = namedtuple('ExportRule', ['format', 'directory', 'quality'])
+
+
+def convertFile(path, format, imagesPath, videosPath, quality=100):
+    """Convert a single DICOM file, runs in a worker process.
+
+    Cines are streamed to a video a frame at a time. Returns the written
+    file path.
+    """
+    reader = CineReader(path)
+    filename = outputName(path)
+
+    if reader.isCine():
+        return writeVideo(reader, filename, videosPath)
+
+    pixels = bgrPixels(pydicom.dcmread(path))
+    return writeImage(pixels, filename, format, imagesPath, quality)
+
+
+def exportFile(path, rules, videosPath):
+    """Export a single DICOM file with each of the export rules.
+
+    Pixel data is decoded once for all the rules. Cines are streamed to a
+    single video, or skipped if `videosPath` is None. Returns the written
+    file paths.
+    """
+    reader = CineReader(path)
+    filename = outputName(path)
+
+    if reader.isCine():
+        if videosPath is None:
+            return []
+
+        os.makedirs(videosPath, exist_ok=True)
+        return [writeVideo(reader, filename, videosPath)]
+
+    pixels = bgrPixels(pydicom.dcmread(path))
+    outputs = []
+    for rule in rules:
+        os.makedirs(rule.directory, exist_ok=True)
+        outputs.append(writeImage(pixels, filename, rule.format, rule.directory, rule.quality))
+
+    return outputs
+
+
+def videoPath(filename, videosPath):
+    return videosPath + '/' + filename + '.mp4'
+
+
+def imagePath(filename, format, imagesPath):
+    return imagesPath + '/' + filename + '.' + format.name.lower()
+
+
+def writeVideo(reader, filename, videosPath):
+    """Write the frames of a CineReader to a video as they are decoded."""
+    filepath = videoPath(filename, videosPath)
+
+    # Have to dump a video
+    outVideo = cv2.VideoWriter(filepath, cv2.VideoWriter_fourcc(*'MP4V'), reader.frameRate,
+                               (reader.columns, reader.rows))
+
+    converted = None
+    for batch in reader.batches(BATCH_SIZE):
+        # Opencv wants BGR, Vida frames are in YBR color space
+        if not reader.isYbr():
+            converted = np.ascontiguousarray(batch[..., ::-1])
+        elif converted is None:
+            converted = yuvToBgr(batch)
+        else:
+            converted = yuvToBgr(batch, converted[:len(batch)])
+
+        for data in converted:
+            outVideo.write(data)
+
+    # Close the video file
+    outVideo.release()
+
+    return filepath
+
+
+def bgrPixels(dataset):
+    """The (first) frame of a dataset's pixel data, ready for opencv.
+
+    Grayscale frames are left single channel, color ones are converted to
+    BGR.
+    """
+    pixels = dataset.pixel_array
+    if int(dataset.get('NumberOfFrames') or 1) > 1:
+        pixels = pixels[0]
+
+    if pixels.ndim == 2:
+        return pixels
+
+    # YBR_ICT and YBR_RCT are undone by the JPEG 2000 decoders
+    colorSpace = decodedColorSpace(dataset)
+    if colorSpace in ('YBR_FULL', 'YBR_FULL_422'):
+        pixels = convert_color_space(pixels, colorSpace, 'RGB')
+
+    # Have to swtich color channels for opencv
+    return np.ascontiguousarray(pixels[:, :, ::-1])
+
+
+def writeImage(pixels, filename, format, imagesPath, quality=100):
+    """Write a grayscale or BGR frame, see bgrPixels()."""
+    filepath = imagePath(filename, format, imagesPath)
+
+    # Quality only applies to JPG
+    if format == Format.JPG:
+        cv2.imwrite(filepath, pixels, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    else:
+        cv2.imwrite(filepath, pixels)
+
+    return filepath
+
+
+def readFrame(path):
+    """Read the (first) frame of a DICOM or image file as 8 bit BGR."""
+    if not is_dicom(path):
+        frame = cv2.imread(path)
+        if frame is None:
+            raise ValueError("Could not read image " + path)
+        return frame
+
+    reader = CineReader(path)
+    if reader.isCine():
+        frame = reader.frame(0)
+        return yuvToBgr(frame) if reader.isYbr() else np.ascontiguousarray(frame[:, :, ::-1])
+
+    pixels = bgrPixels(pydicom.dcmread(path))
+    if pixels.dtype != np.uint8:
+        pixels = cv2.normalize(pixels, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+
+    if pixels.ndim == 2:
+        return cv2.cvtColor(pixels, cv2.COLOR_GRAY2BGR)
+
+    return pixels
+
+
+class ConversionManifest:
+    """Record of converted files, so unchanged files are skipped.
+
+    Entries are keyed by the written file, so the images of each format and
+    the videos are recorded separately, whether written by Convert All or
+    by storescp's exports. They hold the source file's mtime and size.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = self._load()
+        self._recorded = {}  # Entries recorded since the last save
+
+    def isCurrent(self, path, outputs):
+        """Whether `path` was written to any of `outputs` since it last changed."""
+        stat = os.stat(path)
+        for output in outputs:
+            entry = self.entries.get(os.path.abspath(output))
+            if (entry is not None and entry['mtime'] == stat.st_mtime_ns
+                    and entry['size'] == stat.st_size and os.path.exists(output)):
+                return True
+
+        return False
+
+    def record(self, path, output):
+        stat = os.stat(path)
+        entry = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+        self.entries[os.path.abspath(output)] = entry
+        self._recorded[os.path.abspath(output)] = entry
+
+    def save(self):
+        """Write the manifest, keeping the entries other processes saved."""
+        entries = self._load()
+        entries.update(self._recorded)
+
+        partial = '%s.%d.part' % (self.path, os.getpid())
+        with open(partial, 'w') as f:
+            json.dump(entries, f)
+
+        os.replace(partial, self.path)
+        self.entries = entries
+        self._recorded = {}
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print("ERROR! COULD NOT READ MANIFEST: " + self.path)
+            print(e)
+            return {}
+
+        # Manifests keyed by format are read as empty
+        return {output: entry for output, entry in entries.items() if 'mtime' in entry}
+
+
+class BatchConverter:
+    """Converts DICOM files on a pool of worker processes.
+
+    Parameters
+    ----------
+    workers : int
+        Number of worker processes, 0 to use one per CPU.
+    """
+
+    def __init__(self, workers=0):
+        self.workers = workers or os.cpu_count()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self, paths, format, imagesPath, videosPath, progress=None, manifest=None):
+        """Convert `paths`, calling progress(done, total) after each file.
+
+        If a manifest is used then files already converted to `format`, or
+        to a video, since they last changed are skipped, and it is updated
+        and saved.
+
+        Returns the number of files converted before finishing or being
+        cancelled.
+        """
+        self._cancelled.clear()
+        paths = list(paths)
+        if manifest is not None:
+            paths = [path for path in paths if not manifest.isCurrent(
+                path, [imagePath(outputName(path), format, imagesPath),
+                       videoPath(outputName(path), videosPath)])]
+
+        print("Converting %d files" % len(paths))
+        done = 0
+
+        try:
+            # Forking the GUI process would copy the locks held by its threads
+            with ProcessPoolExecutor(self.workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = {
+                    pool.submit(convertFile, path, format, imagesPath, videosPath): path
+                    for path in paths
+                }
+
+                for future in as_completed(futures):
+                    if self._cancelled.is_set():
+                        pool.shutdown(wait=True, cancel_futures=True)
+                        break
+
+                    try:
+                        output = future.result()
+                        print(output)
+                        if manifest is not None:
+                            manifest.record(futures[future], output)
+                    except Exception as e:
+                        print("ERROR! COULD NOT SAVE THIS FILE: " + futures[future])
+                        print(e)
+
+                    done += 1
+                    if progress is not None:
+                        progress(done, len(paths))
+        finally:
+            if manifest is not None:
+                manifest.save()
+
+        return done
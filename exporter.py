@@ -0,0 +1,123 @@
+"""Convert-on-receive exports for the storescp application.
+
+Once a dataset has been stored it is handed to a pool of worker processes
+that write the images described by the export rules, so exported images
+are available shortly after arrival without delaying the C-STORE response.
+"""
+
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from converter import ConversionManifest, ExportRule, Format, exportFile
+
+# The manifest is saved at most this often while exporting, and on shutdown
+MANIFEST_SAVE_SECONDS = 5
+
+
+def parse_rule(value):
+    """Return an :class:`~converter.ExportRule` from a command line value.
+
+    Parameters
+    ----------
+    value : str
+        The rule as ``FORMAT:DIRECTORY[:QUALITY]``, e.g. ``PNG:archive/PNG``
+        or ``JPG:archive/JPG:90``.
+    """
+    try:
+        name, directory = value.split(":", 1)
+        fmt = Format[name.upper()]
+    except (ValueError, KeyError):
+        raise ValueError(
+            f"Invalid export rule '{value}', expected FORMAT:DIRECTORY[:QUALITY]"
+            f" with FORMAT one of {', '.join(f.name for f in Format)}"
+        )
+
+    quality = 100
+    head, _, tail = directory.rpartition(":")
+    if head and tail.isdigit():
+        directory, quality = head, int(tail)
+
+    return ExportRule(fmt, directory, quality)
+
+
+class Exporter:
+    """Runs the export rules for stored datasets on a process pool.
+
+    Parameters
+    ----------
+    rules : list of converter.ExportRule
+        The exports to perform for each stored dataset.
+    videos_directory : str or None
+        Where multi-frame datasets are written as videos, if ``None`` they
+        aren't exported.
+    workers : int
+        The number of worker processes.
+    app_logger : logging.Logger
+        The application's logger.
+    manifest_path : str, optional
+        If used then the exported files are recorded in the
+        :class:`~converter.ConversionManifest` at this path, so the viewer's
+        Convert All skips them.
+    """
+
+    def __init__(
+        self, rules, videos_directory, workers, app_logger, manifest_path=None
+    ):
+        self.rules = rules
+        self.videos_directory = videos_directory
+        self.app_logger = app_logger
+        self.manifest = None
+        if manifest_path:
+            self.manifest = ConversionManifest(manifest_path)
+        self._saved_at = time.monotonic()
+        # Don't fork the threaded server process
+        self._pool = ProcessPoolExecutor(
+            workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_ignore_interrupt,
+        )
+
+    def submit(self, path):
+        """Export the dataset stored at `path` in the background."""
+        future = self._pool.submit(
+            exportFile, path, self.rules, self.videos_directory
+        )
+        future.add_done_callback(lambda f: self._done(path, f))
+
+    def shutdown(self):
+        """Finish the pending exports and stop the worker processes."""
+        self._pool.shutdown(wait=True)
+        if self.manifest is not None:
+            self._save_manifest()
+
+    def _done(self, path, future):
+        try:
+            for output in future.result():
+                self.app_logger.info(f"Exported {output}")
+                if self.manifest is not None:
+                    self.manifest.record(path, output)
+        except Exception as exc:
+            self.app_logger.error(f"Unable to export {path}")
+            self.app_logger.exception(exc)
+
+        if (
+            self.manifest is not None
+            and time.monotonic() - self._saved_at >= MANIFEST_SAVE_SECONDS
+        ):
+            self._save_manifest()
+
+    def _save_manifest(self):
+        try:
+            self.manifest.save()
+        except OSError as exc:
+            self.app_logger.error("Unable to save the conversion manifest")
+            self.app_logger.exception(exc)
+
+        self._saved_at = time.monotonic()
+
+
+def _ignore_interrupt():
+    """Leave Ctrl+C to the server, which finishes the pending exports."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
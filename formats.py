@@ -0,0 +1,9 @@
+from enum import Enum
+
+
+# Kept apart from converter.py so the GUI can list formats without opencv
+class Format(Enum):
+    BMP = 0
+    TIF = 1
+    PNG = 2
+    JPG = 3
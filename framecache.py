@@ -0,0 +1,61 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def fileKey(path):
+    """Cache key of a file's current contents."""
+    return (path, os.stat(path).st_mtime_ns)
+
+
+class FrameCache:
+    """Memory bounded LRU cache of numpy frames.
+
+    Used for decoded frames, keyed by fileKey(), and for their scaled
+    renditions, keyed by fileKey() + (width, height). The least recently
+    used frames are evicted once the frames take more than `maxBytes`.
+    Safe to use from the preview loader threads.
+    """
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._frames.move_to_end(key)
+            return frame
+
+    def put(self, key, frame):
+        # Frames larger than the whole budget aren't worth keeping
+        if frame.nbytes > self.maxBytes:
+            return
+
+        # Shared between callers, so must not be modified
+        frame.setflags(write=False)
+
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+
+            self._frames[key] = frame
+            self.bytes += frame.nbytes
+            while self.bytes > self.maxBytes:
+                _, evicted = self._frames.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.bytes = 0
@@ -0,0 +1,144 @@
+import os
+from collections import OrderedDict
+
+# GUI imports
+from PySide6.QtWidgets import *
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+from thumbnails import defaultCache
+
+THUMBNAIL_SIZE = 300
+
+# Thumbnails kept in memory, the least recently shown are dropped
+CACHED_PIXMAPS = 256
+
+
+class ThumbnailSignals(QObject):
+    loaded = Signal(str, str)  # image path, thumbnail path
+
+
+class ThumbnailLoader(QRunnable):
+    """Gets a thumbnail from the thumbnail cache on a QThreadPool thread."""
+
+    def __init__(self, path, size):
+        super().__init__()
+        self.path = path
+        self.size = size
+        self.signals = ThumbnailSignals()
+
+    def run(self):
+        try:
+            thumbPath = defaultCache().thumbnail(self.path, self.size, self.size)
+        except Exception as e:
+            print("ERROR! COULD NOT CREATE THUMBNAIL: " + self.path)
+            print(e)
+            return
+
+        self.signals.loaded.emit(self.path, thumbPath)
+
+
+class ThumbnailModel(QAbstractListModel):
+    """List of images whose thumbnails are loaded when first shown.
+
+    The view only asks for the decoration of visible rows, which are given
+    a placeholder until their thumbnail has been loaded in the background.
+    At most CACHED_PIXMAPS thumbnails are kept, so memory use doesn't grow
+    with the number of images.
+    """
+
+    def __init__(self, paths, size=THUMBNAIL_SIZE):
+        super().__init__()
+        self.paths = paths
+        self.rows = {path: row for row, path in enumerate(paths)}
+        self.size = size
+        self.pixmaps = OrderedDict()
+        self.pending = set()
+
+        self.placeholder = QPixmap(size, size)
+        self.placeholder.fill(Qt.darkGray)
+
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(2)
+
+        # Saves the cache's index once loading has settled down
+        self.saveTimer = QTimer(self)
+        self.saveTimer.setSingleShot(True)
+        self.saveTimer.setInterval(2000)
+        self.saveTimer.timeout.connect(defaultCache().save)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        path = self.paths[index.row()]
+        if role == Qt.DecorationRole:
+            pixmap = self.pixmaps.get(path)
+            if pixmap is None:
+                self.requestThumbnail(path)
+                return self.placeholder
+
+            self.pixmaps.move_to_end(path)
+            return pixmap
+
+        if role == Qt.ToolTipRole:
+            return os.path.basename(path)
+
+        if role == Qt.UserRole:
+            return path
+
+        return None
+
+    def requestThumbnail(self, path):
+        if path in self.pending:
+            return
+
+        self.pending.add(path)
+        loader = ThumbnailLoader(path, self.size)
+        loader.signals.loaded.connect(self.onThumbnailLoaded)
+        self.pool.start(loader)
+
+    def onThumbnailLoaded(self, path, thumbPath):
+        self.pending.discard(path)
+        self.pixmaps[path] = QPixmap(thumbPath)
+        while len(self.pixmaps) > CACHED_PIXMAPS:
+            self.pixmaps.popitem(last=False)
+
+        index = self.index(self.rows[path])
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+        self.saveTimer.start()
+
+
+class Gallery(QListView):
+    """Thumbnails of the images in archive/PNG, click one to use it.
+
+    `parent` is the layout view, its quadImageGroupBox is given the image.
+    """
+
+    def __init__(self, parent):
+
+        super().__init__()
+
+        self.parent = parent
+
+        images_path = 'archive/PNG'
+        paths = sorted(entry.path for entry in os.scandir('./' + images_path)
+                       if entry.is_file() and not entry.name.startswith('.'))
+        self.thumbnailModel = ThumbnailModel(paths)
+
+        self.setModel(self.thumbnailModel)
+        self.setViewMode(QListView.IconMode)
+        self.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.setUniformItemSizes(True)
+        self.setMovement(QListView.Static)
+        self.setResizeMode(QListView.Adjust)
+        self.setSpacing(5)
+        self.setMaximumWidth(350)
+        self.clicked.connect(self.onClick)
+
+    def onClick(self, index):
+        self.parent.stackedLayout.setCurrentIndex(0)  # change page to grid view
+        self.parent.quadImageGroupBox.setImage(index.data(Qt.UserRole))
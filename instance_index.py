@@ -0,0 +1,353 @@
+"""SQLite index of the received SOP Instances.
+
+storescp adds a row for every instance it stores so the viewer and the
+exporters can query the archive instead of globbing and re-reading files.
+Rows are batched per association and committed when it ends, or once its
+last queued file has been written if that is later.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS instances (
+    sop_instance_uid TEXT PRIMARY KEY,
+    sop_class_uid TEXT,
+    patient_id TEXT,
+    patient_name TEXT,
+    study_instance_uid TEXT,
+    study_date TEXT,
+    series_instance_uid TEXT,
+    modality TEXT,
+    rows INTEGER,
+    columns INTEGER,
+    number_of_frames INTEGER,
+    transfer_syntax_uid TEXT,
+    path TEXT,
+    size INTEGER,
+    received_at TEXT
+);
+CREATE INDEX IF NOT EXISTS instances_patient ON instances (patient_id);
+CREATE INDEX IF NOT EXISTS instances_study ON instances (study_instance_uid);
+CREATE INDEX IF NOT EXISTS instances_series ON instances (series_instance_uid);
+CREATE INDEX IF NOT EXISTS instances_patient_id_nocase
+    ON instances (patient_id COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS instances_patient_name
+    ON instances (patient_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS instances_study_date ON instances (study_date);
+CREATE INDEX IF NOT EXISTS instances_modality ON instances (modality);
+"""
+
+COLUMNS = (
+    "sop_instance_uid",
+    "sop_class_uid",
+    "patient_id",
+    "patient_name",
+    "study_instance_uid",
+    "study_date",
+    "series_instance_uid",
+    "modality",
+    "rows",
+    "columns",
+    "number_of_frames",
+    "transfer_syntax_uid",
+    "path",
+    "size",
+    "received_at",
+)
+
+# The elements needed for a row, so the rest of the dataset isn't parsed
+TAGS = [
+    "SOPInstanceUID",
+    "SOPClassUID",
+    "PatientID",
+    "PatientName",
+    "StudyInstanceUID",
+    "StudyDate",
+    "SeriesInstanceUID",
+    "Modality",
+    "Rows",
+    "Columns",
+    "NumberOfFrames",
+]
+
+
+class InstanceIndex:
+    """A connection to the instance index database.
+
+    Parameters
+    ----------
+    path : str
+        The path to the SQLite database, created if it doesn't exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = {}
+        # Rows still waiting for their file to be written, per association
+        self._writing = {}
+        self._ended = set()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def add(self, rows):
+        """Insert or replace `rows`, a list of dicts keyed by column name."""
+        placeholders = ", ".join(f":{name}" for name in COLUMNS)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO instances VALUES ({placeholders})", rows
+            )
+
+    def stage(self, assoc, row, reserved=False):
+        """Queue `row` to be added when the association `assoc` ends.
+
+        Use ``reserved=True`` for a row previously announced with
+        :meth:`reserve`.
+        """
+        with self._lock:
+            self._pending.setdefault(assoc, []).append(row)
+            if reserved:
+                self._writing[assoc] -= 1
+            rows = self._take_finished(assoc)
+
+        if rows:
+            self.add(rows)
+
+    def reserve(self, assoc):
+        """Announce a row for `assoc` that is staged once its file is written.
+
+        The association's rows aren't added before the row is staged, or
+        the reservation cancelled with :meth:`cancel` if the write failed.
+        """
+        with self._lock:
+            self._writing[assoc] = self._writing.get(assoc, 0) + 1
+
+    def cancel(self, assoc):
+        """Cancel a :meth:`reserve` for an instance that wasn't stored."""
+        with self._lock:
+            self._writing[assoc] -= 1
+            rows = self._take_finished(assoc)
+
+        if rows:
+            self.add(rows)
+
+    def handle_association_end(self, event):
+        """Add the rows staged for an association.
+
+        Bind to ``evt.EVT_RELEASED`` and ``evt.EVT_ABORTED``.
+        """
+        with self._lock:
+            self._ended.add(event.assoc)
+            rows = self._take_finished(event.assoc)
+
+        if rows:
+            self.add(rows)
+
+    def _take_finished(self, assoc):
+        """Return the rows of `assoc` if it ended and has no pending writes.
+
+        Call with the lock held.
+        """
+        if assoc not in self._ended or self._writing.get(assoc, 0):
+            return []
+
+        self._ended.discard(assoc)
+        self._writing.pop(assoc, None)
+        return self._pending.pop(assoc, [])
+
+    def flush(self):
+        """Add the rows staged for all associations."""
+        with self._lock:
+            rows = [row for rows in self._pending.values() for row in rows]
+            self._pending.clear()
+            self._writing.clear()
+            self._ended.clear()
+
+        if rows:
+            self.add(rows)
+
+    def query(self, sql, parameters=()):
+        """Return the rows of a SELECT statement as a list of dicts."""
+        with self._lock:
+            cursor = self._conn.execute(sql, parameters)
+            names = [description[0] for description in cursor.description]
+            return [dict(zip(names, values)) for values in cursor.fetchall()]
+
+    def search_studies(
+        self,
+        patient=None,
+        date_from=None,
+        date_to=None,
+        modality=None,
+        limit=None,
+        since=None,
+    ):
+        """Return a row per study matching a filter.
+
+        Rows are sorted by patient and date and hold the patient and study
+        columns, the study's modalities joined by commas and its numbers of
+        series and instances.
+
+        Parameters
+        ----------
+        patient : str, optional
+            Matches the start of the patient name or ID, ignoring case.
+        date_from, date_to : str, optional
+            The first and last Study Date as ``YYYYMMDD``.
+        modality : str, optional
+            The Modality of any of the study's instances, e.g. ``US``. The
+            study's columns and counts still cover all of its instances.
+        limit : int, optional
+            The most studies to return.
+        since : int, optional
+            Only return the studies with rows added or replaced after the
+            :meth:`last_rowid` this was.
+        """
+        conditions = []
+        parameters = []
+        if patient:
+            # Ranges rather than LIKE, so the patient indexes are used
+            conditions.append(
+                "((patient_name >= ? COLLATE NOCASE"
+                " AND patient_name < ? COLLATE NOCASE)"
+                " OR (patient_id >= ? COLLATE NOCASE"
+                " AND patient_id < ? COLLATE NOCASE))"
+            )
+            parameters += [patient, patient + "\uffff"] * 2
+        if date_from:
+            conditions.append("study_date >= ?")
+            parameters.append(date_from)
+        if date_to:
+            conditions.append("study_date <= ?")
+            parameters.append(date_to)
+        if modality:
+            conditions.append("modality = ?")
+            parameters.append(modality)
+
+        # Studies are matched on any of their rows, then counted over all of
+        #   them so a filter doesn't change a study's totals
+        subqueries = []
+        if conditions:
+            subqueries.append(
+                "study_instance_uid IN (SELECT study_instance_uid"
+                f" FROM instances WHERE {' AND '.join(conditions)})"
+            )
+        if since is not None:
+            subqueries.append(
+                "study_instance_uid IN (SELECT study_instance_uid"
+                " FROM instances WHERE rowid > ?)"
+            )
+            parameters.append(since)
+        where = ""
+        if subqueries:
+            where = f"WHERE {' AND '.join(subqueries)}"
+        sql = (
+            "SELECT min(patient_id) AS patient_id, min(patient_name) AS patient_name,"
+            " study_instance_uid, min(study_date) AS study_date,"
+            " group_concat(DISTINCT modality) AS modalities,"
+            " count(DISTINCT series_instance_uid) AS series, count(*) AS instances"
+            f" FROM instances {where} GROUP BY study_instance_uid"
+            " ORDER BY patient_name, patient_id, study_date"
+        )
+        if limit:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+
+        return self.query(sql, parameters)
+
+    def last_rowid(self):
+        """Return the rowid of the last row added, see :meth:`search_studies`.
+
+        A replaced row gets a new rowid, so rows with a larger one were
+        added or replaced later.
+        """
+        rows = self.query("SELECT max(rowid) AS rowid FROM instances")
+        return rows[0]["rowid"] or 0
+
+    def series(self, study_instance_uid):
+        """Return a row per series of a study, with its number of instances."""
+        return self.query(
+            "SELECT series_instance_uid, min(modality) AS modality,"
+            " count(*) AS instances FROM instances WHERE study_instance_uid = ?"
+            " GROUP BY series_instance_uid ORDER BY min(received_at)",
+            (study_instance_uid,),
+        )
+
+    def instances(self, series_instance_uid):
+        """Return the instances of a series in the order they were received."""
+        return self.query(
+            "SELECT sop_instance_uid, number_of_frames, path FROM instances"
+            " WHERE series_instance_uid = ? ORDER BY received_at",
+            (series_instance_uid,),
+        )
+
+    def modalities(self):
+        """Return the Modality values in the index."""
+        rows = self.query(
+            "SELECT DISTINCT modality FROM instances"
+            " WHERE modality IS NOT NULL ORDER BY modality"
+        )
+        return [row["modality"] for row in rows]
+
+    def clear(self):
+        """Remove every row from the index."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM instances")
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+def read_row(fp, path, size):
+    """Return the index row for the DICOM file `fp` stored at `path`.
+
+    Only the elements needed for the row are decoded and the pixel data is
+    never read.
+
+    Parameters
+    ----------
+    fp : str or file-like
+        The DICOM file to read the elements from.
+    path : str
+        The path the instance is stored at.
+    size : int
+        The size of the stored file in bytes.
+    """
+    # pydicom is only loaded when a header is read, not by the viewer
+    from pydicom import dcmread
+
+    ds = dcmread(fp, stop_before_pixels=True, specific_tags=TAGS)
+    file_meta = getattr(ds, "file_meta", {})
+    frames = ds.get("NumberOfFrames")
+
+    return {
+        "sop_instance_uid": _text(ds.get("SOPInstanceUID")),
+        "sop_class_uid": _text(ds.get("SOPClassUID")),
+        "patient_id": _text(ds.get("PatientID")),
+        "patient_name": _text(ds.get("PatientName")),
+        "study_instance_uid": _text(ds.get("StudyInstanceUID")),
+        "study_date": _text(ds.get("StudyDate")),
+        "series_instance_uid": _text(ds.get("SeriesInstanceUID")),
+        "modality": _text(ds.get("Modality")),
+        "rows": ds.get("Rows"),
+        "columns": ds.get("Columns"),
+        "number_of_frames": int(frames) if frames else 1,
+        "transfer_syntax_uid": _text(file_meta.get("TransferSyntaxUID")),
+        "path": path,
+        "size": size,
+        "received_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def _text(value):
+    return None if value is None else str(value)
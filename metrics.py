@@ -0,0 +1,278 @@
+"""Metrics for the storescp application.
+
+Counters, gauges and histograms are kept in memory and can be served in the
+Prometheus text exposition format over a local HTTP endpoint.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = []
+
+
+class _Metric:
+    """Base class for a metric with optional labels."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ""
+
+        values = [f'{name}="{_escape(value)}"' for name, value in pairs]
+        return "{" + ",".join(values) + "}"
+
+    def render(self):
+        """Return the metric in the Prometheus text format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+
+        for key, value in items:
+            lines.append(f"{self.name}{self._format_labels(key)} {value}")
+
+        return lines
+
+
+class Counter(_Metric):
+    """A value that only increases."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, or be read from a function."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        """Read the (unlabelled) value from `function` when rendered."""
+        self._function = function
+
+    def render(self):
+        if self._function is not None:
+            self.set(self._function())
+
+        return super().render()
+
+
+class Histogram(_Metric):
+    """Observations counted in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        if not self.labelnames:
+            # [bucket counts, sum, count]
+            self._values[()] = [[0] * len(self.buckets), 0, 0]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            if key not in self._values:
+                # [bucket counts, sum, count]
+                self._values[key] = [[0] * len(self.buckets), 0, 0]
+
+            state = self._values[key]
+            for ii, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][ii] += 1
+
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Return a context manager that observes the elapsed time."""
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            items = sorted(
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in self._values.items()
+            )
+
+        for key, counts, total, count in items:
+            for bound, value in zip(self.buckets, counts):
+                labels = self._format_labels(key, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {value}")
+
+            labels = self._format_labels(key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = self._format_labels(key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def _escape(value):
+    value = str(value).replace("\\", "\\\\")
+    return value.replace('"', '\\"').replace("\n", "\\n")
+
+
+def render():
+    """Return all registered metrics in the Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, address="127.0.0.1"):
+    """Serve the metrics over HTTP from a background thread.
+
+    Returns
+    -------
+    http.server.ThreadingHTTPServer
+        The running server, stop it with ``shutdown()``.
+    """
+    server = ThreadingHTTPServer((address, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="storescp-metrics", daemon=True
+    ).start()
+
+    return server
+
+
+def handle_association(event):
+    """Count association events, bind to the association ``evt.EVT_*``.
+
+    Only accepted associations are counted as active, so rejected ones and
+    aborts during negotiation don't decrement the gauge.
+    """
+    name = event.event.name
+    if name == "EVT_REQUESTED":
+        ASSOCIATIONS.inc(result="requested")
+    elif name == "EVT_ACCEPTED":
+        ASSOCIATIONS.inc(result="accepted")
+        with _active_lock:
+            _active.add(id(event.assoc))
+        ACTIVE_ASSOCIATIONS.inc()
+    elif name == "EVT_REJECTED":
+        ASSOCIATIONS.inc(result="rejected")
+    elif name in ("EVT_RELEASED", "EVT_ABORTED"):
+        with _active_lock:
+            accepted = id(event.assoc) in _active
+            _active.discard(id(event.assoc))
+        if accepted:
+            ACTIVE_ASSOCIATIONS.dec()
+
+
+# The ids of the associations counted in ACTIVE_ASSOCIATIONS
+_active = set()
+_active_lock = threading.Lock()
+
+ASSOCIATIONS = Counter(
+    "storescp_associations_total",
+    "Association requests by result.",
+    ["result"],
+)
+ACTIVE_ASSOCIATIONS = Gauge(
+    "storescp_associations_active",
+    "Currently established associations.",
+)
+C_STORES = Counter(
+    "storescp_c_store_total",
+    "C-STORE requests by SOP Class and response status.",
+    ["sop_class", "status"],
+)
+RECEIVED_BYTES = Counter(
+    "storescp_received_bytes_total",
+    "Bytes of dataset received in C-STORE requests.",
+)
+HANDLER_SECONDS = Histogram(
+    "storescp_store_handler_seconds",
+    "Time taken by the C-STORE handler.",
+)
+QUEUE_DEPTH = Gauge(
+    "storescp_queue_depth",
+    "Datasets waiting for the writer threads.",
+)
+DISK_WRITE_SECONDS = Histogram(
+    "storescp_disk_write_seconds",
+    "Time taken to write or move a dataset into the output directory.",
+)
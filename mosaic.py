@@ -0,0 +1,84 @@
+from sys import platform
+
+import numpy as np
+
+if platform == "linux":
+    import cv2
+elif platform == "win32":
+    from cv2 import cv2
+else:
+    raise Exception("Unsupported platform")
+
+
+def gridFromCorners(images, corners):
+    """Arrange layout images into rows.
+
+    `corners` is a layout's Corner enum, whose values are [row, column], and
+    `images` maps corner names to images.
+    """
+    rows = max(corner.value[0] for corner in corners) + 1
+    cols = max(corner.value[1] for corner in corners) + 1
+
+    grid = [[None] * cols for _ in range(rows)]
+    for corner in corners:
+        grid[corner.value[0]][corner.value[1]] = images[corner.name]
+
+    return grid
+
+
+def composeMosaic(grid, border=0, borderColor=(255, 255, 255), cellSize=None):
+    """Compose a list of rows of images into one image.
+
+    The output is allocated once and every image is copied straight into
+    its place. Without a `cellSize` images keep their size, each row is as
+    tall as its tallest image and images are aligned top left, as with
+    chained horizontal and vertical concatenation. With a (width, height)
+    `cellSize` every image is resized into a cell of that size. Missing
+    (None) images are left black. The result is surrounded by `border`
+    pixels of `borderColor`.
+    """
+    images = [image for row in grid for image in row if image is not None]
+    if not images:
+        raise ValueError("No images to compose")
+
+    channels = images[0].shape[2] if images[0].ndim == 3 else 1
+    dtype = images[0].dtype
+
+    def size(image):
+        if cellSize is not None:
+            return cellSize
+        if image is None:
+            return (0, 0)
+        return (image.shape[1], image.shape[0])
+
+    # Geometry of the whole canvas, worked out before allocating it
+    rowHeights = [max(size(image)[1] for image in row) if row else 0 for row in grid]
+    rowWidths = [sum(size(image)[0] for image in row) for row in grid]
+    height = sum(rowHeights) + 2 * border
+    width = max(rowWidths) + 2 * border
+
+    shape = (height, width, channels) if channels > 1 else (height, width)
+    canvas = np.zeros(shape, dtype=dtype)
+    if border:
+        color = borderColor[:channels] if channels > 1 else borderColor[0]
+        canvas[:border] = color
+        canvas[height - border:] = color
+        canvas[:, :border] = color
+        canvas[:, width - border:] = color
+
+    y = border
+    for row, rowHeight in zip(grid, rowHeights):
+        x = border
+        for image in row:
+            w, h = size(image)
+            if image is not None:
+                cell = canvas[y:y + h, x:x + w]
+                if (image.shape[1], image.shape[0]) == (w, h):
+                    cell[...] = image
+                else:
+                    # Resized straight into the canvas
+                    cv2.resize(image, (w, h), dst=cell, interpolation=cv2.INTER_AREA)
+            x += w
+        y += rowHeight
+
+    return canvas
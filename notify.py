@@ -0,0 +1,81 @@
+"""Push notifications of stored instances for the storescp application.
+
+Clients connect to a local TCP port and receive the path of every stored
+file as a UTF-8 line as soon as it has been written, so a viewer can add
+it to its tree instead of polling the output directory.
+"""
+
+import socket
+import threading
+from socketserver import BaseRequestHandler, ThreadingTCPServer
+
+
+class _NotificationRequestHandler(BaseRequestHandler):
+    def handle(self):
+        self.server.add_client(self.request)
+        # Wait for the client to go away, it never sends anything
+        try:
+            while self.request.recv(1024):
+                pass
+        except OSError:
+            pass
+        finally:
+            self.server.remove_client(self.request)
+
+
+class NotificationServer(ThreadingTCPServer):
+    """Sends the path of each stored file to every connected client.
+
+    Parameters
+    ----------
+    port : int
+        The port to listen on.
+    address : str, optional
+        The address to listen on, localhost by default.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port, address="127.0.0.1"):
+        super().__init__((address, port), _NotificationRequestHandler)
+        self._clients = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Serve from a background thread."""
+        threading.Thread(
+            target=self.serve_forever, name="storescp-notify", daemon=True
+        ).start()
+
+    def add_client(self, sock):
+        with self._lock:
+            self._clients.append(sock)
+
+    def remove_client(self, sock):
+        with self._lock:
+            if sock in self._clients:
+                self._clients.remove(sock)
+
+    def publish(self, path):
+        """Send `path` to the connected clients, dropping any that fail."""
+        line = (path + "\n").encode("utf-8")
+        with self._lock:
+            clients = list(self._clients)
+
+        for sock in clients:
+            try:
+                sock.sendall(line)
+            except OSError:
+                self.remove_client(sock)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        with self._lock:
+            for sock in self._clients:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self._clients.clear()
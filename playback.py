@@ -0,0 +1,199 @@
+from sys import platform
+
+import queue
+import threading
+import time
+
+if platform == "linux":
+    import cv2
+elif platform == "win32":
+    from cv2 import cv2
+else:
+    raise Exception("Unsupported platform")
+
+# GUI imports
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+from colorspace import yuvToRgb
+
+# Display-ready frames decoded ahead of the one being shown
+BUFFER_SIZE = 16
+
+# Put in the buffer after the last frame
+_END = None
+
+
+class FramePlayer(QObject):
+    """Plays a cine from a CineReader at the DICOM frame rate.
+
+    A producer thread decodes, color converts and scales upcoming frames into
+    a bounded buffer of QImages, so the GUI thread only has to show them.
+    Frames that aren't ready by the time they are due are dropped rather
+    than slowing playback down, and counted in `droppedFrames`.
+    """
+    frameShown = Signal(QImage, int)
+    finished = Signal()
+
+    def __init__(self, reader, width, height, bufferSize=BUFFER_SIZE):
+        super().__init__()
+        self.reader = reader
+        self.size = (width, height)
+        self.position = 0  # Next frame to show
+        self.playing = False
+        self.shownFrames = 0
+        self.droppedFrames = 0
+
+        self._buffer = queue.Queue(bufferSize)
+        self._producer = None
+        self._stopProducer = threading.Event()
+        self._ended = False
+        self._clockStart = 0
+        self._clockFrame = 0
+
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.setInterval(max(1, int(1000 / reader.frameRate)))
+        self._timer.timeout.connect(self._tick)
+
+    def play(self):
+        if self.position >= self.reader.numberOfFrames:
+            self.seek(0)
+
+        if self._producer is None:
+            self._startProducer()
+
+        self.playing = True
+        self._clockStart = time.monotonic()
+        self._clockFrame = self.position
+        self._timer.start()
+
+    def pause(self):
+        # The producer keeps the buffer full while paused
+        self.playing = False
+        self._timer.stop()
+
+    def seek(self, index):
+        self.position = max(0, min(index, self.reader.numberOfFrames - 1))
+        self._clockStart = time.monotonic()
+        self._clockFrame = self.position
+        self._startProducer()
+
+        # Show the frame even when paused
+        self._timer.start()
+
+    def setSize(self, width, height):
+        if (width, height) != self.size:
+            self.size = (width, height)
+            if not self.playing:
+                # Show the current frame again at the new size
+                self.position = max(0, self.position - 1)
+                self._timer.start()
+            self._startProducer()
+
+    def stop(self):
+        self.playing = False
+        self._timer.stop()
+        self._stopProducing()
+
+    def _startProducer(self):
+        self._stopProducing()
+        self._stopProducer = threading.Event()
+        self._ended = False
+        self._producer = threading.Thread(target=self._produce,
+                                          args=(self.position, self.size, self._stopProducer),
+                                          daemon=True)
+        self._producer.start()
+
+    def _stopProducing(self):
+        if self._producer is None:
+            return
+
+        self._stopProducer.set()
+        # Wake the producer up if it is waiting for space
+        self._clearBuffer()
+        self._producer.join()
+        self._producer = None
+        self._clearBuffer()
+
+    def _clearBuffer(self):
+        while True:
+            try:
+                self._buffer.get_nowait()
+            except queue.Empty:
+                return
+
+    def _produce(self, first, size, stop):
+        converted = None
+        try:
+            for index, frame in enumerate(self.reader.frames(first), first):
+                if stop.is_set():
+                    return
+
+                if self.reader.isYbr():
+                    converted = yuvToRgb(frame, converted)
+                else:
+                    converted = frame
+                scaled = cv2.resize(converted, size, interpolation=cv2.INTER_AREA)
+                # Copied so the image owns its data
+                image = QImage(scaled, scaled.shape[1], scaled.shape[0],
+                               scaled.strides[0], QImage.Format_RGB888).copy()
+                if not self._put((index, image), stop):
+                    return
+        except Exception as e:
+            print("ERROR! COULD NOT DECODE FRAMES: " + self.reader.path)
+            print(e)
+
+        self._put(_END, stop)
+
+    def _put(self, item, stop):
+        while not stop.is_set():
+            try:
+                self._buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def _tick(self):
+        if self.playing:
+            # The frame due now according to the frame rate
+            due = self._clockFrame + int((time.monotonic() - self._clockStart) * self.reader.frameRate)
+            if due < self.position:
+                return
+        else:
+            due = self.position
+
+        shown = None
+        while True:
+            try:
+                item = self._buffer.get_nowait()
+            except queue.Empty:
+                break
+
+            if item is _END:
+                self._ended = True
+                break
+
+            if shown is not None:
+                self.droppedFrames += 1
+
+            shown = item
+            if shown[0] >= due:
+                break
+
+        if shown is None:
+            if self._ended:
+                self.position = self.reader.numberOfFrames
+                self.pause()
+                self.finished.emit()
+            return
+
+        index, image = shown
+        self.position = index + 1
+        self.shownFrames += 1
+        self.frameShown.emit(image, index)
+
+        if not self.playing:
+            self._timer.stop()
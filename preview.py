@@ -0,0 +1,65 @@
+import threading
+
+# Dicom includes
+import pydicom
+
+# GUI imports
+from PySide6.QtCore import *
+
+from cine import CineReader
+from colorspace import yuvToRgb
+from framecache import fileKey
+
+
+class PreviewSignals(QObject):
+    cineLoaded = Signal(int, object, object, object)  # request, CineReader, key, first frame
+    imageLoaded = Signal(int, object, object)  # request, key, frame
+    failed = Signal(int, str)  # request, error
+
+
+class PreviewLoader(QRunnable):
+    """Loads a DICOM preview on a QThreadPool thread.
+
+    Cines only have their first frame decoded so it can be shown straight
+    away, the rest is left to a FramePlayer. Results are tagged with the
+    request number so the viewer can ignore superseded loads, and a
+    cancelled loader stops at the next step. Decoded frames are kept in
+    `cache`, a FrameCache.
+    """
+
+    def __init__(self, request, path, cache):
+        super().__init__()
+        self.request = request
+        self.path = path
+        self.cache = cache
+        self.signals = PreviewSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        try:
+            key = fileKey(self.path)
+            reader = CineReader(self.path)
+            if self._cancelled.is_set():
+                return
+
+            # For cines the first frame is cached
+            frame = self.cache.get(key)
+            if reader.isCine():
+                if frame is None:
+                    frame = reader.frame(0)
+                    if reader.isYbr():
+                        frame = yuvToRgb(frame)
+                    self.cache.put(key, frame)
+                if not self._cancelled.is_set():
+                    self.signals.cineLoaded.emit(self.request, reader, key, frame)
+            else:
+                if frame is None:
+                    frame = pydicom.dcmread(self.path).pixel_array
+                    self.cache.put(key, frame)
+                if not self._cancelled.is_set():
+                    self.signals.imageLoaded.emit(self.request, key, frame)
+        except Exception as e:
+            self.signals.failed.emit(self.request, str(e))
@@ -0,0 +1,86 @@
+# GUI imports
+from PySide6.QtCore import *
+from PySide6.QtNetwork import *
+
+
+class ServerEvents(QObject):
+    """Qt signals for a storescp server running in the application process.
+
+    The server calls these from its own threads, connected slots run on the
+    GUI thread.
+    """
+    instanceStored = Signal(str)  # path of the stored file
+    associationChanged = Signal(str, str)  # event name, peer address
+
+    def handleStored(self, path):
+        self.instanceStored.emit(path)
+
+    def handleAssociation(self, event):
+        self.associationChanged.emit(event.event.name, str(event.assoc.requestor.address))
+
+
+def startServer(argv, events):
+    """Start a storescp.StorageServer on background threads.
+
+    `argv` are the storescp command line options and `events` a
+    ServerEvents. Returns the server, stop it with stop(). Spooling isn't
+    supported, it would change the application's tempfile directory and
+    pynetdicom configuration while the server runs.
+    """
+    # pynetdicom is only loaded when running the server in process
+    from pynetdicom import evt
+    from pynetdicom.apps.common import setup_logging
+    import storescp
+
+    args = storescp.parse_args(argv)
+    if args.spool:
+        raise ValueError("--spool needs the server to run in its own process")
+
+    logger = setup_logging(args, "storescp")
+    handlers = [(event, events.handleAssociation)
+                for event in (evt.EVT_ACCEPTED, evt.EVT_RELEASED, evt.EVT_ABORTED)]
+
+    server = storescp.StorageServer(args, logger, on_stored=[events.handleStored],
+                                    evt_handlers=handlers)
+    server.start()
+
+    return server
+
+
+class NotificationClient(QObject):
+    """Receives stored file paths from a storescp --notify-port.
+
+    Each path is emitted through `events.instanceStored`. Reconnects every
+    few seconds while the server isn't running.
+    """
+
+    def __init__(self, port, events):
+        super().__init__()
+        self.port = port
+        self.events = events
+
+        self.socket = QTcpSocket(self)
+        self.socket.readyRead.connect(self.onReadyRead)
+        self.socket.disconnected.connect(self.scheduleConnect)
+        self.socket.errorOccurred.connect(self.scheduleConnect)
+
+        self.retryTimer = QTimer(self)
+        self.retryTimer.setSingleShot(True)
+        self.retryTimer.setInterval(2000)
+        self.retryTimer.timeout.connect(self.connectToServer)
+
+        self.connectToServer()
+
+    def connectToServer(self):
+        self.socket.abort()
+        self.socket.connectToHost(QHostAddress.LocalHost, self.port)
+
+    def scheduleConnect(self, *args):
+        if not self.retryTimer.isActive():
+            self.retryTimer.start()
+
+    def onReadyRead(self):
+        while self.socket.canReadLine():
+            line = bytes(self.socket.readLine()).decode('utf-8').rstrip('\n')
+            if line:
+                self.events.instanceStored.emit(line)
@@ -0,0 +1,50 @@
+import subprocess
+import sys
+
+# Modules listed in the report
+TOP_MODULES = 20
+
+
+def parseImportTimes(output):
+    """Parse `python -X importtime` output.
+
+    Returns a list of (module, self us, cumulative us, depth) in import
+    order, depth 0 being modules imported directly by the application.
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+
+        fields = line[len('import time:'):].split('|')
+        selfTime, cumulative, name = int(fields[0]), int(fields[1]), fields[2]
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((name.strip(), selfTime, cumulative, depth))
+
+    return imports
+
+
+def profileStartup(script):
+    """Start `script` with --startup-probe under -X importtime and report.
+
+    The probe shows the main window and exits straight away, printing how
+    long that took. Returns the probe's exit code.
+    """
+    command = [sys.executable, '-X', 'importtime', script, '--startup-probe']
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+
+    imports = parseImportTimes(result.stderr)
+    topLevel = [entry for entry in imports if entry[3] == 0]
+    total = sum(entry[2] for entry in topLevel)
+
+    print("Imports: %d modules, %.1f ms" % (len(imports), total / 1000))
+    print("%10s %10s  %s" % ("cumul ms", "self ms", "module"))
+    for name, selfTime, cumulative, _ in sorted(topLevel, key=lambda entry: -entry[2])[:TOP_MODULES]:
+        print("%10.1f %10.1f  %s" % (cumulative / 1000, selfTime / 1000, name))
+
+    print(result.stdout.strip())
+    if result.returncode:
+        print(result.stderr[-2000:])
+
+    return result.returncode
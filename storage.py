@@ -0,0 +1,435 @@
+"""Storage handlers for the storescp application.
+
+C-STORE requests are encoded on the association thread (or passed through
+untouched in raw mode) and handed to a bounded queue, which is drained by a
+pool of writer threads. The DIMSE response is sent as soon as the dataset
+has been queued, so slow disks no longer stall the association.
+"""
+
+import os
+import queue
+import shutil
+import threading
+from io import BytesIO
+
+from pydicom.filewriter import write_file_meta_info
+from pydicom.uid import DeflatedExplicitVRLittleEndian
+
+from pynetdicom.apps.common import SOP_CLASS_PREFIXES
+from pynetdicom.dsutils import encode
+
+import metrics
+from archive_layout import instance_directory
+from instance_index import read_row
+
+
+# C-STORE status codes, see PS3.4 Annex B.2.3
+STATUS_SUCCESS = 0x0000
+STATUS_OUT_OF_RESOURCES = 0xA700
+STATUS_CANNOT_ENCODE = 0xA701
+STATUS_CANNOT_UNDERSTAND = 0xC210
+
+
+class StoragePipeline:
+    """Write-behind queue for received datasets.
+
+    Parameters
+    ----------
+    writers : int
+        The number of writer threads draining the queue.
+    queue_size : int
+        The maximum number of datasets waiting to be written. When the queue
+        is full :meth:`put` fails immediately rather than blocking.
+    app_logger : logging.Logger
+        The application's logger.
+    on_stored : callable, optional
+        If used then called with the filename of each dataset once it has
+        been written.
+    """
+
+    def __init__(self, writers, queue_size, app_logger, on_stored=None):
+        self.app_logger = app_logger
+        self.on_stored = on_stored
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = [
+            threading.Thread(
+                target=self._run, name=f"storescp-writer-{ii}", daemon=True
+            )
+            for ii in range(writers)
+        ]
+        metrics.QUEUE_DEPTH.set_function(self._queue.qsize)
+
+    def start(self):
+        """Start the writer threads."""
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, filename, data, on_written=None):
+        """Queue `data` to be written to `filename`.
+
+        If used then `on_written` is called with ``True`` once the file has
+        been written, or ``False`` if writing it failed.
+
+        Returns
+        -------
+        bool
+            ``True`` if the dataset was queued, ``False`` if the queue is full.
+        """
+        try:
+            self._queue.put_nowait((filename, data, on_written))
+        except queue.Full:
+            return False
+
+        return True
+
+    def drain(self):
+        """Write all queued datasets and stop the writer threads."""
+        self.app_logger.info(
+            f"Draining storage queue ({self._queue.qsize()} pending)"
+        )
+        for _ in self._threads:
+            self._queue.put(None)
+
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+
+                filename, data, on_written = item
+                written = write_file(filename, data, self.app_logger)
+                if on_written is not None:
+                    on_written(written)
+                if written and self.on_stored is not None:
+                    self.on_stored(filename)
+            finally:
+                self._queue.task_done()
+
+
+def write_file(filename, data, app_logger):
+    """Write the encoded `data` to `filename`.
+
+    The file is written under a hidden temporary name, flushed to disk and
+    then renamed so that readers never see a partially written file.
+
+    Returns
+    -------
+    bool
+        ``True`` if the file was written successfully, ``False`` otherwise.
+    """
+    dirname, basename = os.path.split(filename)
+    partial = os.path.join(dirname, f".{basename}.part")
+    try:
+        with metrics.DISK_WRITE_SECONDS.time():
+            with open(partial, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(partial, filename)
+    except OSError as exc:
+        app_logger.error("Could not write file to specified directory:")
+        app_logger.error(f"    {os.path.dirname(filename)}")
+        app_logger.exception(exc)
+        return False
+
+    return True
+
+
+def move_file(src, filename, app_logger):
+    """Move the spooled file `src` to `filename`.
+
+    When `src` is on the same file system as `filename` this is a single
+    atomic rename, otherwise the file is copied under a hidden temporary
+    name first.
+
+    Returns
+    -------
+    bool
+        ``True`` if the file was moved successfully, ``False`` otherwise.
+    """
+    try:
+        with metrics.DISK_WRITE_SECONDS.time():
+            try:
+                os.replace(src, filename)
+            except OSError:
+                dirname, basename = os.path.split(filename)
+                partial = os.path.join(dirname, f".{basename}.part")
+                shutil.move(src, partial)
+                os.replace(partial, filename)
+    except OSError as exc:
+        app_logger.error("Could not move file to specified directory:")
+        app_logger.error(f"    {os.path.dirname(filename)}")
+        app_logger.exception(exc)
+        return False
+
+    return True
+
+
+def handle_store(
+    event, args, app_logger, pipeline=None, index=None, on_stored=None
+):
+    """Handle a C-STORE request.
+
+    Parameters
+    ----------
+    event : pynetdicom.event.event
+        The event corresponding to a C-STORE request.
+    args : argparse.Namespace
+        The namespace containing the arguments to use. The namespace should
+        contain ``args.ignore``, ``args.spool``, ``args.raw_store``,
+        ``args.layout`` and ``args.output_directory`` attributes.
+    app_logger : logging.Logger
+        The application's logger.
+    pipeline : StoragePipeline, optional
+        If used then the encoded dataset is queued for writing and the
+        request is acknowledged immediately, otherwise the dataset is written
+        before returning.
+    index : instance_index.InstanceIndex, optional
+        If used then a row for the stored instance is added to the index when
+        the association ends, once the instance has been written.
+    on_stored : callable, optional
+        If used then called with the filename once the dataset has been
+        written, e.g. to export it. When a `pipeline` is used it is
+        responsible for the call.
+
+    Returns
+    -------
+    int
+        A valid return status code, see PS3.4 Annex B.2.3
+    """
+    req = event.request
+    if args.spool:
+        nbytes = os.path.getsize(event.dataset_path)
+    else:
+        nbytes = req.DataSet.getbuffer().nbytes
+
+    with metrics.HANDLER_SECONDS.time():
+        status = _store(event, args, app_logger, pipeline, index, on_stored)
+
+    metrics.RECEIVED_BYTES.inc(nbytes)
+    metrics.C_STORES.inc(
+        sop_class=req.AffectedSOPClassUID.name, status=f"0x{status:04X}"
+    )
+
+    return status
+
+
+def _store(event, args, app_logger, pipeline, index, on_stored):
+    """Store the dataset from a C-STORE request and return the status."""
+    if args.ignore:
+        return STATUS_SUCCESS
+
+    if args.spool:
+        # The dataset has already been written to the spool directory as it
+        #   arrived, so it only needs to be moved into place
+        req = event.request
+        sop_class = req.AffectedSOPClassUID
+        sop_instance = req.AffectedSOPInstanceUID
+        data = None
+    elif args.raw_store:
+        sop_class, sop_instance, data = _encode_raw(event)
+    else:
+        try:
+            sop_class, sop_instance, data = _encode_dataset(event, app_logger)
+        except _EncodeError:
+            return STATUS_CANNOT_ENCODE
+        except Exception:
+            return STATUS_CANNOT_UNDERSTAND
+
+    # The header is only parsed when needed by the layout or the index
+    row = None
+    if args.layout == "hierarchy" or index is not None:
+        try:
+            row = _read_header(event, data)
+        except Exception as exc:
+            app_logger.error("Unable to read the dataset's header")
+            app_logger.exception(exc)
+            if args.layout == "hierarchy":
+                return STATUS_CANNOT_UNDERSTAND
+
+    directory = instance_directory(
+        args.layout,
+        sop_instance,
+        patient_id=row and row["patient_id"],
+        study_uid=row and row["study_instance_uid"],
+        series_uid=row and row["series_instance_uid"],
+    )
+    filename = os.path.join(directory, _get_filename(sop_class, sop_instance))
+    app_logger.info(f"Storing DICOM file: {filename}")
+
+    if args.output_directory is not None:
+        filename = os.path.join(args.output_directory, filename)
+
+    if os.path.dirname(filename):
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        except Exception as exc:
+            app_logger.error("Unable to create the output directory:")
+            app_logger.error(f"    {os.path.dirname(filename)}")
+            app_logger.exception(exc)
+            return STATUS_OUT_OF_RESOURCES
+
+    if os.path.exists(filename):
+        app_logger.warning("DICOM file already exists, overwriting")
+
+    indexed = index is not None and row is not None
+    if indexed:
+        row["path"] = os.path.abspath(filename)
+
+    if data is None or pipeline is None:
+        if data is None:
+            stored = move_file(event.dataset_path, filename, app_logger)
+        else:
+            stored = write_file(filename, data, app_logger)
+
+        if not stored:
+            return STATUS_OUT_OF_RESOURCES
+
+        if indexed:
+            index.stage(event.assoc, row)
+
+        if on_stored is not None:
+            on_stored(filename)
+
+        return STATUS_SUCCESS
+
+    # Only index the instance once its file has been written
+    if indexed:
+        index.reserve(event.assoc)
+
+    if not pipeline.put(filename, data, _on_written(index, event.assoc, row)):
+        app_logger.error("Storage queue is full, unable to store the dataset")
+        if indexed:
+            index.cancel(event.assoc)
+        return STATUS_OUT_OF_RESOURCES
+
+    return STATUS_SUCCESS
+
+
+def _on_written(index, assoc, row):
+    """Return a callback staging `row` in `index` once its file is written."""
+    if index is None or row is None:
+        return None
+
+    def on_written(written):
+        if written:
+            index.stage(assoc, row, reserved=True)
+        else:
+            index.cancel(assoc)
+
+    return on_written
+
+
+def _read_header(event, data):
+    """Return the instance index row for the received dataset.
+
+    The row is read from the encoded `data`, or from the spool file when
+    `data` is ``None``. Its ``path`` is left unset.
+    """
+    if data is None:
+        path = event.dataset_path
+        return read_row(path, None, os.path.getsize(path))
+
+    return read_row(BytesIO(data), None, len(data))
+
+
+class _EncodeError(Exception):
+    """A received dataset was decoded but couldn't be encoded."""
+
+
+def _encode_dataset(event, app_logger):
+    """Decode the received dataset and re-encode it in the DICOM File Format.
+
+    Returns
+    -------
+    tuple
+        The SOP Class UID, SOP Instance UID and the encoded file.
+
+    Raises
+    ------
+    _EncodeError
+        If the dataset cannot be encoded, after logging the cause.
+    Exception
+        If the dataset cannot be decoded, after logging the cause.
+    """
+    try:
+        ds = event.dataset
+        # Remove any Group 0x0002 elements that may have been included
+        ds = ds[0x00030000:]
+    except Exception as exc:
+        app_logger.error("Unable to decode the dataset")
+        app_logger.exception(exc)
+        raise
+
+    # Add the file meta information elements
+    ds.file_meta = event.file_meta
+
+    # Because pydicom uses deferred reads for its decoding, decoding errors
+    #   are hidden until encountered by accessing a faulty element
+    try:
+        sop_class = ds.SOPClassUID
+        sop_instance = ds.SOPInstanceUID
+    except Exception as exc:
+        app_logger.error(
+            "Unable to decode the received dataset or missing 'SOP Class "
+            "UID' and/or 'SOP Instance UID' elements"
+        )
+        app_logger.exception(exc)
+        raise
+
+    fp = BytesIO()
+    try:
+        if event.context.transfer_syntax == DeflatedExplicitVRLittleEndian:
+            # Workaround for pydicom issue #1086
+            fp.write(b"\x00" * 128)
+            fp.write(b"DICM")
+            write_file_meta_info(fp, event.file_meta)
+            fp.write(encode(ds, False, True, True))
+        else:
+            # We use `write_like_original=False` to ensure that a compliant
+            #   File Meta Information Header is written
+            ds.save_as(fp, write_like_original=False)
+    except Exception as exc:
+        app_logger.error("Unable to encode the dataset")
+        app_logger.exception(exc)
+        raise _EncodeError() from exc
+
+    return sop_class, sop_instance, fp.getvalue()
+
+
+def _encode_raw(event):
+    """Return the received dataset in the DICOM File Format without decoding.
+
+    The SOP Class and SOP Instance UIDs are taken from the C-STORE request's
+    *Affected SOP Class UID* and *Affected SOP Instance UID*, which are also
+    used for the File Meta Information, so the dataset itself is never
+    parsed.
+
+    Returns
+    -------
+    tuple
+        The SOP Class UID, SOP Instance UID and the encoded file.
+    """
+    req = event.request
+    fp = BytesIO()
+    fp.write(b"\x00" * 128)
+    fp.write(b"DICM")
+    write_file_meta_info(fp, event.file_meta)
+    fp.write(req.DataSet.getbuffer())
+
+    return req.AffectedSOPClassUID, req.AffectedSOPInstanceUID, fp.getvalue()
+
+
+def _get_filename(sop_class, sop_instance):
+    """Return the filename to use for a SOP Instance."""
+    try:
+        mode_prefix = SOP_CLASS_PREFIXES[sop_class][0]
+    except KeyError:
+        mode_prefix = "UN"
+
+    return f"{mode_prefix}.{sop_instance}"
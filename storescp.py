@@ -3,7 +3,14 @@ Used for receiving DICOM SOP Instances transferred from an SCU.
 """
 
 import argparse
+import os
+import signal
+import socket
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 
 from pydicom.uid import (
     ExplicitVRLittleEndian,
@@ -16,16 +23,25 @@ from pynetdicom import (
     evt,
     AllStoragePresentationContexts,
     VerificationPresentationContexts,
+    _config,
 )
-from pynetdicom.apps.common import setup_logging, handle_store
+from pynetdicom.apps.common import setup_logging
 from pynetdicom._globals import ALL_TRANSFER_SYNTAXES, DEFAULT_MAX_LENGTH
+from pynetdicom.transport import AssociationServer, ThreadedAssociationServer
+
+import metrics
+from archive_layout import LAYOUTS
+from exporter import Exporter, parse_rule
+from instance_index import InstanceIndex
+from notify import NotificationServer
+from storage import StoragePipeline, handle_store
 
 
 __version__ = "0.6.0"
 
 
-def _setup_argparser():
-    """Setup the command line arguments"""
+def _setup_argparser(argv=None):
+    """Setup the command line arguments, parsed from `argv` or sys.argv"""
     # Description
     parser = argparse.ArgumentParser(
         description=(
@@ -173,17 +189,473 @@ def _setup_argparser():
         help="write received objects to directory d",
         type=str,
     )
+    out_opts.add_argument(
+        "--layout",
+        help=(
+            "store received objects in the output directory using layout "
+            f"l, one of {', '.join(LAYOUTS)} (default: flat)"
+        ),
+        metavar="[l]ayout",
+        choices=LAYOUTS,
+        default="flat",
+    )
     out_opts.add_argument(
         "--ignore", help="receive data but don't store it", action="store_true"
     )
+    out_opts.add_argument(
+        "--raw-store",
+        help=(
+            "write received objects as-is without decoding and re-encoding "
+            "the dataset"
+        ),
+        action="store_true",
+    )
+    out_opts.add_argument(
+        "--spool",
+        help=(
+            "write received objects to a spool file as they arrive and move "
+            "them into the output directory once complete, implies "
+            "--raw-store"
+        ),
+        action="store_true",
+    )
+    out_opts.add_argument(
+        "--spool-directory",
+        metavar="[d]irectory",
+        help=(
+            "spool received objects in directory d, should be on the same "
+            "file system as the output directory (default: .spool in the "
+            "output directory)"
+        ),
+        type=str,
+    )
+    out_opts.add_argument(
+        "--index-db",
+        metavar="[f]ile",
+        help="add each received object to the SQLite instance index f",
+        type=str,
+    )
+    out_opts.add_argument(
+        "-w",
+        "--writers",
+        metavar="[n]umber",
+        help=(
+            "use n writer threads to store received objects after the "
+            "C-STORE response has been sent (0 to store before responding, "
+            "default: 0)"
+        ),
+        type=int,
+        default=0,
+    )
+    out_opts.add_argument(
+        "-qs",
+        "--queue-size",
+        metavar="[n]umber",
+        help=(
+            "queue at most n received objects for the writer threads, "
+            "respond with 'Out of Resources' when full (default: 64)"
+        ),
+        type=int,
+        default=64,
+    )
+
+    # Export Options
+    exp_opts = parser.add_argument_group("Export Options")
+    exp_opts.add_argument(
+        "--export",
+        metavar="[r]ule",
+        help=(
+            "after storing an object also write it as an image using rule r, "
+            "given as FORMAT:DIRECTORY[:QUALITY] e.g. PNG:archive/PNG, may be "
+            "used multiple times"
+        ),
+        type=parse_rule,
+        action="append",
+        default=[],
+    )
+    exp_opts.add_argument(
+        "--export-videos",
+        metavar="[d]irectory",
+        help="write multi-frame objects as videos to directory d",
+        type=str,
+    )
+    exp_opts.add_argument(
+        "--export-workers",
+        metavar="[n]umber",
+        help="use n processes for exporting (default: 2)",
+        type=int,
+        default=2,
+    )
+    exp_opts.add_argument(
+        "--export-manifest",
+        metavar="[f]ile",
+        help="record the exported files in the conversion manifest f",
+        type=str,
+    )
 
     # Miscellaneous Options
     misc_opts = parser.add_argument_group("Miscellaneous Options")
     misc_opts.add_argument(
         "--no-echo", help="don't act as a verification SCP", action="store_true"
     )
+    misc_opts.add_argument(
+        "--workers",
+        metavar="[n]umber",
+        help=(
+            "run n server processes listening on the same port, restarting "
+            "any that exit unexpectedly (default: 1)"
+        ),
+        type=int,
+        default=1,
+    )
+    misc_opts.add_argument(
+        "--metrics-port",
+        metavar="[p]ort",
+        help=(
+            "serve metrics in the Prometheus text format on localhost port "
+            "p, each worker uses p + its worker number (default: disabled)"
+        ),
+        type=int,
+    )
+    misc_opts.add_argument(
+        "--notify-port",
+        metavar="[p]ort",
+        help=(
+            "send the path of each stored file to clients of localhost port "
+            "p, each worker uses p + its worker number (default: disabled)"
+        ),
+        type=int,
+    )
+    misc_opts.add_argument("--worker-id", help=argparse.SUPPRESS, type=int)
+
+    return parser.parse_args(argv)
+
+
+def parse_args(argv):
+    """Return the namespace for the storescp command line options `argv`."""
+    return _setup_argparser(argv)
+
+
+class ReusePortAssociationServer(ThreadedAssociationServer):
+    """Association server that shares its port with other processes."""
+
+    def server_bind(self):
+        """Set ``socket.SO_REUSEPORT`` then bind the socket."""
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def shutdown(self):
+        """Stop serving and close the socket.
+
+        The server isn't registered with the AE, so unlike
+        :meth:`AssociationServer.shutdown` it isn't removed from it.
+        """
+        super(AssociationServer, self).shutdown()
+        self.server_close()
+
+
+def _termination_event():
+    """Return an event that is set when the process receives SIGTERM/SIGINT."""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    return stop
+
+
+def _start_worker(worker_id):
+    """Start a storescp worker process and forward its output."""
+    cmd = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:]
+    cmd += ["--worker-id", str(worker_id)]
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+
+    def forward():
+        for line in process.stdout:
+            sys.stderr.write(f"[{worker_id}] {line}")
+
+    threading.Thread(
+        target=forward, name=f"storescp-worker-{worker_id}", daemon=True
+    ).start()
+
+    return process
+
+
+# Delay before restarting a worker, doubled for each consecutive failure
+RESTART_DELAY = 1
+RESTART_DELAY_MAX = 60
+# Consecutive failures after which a worker isn't restarted
+MAX_RESTARTS = 5
+# A worker that ran this long before exiting is restarted without delay
+STABLE_SECONDS = 60
+
+
+def _supervise(args, app_logger):
+    """Run `args.workers` server processes and restart any that exit.
+
+    Workers that keep exiting, e.g. because the port can't be bound, are
+    restarted with an exponential backoff and given up on after
+    `MAX_RESTARTS` consecutive failures.
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        app_logger.error("Multiple workers are not supported on this platform")
+        sys.exit(1)
+
+    stop = _termination_event()
+    now = time.monotonic()
+    workers = [_start_worker(ii) for ii in range(args.workers)]
+    started = [now] * args.workers
+    failures = [0] * args.workers
+    restart_at = [None] * args.workers
+    app_logger.info(f"Started {args.workers} workers on port {args.port}")
+    while not stop.wait(1):
+        now = time.monotonic()
+        for ii, process in enumerate(workers):
+            if process is None:
+                continue
+
+            if restart_at[ii] is not None:
+                if now >= restart_at[ii]:
+                    restart_at[ii] = None
+                    started[ii] = now
+                    workers[ii] = _start_worker(ii)
+                continue
+
+            if process.poll() is None:
+                continue
+
+            if now - started[ii] >= STABLE_SECONDS:
+                failures[ii] = 0
+            failures[ii] += 1
+            if failures[ii] > MAX_RESTARTS:
+                app_logger.error(
+                    f"Worker {ii} exited with code {process.returncode}, "
+                    f"giving up after {MAX_RESTARTS} restarts"
+                )
+                workers[ii] = None
+                continue
+
+            delay = min(RESTART_DELAY * 2 ** (failures[ii] - 1), RESTART_DELAY_MAX)
+            app_logger.warning(
+                f"Worker {ii} exited with code {process.returncode}, "
+                f"restarting in {delay}s"
+            )
+            restart_at[ii] = now + delay
+
+        if all(process is None for process in workers):
+            app_logger.error("All workers have failed")
+            sys.exit(1)
+
+    app_logger.info("Shutting down workers")
+    for process in workers:
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+    for process in workers:
+        if process is not None:
+            process.wait()
+
+
+class StorageServer:
+    """A running Storage SCP, as configured by the command line options.
+
+    Used by :func:`main`, and by applications that run the server in their
+    own process rather than as a child process.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line options, see :func:`parse_args`.
+    app_logger : logging.Logger
+        The application's logger.
+    on_stored : list of callable, optional
+        Called with the filename of each dataset once it has been written.
+    evt_handlers : list of tuple, optional
+        Extra ``(event, handler)`` pairs to bind to the AE.
+    """
+
+    def __init__(self, args, app_logger, on_stored=None, evt_handlers=None):
+        self.args = args
+        self.app_logger = app_logger
+        self.on_stored = list(on_stored or [])
+        self.evt_handlers = list(evt_handlers or [])
+        self.ae = None
+        self.server = None
+        self.pipeline = None
+        self.exporter = None
+        self.index = None
+        self.metrics_server = None
+        self.notification_server = None
+        # Process-wide settings changed by spooling, restored by stop()
+        self._spool_globals = None
+
+    def start(self):
+        """Start serving from background threads."""
+        args = self.args
 
-    return parser.parse_args()
+        # Set Transfer Syntax options
+        transfer_syntax = ALL_TRANSFER_SYNTAXES[:]
+
+        if args.prefer_uncompr:
+            transfer_syntax.remove(ImplicitVRLittleEndian)
+            transfer_syntax.append(ImplicitVRLittleEndian)
+        elif args.prefer_little:
+            transfer_syntax.remove(ExplicitVRLittleEndian)
+            transfer_syntax.insert(0, ExplicitVRLittleEndian)
+        elif args.prefer_big:
+            transfer_syntax.remove(ExplicitVRBigEndian)
+            transfer_syntax.insert(0, ExplicitVRBigEndian)
+        elif args.implicit:
+            transfer_syntax = [ImplicitVRLittleEndian]
+
+        # Spool datasets to disk as they are received, so memory use per
+        #   association is bounded by the PDU size rather than the dataset
+        #   size
+        if args.spool:
+            spool_directory = args.spool_directory or os.path.join(
+                args.output_directory or ".", ".spool"
+            )
+            os.makedirs(spool_directory, exist_ok=True)
+            self._spool_globals = (
+                tempfile.tempdir,
+                _config.STORE_RECV_CHUNKED_DATASET,
+            )
+            tempfile.tempdir = spool_directory
+            _config.STORE_RECV_CHUNKED_DATASET = True
+
+        if args.export or args.export_videos:
+            self.exporter = Exporter(
+                args.export,
+                args.export_videos,
+                args.export_workers,
+                self.app_logger,
+                args.export_manifest,
+            )
+            self.on_stored.insert(0, self.exporter.submit)
+
+        if args.notify_port is not None:
+            self.notification_server = NotificationServer(
+                args.notify_port + (args.worker_id or 0)
+            )
+            self.notification_server.start()
+            self.on_stored.append(self.notification_server.publish)
+
+        on_stored = self._stored if self.on_stored else None
+        if args.writers > 0:
+            self.pipeline = StoragePipeline(
+                args.writers, args.queue_size, self.app_logger, on_stored
+            )
+            self.pipeline.start()
+
+        if args.index_db:
+            self.index = InstanceIndex(args.index_db)
+
+        handlers = [
+            (
+                evt.EVT_C_STORE,
+                handle_store,
+                [args, self.app_logger, self.pipeline, self.index, on_stored],
+            )
+        ]
+        for event in (
+            evt.EVT_REQUESTED,
+            evt.EVT_ACCEPTED,
+            evt.EVT_REJECTED,
+            evt.EVT_RELEASED,
+            evt.EVT_ABORTED,
+        ):
+            handlers.append((event, metrics.handle_association))
+
+        if self.index is not None:
+            handlers.append((evt.EVT_RELEASED, self.index.handle_association_end))
+            handlers.append((evt.EVT_ABORTED, self.index.handle_association_end))
+
+        handlers.extend(self.evt_handlers)
+
+        if args.metrics_port is not None:
+            self.metrics_server = metrics.start_http_server(
+                args.metrics_port + (args.worker_id or 0)
+            )
+
+        # Create application entity
+        ae = self.ae = AE(ae_title=args.ae_title)
+
+        # Add presentation contexts with specified transfer syntaxes
+        for context in AllStoragePresentationContexts:
+            ae.add_supported_context(context.abstract_syntax, transfer_syntax)
+
+        if not args.no_echo:
+            for context in VerificationPresentationContexts:
+                ae.add_supported_context(context.abstract_syntax, transfer_syntax)
+
+        ae.maximum_pdu_size = args.max_pdu
+
+        # Set timeouts
+        ae.network_timeout = args.network_timeout
+        ae.acse_timeout = args.acse_timeout
+        ae.dimse_timeout = args.dimse_timeout
+
+        address = (args.bind_address, args.port)
+        if args.worker_id is None:
+            ae.start_server(address, block=False, evt_handlers=handlers)
+        else:
+            # Workers share the port, the kernel balances connections
+            #   between them
+            server = self.server = ae.make_server(
+                address,
+                evt_handlers=handlers,
+                server_class=ReusePortAssociationServer,
+            )
+            threading.Thread(
+                target=server.serve_forever,
+                name=f"AcceptorServer@{args.worker_id}",
+                daemon=True,
+            ).start()
+
+    def stop(self):
+        """Stop serving and finish writing any queued datasets."""
+        self.app_logger.info("Shutting down")
+        if self.ae is not None:
+            self.ae.shutdown()
+
+        # Worker servers aren't registered with the AE
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+
+        if self.pipeline is not None:
+            self.pipeline.drain()
+
+        # Other tempfile users and AEs in an application's process
+        if self._spool_globals is not None:
+            tempdir, chunked = self._spool_globals
+            tempfile.tempdir = tempdir
+            _config.STORE_RECV_CHUNKED_DATASET = chunked
+            self._spool_globals = None
+
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+        if self.index is not None:
+            self.index.close()
+
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+
+        if self.notification_server is not None:
+            self.notification_server.stop()
+
+    def _stored(self, filename):
+        for callback in self.on_stored:
+            try:
+                callback(filename)
+            except Exception as exc:
+                self.app_logger.error(f"Stored dataset callback failed for {filename}")
+                self.app_logger.exception(exc)
 
 
 def main(args=None):
@@ -200,42 +672,19 @@ def main(args=None):
     APP_LOGGER.debug(f"storescp.py v{__version__}")
     APP_LOGGER.debug("")
 
-    # Set Transfer Syntax options
-    transfer_syntax = ALL_TRANSFER_SYNTAXES[:]
-
-    if args.prefer_uncompr:
-        transfer_syntax.remove(ImplicitVRLittleEndian)
-        transfer_syntax.append(ImplicitVRLittleEndian)
-    elif args.prefer_little:
-        transfer_syntax.remove(ExplicitVRLittleEndian)
-        transfer_syntax.insert(0, ExplicitVRLittleEndian)
-    elif args.prefer_big:
-        transfer_syntax.remove(ExplicitVRBigEndian)
-        transfer_syntax.insert(0, ExplicitVRBigEndian)
-    elif args.implicit:
-        transfer_syntax = [ImplicitVRLittleEndian]
-
-    handlers = [(evt.EVT_C_STORE, handle_store, [args, APP_LOGGER])]
-
-    # Create application entity
-    ae = AE(ae_title=args.ae_title)
-
-    # Add presentation contexts with specified transfer syntaxes
-    for context in AllStoragePresentationContexts:
-        ae.add_supported_context(context.abstract_syntax, transfer_syntax)
-
-    if not args.no_echo:
-        for context in VerificationPresentationContexts:
-            ae.add_supported_context(context.abstract_syntax, transfer_syntax)
+    if args.workers > 1 and args.worker_id is None:
+        _supervise(args, APP_LOGGER)
+        return
 
-    ae.maximum_pdu_size = args.max_pdu
+    server = StorageServer(args, APP_LOGGER)
+    server.start()
 
-    # Set timeouts
-    ae.network_timeout = args.network_timeout
-    ae.acse_timeout = args.acse_timeout
-    ae.dimse_timeout = args.dimse_timeout
+    # Run until terminated, then finish writing any queued datasets
+    stop = _termination_event()
+    while not stop.wait(0.5):
+        pass
 
-    ae.start_server((args.bind_address, args.port), evt_handlers=handlers)
+    server.stop()
 
 
 if __name__ == "__main__":
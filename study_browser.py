@@ -0,0 +1,324 @@
+# GUI imports
+from PySide6.QtWidgets import *
+from PySide6.QtCore import *
+from PySide6.QtGui import *
+
+from archive_model import IsDirRole, PathRole
+
+UidRole = Qt.UserRole + 5
+LevelRole = Qt.UserRole + 6
+FetchedRole = Qt.UserRole + 7
+
+PATIENT, STUDY, SERIES, INSTANCE = range(4)
+
+# Studies listed at once, a filter narrows them down
+STUDY_LIMIT = 1000
+
+# Typing in the filters only queries once it pauses
+FILTER_DELAY_MS = 200
+
+
+def _row(values):
+    items = []
+    for value in values:
+        item = QStandardItem('' if value is None else str(value))
+        item.setEditable(False)
+        items.append(item)
+
+    return items
+
+
+class StudyModel(QStandardItemModel):
+    """Patient, Study, Series and Instance tree from an InstanceIndex.
+
+    Studies matching a filter are listed with a single indexed query and
+    grouped by patient. Series and instances are only queried when their
+    parent is expanded, so the tree never holds the whole archive and no
+    file has to be read to show it. merge() adds the studies stored since
+    in place, so expanded and selected rows are kept.
+    """
+
+    def __init__(self, index):
+        super().__init__()
+        self.instanceIndex = index
+        self.truncated = False
+        self.filter = (None, None, None, None)
+        self.lastRowid = 0
+        self._patients = {}  # Row of each (patient ID, name)
+        self._studies = {}  # Row of each Study Instance UID
+        self.setHorizontalHeaderLabels(['Name', 'Date', 'Modality', 'Instances'])
+
+    def search(self, patient=None, dateFrom=None, dateTo=None, modality=None):
+        self.filter = (patient, dateFrom, dateTo, modality)
+        self.lastRowid = self.instanceIndex.last_rowid()
+        studies = self.instanceIndex.search_studies(*self.filter, limit=STUDY_LIMIT + 1)
+        self.truncated = len(studies) > STUDY_LIMIT
+        studies = studies[:STUDY_LIMIT]
+
+        self.removeRows(0, self.rowCount())
+        self._patients = {}
+        self._studies = {}
+
+        # Studies are sorted by patient, so each patient's are consecutive
+        patients = []
+        for study in studies:
+            key = (study['patient_id'], study['patient_name'])
+            if key not in self._patients:
+                patients.append(self._patientRow(study))
+
+            patient = self._patients[key]
+            patient[0].appendRow(self._studyRow(study))
+            patient[3].setData(patient[3].data(Qt.DisplayRole) + study['instances'], Qt.DisplayRole)
+
+        # Patients are added once filled in, so their studies don't each signal the view
+        for patient in patients:
+            self.appendRow(patient)
+
+        return len(studies)
+
+    def merge(self):
+        """Add the studies stored since the last search or merge, and update
+        the changed ones, without rebuilding the tree."""
+        since = self.lastRowid
+        self.lastRowid = self.instanceIndex.last_rowid()
+
+        for study in self.instanceIndex.search_studies(*self.filter, since=since):
+            row = self._studies.get(study['study_instance_uid'])
+            if row is not None:
+                self._updateStudy(row, study)
+            elif len(self._studies) < STUDY_LIMIT:
+                self._insertStudy(study)
+            else:
+                self.truncated = True
+
+    def studyCount(self):
+        return len(self._studies)
+
+    def hasChildren(self, parent=QModelIndex()):
+        if parent.isValid() and parent.column() == 0 and not parent.data(FetchedRole):
+            return parent.data(LevelRole) in (STUDY, SERIES)
+
+        return super().hasChildren(parent)
+
+    def canFetchMore(self, parent):
+        return (parent.isValid() and parent.column() == 0 and not parent.data(FetchedRole)
+                and parent.data(LevelRole) in (STUDY, SERIES))
+
+    def fetchMore(self, parent):
+        item = self.itemFromIndex(parent)
+        item.setData(True, FetchedRole)
+
+        if item.data(LevelRole) == STUDY:
+            rows = [self._seriesRow(series)
+                    for series in self.instanceIndex.series(item.data(UidRole))]
+        else:
+            rows = [self._instanceRow(instance)
+                    for instance in self.instanceIndex.instances(item.data(UidRole))]
+
+        for row in rows:
+            item.appendRow(row)
+
+    def filePath(self, index):
+        return index.siblingAtColumn(0).data(PathRole)
+
+    def isDir(self, index):
+        return bool(index.siblingAtColumn(0).data(IsDirRole))
+
+    def _makeRow(self, level, uid, values):
+        row = _row(values)
+        row[0].setData(uid, UidRole)
+        row[0].setData(level, LevelRole)
+        row[0].setData(level != INSTANCE, IsDirRole)
+
+        return row
+
+    def _patientRow(self, study):
+        row = self._makeRow(PATIENT, study['patient_id'],
+                            ['%s (%s)' % (study['patient_name'] or 'Anonymous',
+                                          study['patient_id'] or '-'),
+                             None, None, None])
+        row[3].setData(0, Qt.DisplayRole)
+        row[0].setData(True, FetchedRole)
+        self._patients[(study['patient_id'], study['patient_name'])] = row
+
+        return row
+
+    def _studyRow(self, study):
+        row = self._makeRow(STUDY, study['study_instance_uid'],
+                            [study['study_instance_uid'], study['study_date'],
+                             study['modalities'], study['instances']])
+        self._studies[study['study_instance_uid']] = row
+
+        return row
+
+    def _seriesRow(self, series):
+        return self._makeRow(SERIES, series['series_instance_uid'],
+                             [series['series_instance_uid'], None,
+                              series['modality'], series['instances']])
+
+    def _instanceRow(self, instance):
+        row = self._makeRow(INSTANCE, instance['sop_instance_uid'],
+                            [instance['sop_instance_uid'], None, None,
+                             instance['number_of_frames']])
+        row[0].setData(instance['path'], PathRole)
+
+        return row
+
+    def _insertStudy(self, study):
+        """Add a study, and its patient if new, where a search would list it."""
+        key = (study['patient_id'], study['patient_name'])
+        patient = self._patients.get(key)
+        if patient is None:
+            # Sorted by name then ID, as search_studies() does
+            order = _patientOrder(key)
+            position = sum(_patientOrder(other) < order for other in self._patients)
+            patient = self._patientRow(study)
+            self.insertRow(position, patient)
+
+        date = study['study_date'] or ''
+        position = 0
+        while (position < patient[0].rowCount()
+               and patient[0].child(position, 1).text() <= date):
+            position += 1
+        patient[0].insertRow(position, self._studyRow(study))
+        patient[3].setData(patient[3].data(Qt.DisplayRole) + study['instances'], Qt.DisplayRole)
+
+    def _updateStudy(self, row, study):
+        """Update the columns of a listed study, and its series if fetched."""
+        added = study['instances'] - int(row[3].text())
+        row[1].setText(study['study_date'] or '')
+        row[2].setText(study['modalities'] or '')
+        row[3].setText(str(study['instances']))
+
+        patient = self.item(row[0].parent().row(), 3)
+        patient.setData(patient.data(Qt.DisplayRole) + added, Qt.DisplayRole)
+
+        if row[0].data(FetchedRole):
+            self._mergeChildren(row[0], [self._seriesRow(series) for series in
+                                         self.instanceIndex.series(row[0].data(UidRole))])
+
+    def _mergeChildren(self, item, rows):
+        """Append the new rows to `item`, and update its listed children.
+
+        Series whose instances were fetched get their new instances too.
+        """
+        children = {item.child(ii).data(UidRole): ii for ii in range(item.rowCount())}
+        for row in rows:
+            ii = children.get(row[0].data(UidRole))
+            if ii is None:
+                item.appendRow(row)
+                continue
+
+            changed = False
+            for column in range(1, len(row)):
+                if item.child(ii, column).text() != row[column].text():
+                    item.child(ii, column).setText(row[column].text())
+                    changed = True
+            child = item.child(ii)
+            if row[0].data(PathRole) != child.data(PathRole):
+                child.setData(row[0].data(PathRole), PathRole)
+            if changed and child.data(LevelRole) == SERIES and child.data(FetchedRole):
+                self._mergeChildren(child, [self._instanceRow(instance) for instance in
+                                            self.instanceIndex.instances(child.data(UidRole))])
+
+
+def _patientOrder(key):
+    """Sort key of a (patient ID, name), with missing values first as in SQL."""
+    patientId, name = key
+    return (name is not None, name or '', patientId is not None, patientId or '')
+
+
+class StudyBrowser(QWidget):
+    """Filters and tree of the studies in the instance index.
+
+    Emits instanceSelected with the path of a clicked instance.
+    """
+    instanceSelected = Signal(str)
+
+    def __init__(self, index, parent=None):
+        super().__init__(parent)
+        self.model = StudyModel(index)
+
+        self.patientEdit = QLineEdit()
+        self.patientEdit.setPlaceholderText("Patient name or ID")
+        self.dateFromEdit = QLineEdit()
+        self.dateFromEdit.setPlaceholderText("From YYYYMMDD")
+        self.dateToEdit = QLineEdit()
+        self.dateToEdit.setPlaceholderText("To YYYYMMDD")
+        self.modalityBox = QComboBox()
+
+        self.tree_view = QTreeView()
+        self.tree_view.setModel(self.model)
+        self.tree_view.setUniformRowHeights(True)
+        self.tree_view.clicked.connect(self.onClick)
+        self.statusLabel = QLabel()
+
+        # Queries are delayed until typing pauses
+        self.filterTimer = QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(FILTER_DELAY_MS)
+        self.filterTimer.timeout.connect(self.refresh)
+        for edit in (self.patientEdit, self.dateFromEdit, self.dateToEdit):
+            edit.textChanged.connect(self.filterTimer.start)
+        self.modalityBox.currentIndexChanged.connect(self.filterTimer.start)
+
+        filterLayout = QHBoxLayout()
+        filterLayout.addWidget(self.patientEdit)
+        filterLayout.addWidget(self.dateFromEdit)
+        filterLayout.addWidget(self.dateToEdit)
+        filterLayout.addWidget(self.modalityBox)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(filterLayout)
+        layout.addWidget(self.tree_view)
+        layout.addWidget(self.statusLabel)
+        self.setLayout(layout)
+
+        self.refresh()
+
+    def refresh(self):
+        self.updateModalities()
+
+        start = QElapsedTimer()
+        start.start()
+        self.model.search(self.patientEdit.text().strip() or None,
+                          self.dateFromEdit.text().strip() or None,
+                          self.dateToEdit.text().strip() or None,
+                          self.modalityBox.currentData())
+        self.showStatus(start.elapsed())
+
+    def mergeChanges(self):
+        """Show the studies stored since, keeping the filter and the tree's state."""
+        self.updateModalities()
+
+        start = QElapsedTimer()
+        start.start()
+        self.model.merge()
+        self.showStatus(start.elapsed())
+
+    def showStatus(self, elapsed):
+        message = "%d studies" % self.model.studyCount()
+        if self.model.truncated:
+            message = "First " + message + ", filter to see more"
+        self.statusLabel.setText("%s (%d ms)" % (message, elapsed))
+
+    def updateModalities(self):
+        modalities = self.model.instanceIndex.modalities()
+        current = self.modalityBox.currentData()
+        listed = [self.modalityBox.itemData(ii) for ii in range(1, self.modalityBox.count())]
+        if self.modalityBox.count() and listed == modalities:
+            return
+
+        # Changing the items shouldn't trigger another query
+        self.modalityBox.blockSignals(True)
+        self.modalityBox.clear()
+        self.modalityBox.addItem("All modalities", None)
+        for modality in modalities:
+            self.modalityBox.addItem(modality, modality)
+        self.modalityBox.setCurrentIndex(max(0, self.modalityBox.findData(current)))
+        self.modalityBox.blockSignals(False)
+
+    def onClick(self, index):
+        if not self.model.isDir(index):
+            self.instanceSelected.emit(self.model.filePath(index))
@@ -0,0 +1,75 @@
+import hashlib
+import os
+
+import pytest
+
+from archive_layout import find_instance, instance_directory, iter_instances
+
+
+def test_flat():
+    assert instance_directory("flat", "1.2.3") == ""
+
+
+def test_hashed():
+    digest = hashlib.sha1(b"1.2.3").hexdigest()
+    path = instance_directory("hashed", "1.2.3")
+    assert path == os.path.join(digest[:2], digest[2:4])
+
+
+def test_hierarchy():
+    path = instance_directory("hierarchy", "1.2.3", "PID", "1.2", "1.2.9")
+    assert path == os.path.join("PID", "1.2", "1.2.9")
+
+
+@pytest.mark.parametrize(
+    "patient_id, expected",
+    [
+        ("a/b\\c", "a_b_c"),
+        ('x:y*z?"<>|', "x_y_z_____"),
+        ("..", "_."),
+        (".hidden", "_hidden"),
+        ("  padded  ", "padded"),
+        ("", "UNKNOWN"),
+        (None, "UNKNOWN"),
+        ("tab\tnewline\n", "tab_newline"),
+    ],
+)
+def test_hierarchy_sanitises(patient_id, expected):
+    path = instance_directory("hierarchy", "1.2.3", patient_id, "1.2", "1.2.9")
+    assert path.split(os.sep)[0] == expected
+
+
+def test_hierarchy_missing_uids():
+    path = instance_directory("hierarchy", "1.2.3")
+    assert path == os.path.join("UNKNOWN", "UNKNOWN", "UNKNOWN")
+
+
+def test_unknown_layout():
+    with pytest.raises(ValueError):
+        instance_directory("nested", "1.2.3")
+
+
+def test_find_instance(tmp_path):
+    directory = tmp_path / instance_directory("hashed", "1.2.3")
+    directory.mkdir(parents=True)
+    (directory / ".US.1.2.3.part").write_bytes(b"")
+    assert find_instance(str(tmp_path), "hashed", "1.2.3") is None
+
+    (directory / "US.1.2.3").write_bytes(b"")
+    path = find_instance(str(tmp_path), "hashed", "1.2.3")
+    assert path == str(directory / "US.1.2.3")
+    assert find_instance(str(tmp_path), "hashed", "1.2.4") is None
+
+
+def test_iter_instances_skips_hidden(tmp_path):
+    (tmp_path / ".spool").mkdir()
+    (tmp_path / ".spool" / "US.1").write_bytes(b"")
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "US.2").write_bytes(b"")
+    (tmp_path / "a" / ".US.3.part").write_bytes(b"")
+    (tmp_path / "US.4").write_bytes(b"")
+
+    assert list(iter_instances(str(tmp_path))) == [
+        str(tmp_path / "US.4"),
+        str(tmp_path / "a" / "US.2"),
+    ]
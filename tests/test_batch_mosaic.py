@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+
+from batch_mosaic import _selected, group_rows, select_rows
+from instance_index import COLUMNS, InstanceIndex
+
+
+def _row(uid, study, series, modality, patient_id, date):
+    row = dict.fromkeys(COLUMNS)
+    row.update(
+        sop_instance_uid=uid,
+        patient_id=patient_id,
+        study_instance_uid=study,
+        study_date=date,
+        series_instance_uid=series,
+        modality=modality,
+        number_of_frames=1,
+        path=f"/archive/{uid}",
+    )
+    return row
+
+
+ROWS = [
+    _row("1", "S1", "S1.1", "US", "P1", "20240101"),
+    _row("2", "S1", "S1.2", "SR", "P1", "20240101"),
+    _row("3", "S2", "S2.1", "US", "P1", "20240601"),
+    _row("4", "S3", "S3.1", "CT", "P2", "20240301"),
+    _row("5", "S4", "S4.1", "US", "P3", None),
+]
+
+
+def _args(index_db=None, **kwargs):
+    args = dict(
+        index_db=index_db,
+        archive=None,
+        all_studies=False,
+        study=[],
+        series=[],
+        patient_id=[],
+        modality=[],
+        date_from=None,
+        date_to=None,
+    )
+    args.update(kwargs)
+    return SimpleNamespace(**args)
+
+
+@pytest.fixture
+def index_db(tmp_path):
+    path = str(tmp_path / "index.sqlite")
+    index = InstanceIndex(path)
+    index.add(ROWS)
+    index.close()
+    return path
+
+
+@pytest.mark.parametrize(
+    "selection, expected",
+    [
+        (dict(all_studies=True), ["1", "2", "3", "4", "5"]),
+        (dict(), []),
+        (dict(study=["S1", "S3"]), ["1", "2", "4"]),
+        (dict(series=["S1.2"], patient_id=["P2"]), ["2", "4"]),
+        (dict(patient_id=["P1"], modality=["US"]), ["1", "3"]),
+        (dict(all_studies=True, modality=["US", "CT"]), ["1", "3", "4", "5"]),
+        (dict(all_studies=True, date_from="20240201"), ["3", "4"]),
+        (dict(all_studies=True, date_to="20240301"), ["1", "2", "4"]),
+    ],
+)
+def test_select_rows(index_db, selection, expected):
+    rows = select_rows(_args(index_db, **selection))
+    assert [row["sop_instance_uid"] for row in rows] == expected
+
+    # Selecting by reading headers matches the query
+    args = _args(**selection)
+    selected = [row["sop_instance_uid"] for row in ROWS if _selected(args, row)]
+    assert selected == expected
+
+
+def test_group_rows():
+    groups = group_rows(ROWS[:3], per_series=False)
+    assert groups == {"S1": ["/archive/1", "/archive/2"], "S2": ["/archive/3"]}
+
+    groups = group_rows(ROWS[:2], per_series=True)
+    assert groups == {"S1.1": ["/archive/1"], "S1.2": ["/archive/2"]}
@@ -0,0 +1,134 @@
+import struct
+
+import cv2
+import numpy as np
+import pydicom
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.encaps import encapsulate, itemize_frame
+from pydicom.pixel_data_handlers.rle_handler import rle_encode_frame
+from pydicom.uid import ExplicitVRLittleEndian, JPEGBaseline8Bit, RLELossless, generate_uid
+
+from cine import CineReader
+
+ROWS = 16
+COLUMNS = 8
+FRAMES = 6
+
+
+def _dataset(transfer_syntax, photometric="RGB", planar=0):
+    ds = Dataset()
+    ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.3.1"
+    ds.SOPInstanceUID = generate_uid()
+    ds.Rows = ROWS
+    ds.Columns = COLUMNS
+    ds.SamplesPerPixel = 3
+    ds.PhotometricInterpretation = photometric
+    ds.PlanarConfiguration = planar
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PixelRepresentation = 0
+    ds.NumberOfFrames = FRAMES
+    ds.FrameTime = 40
+
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = ds.SOPClassUID
+    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    ds.file_meta.TransferSyntaxUID = transfer_syntax
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    return ds
+
+
+def _save(ds, tmp_path):
+    path = str(tmp_path / "US.dcm")
+    ds.save_as(path, write_like_original=False)
+    return path
+
+
+@pytest.fixture
+def pixels():
+    return np.random.default_rng(0).integers(
+        0, 256, (FRAMES, ROWS, COLUMNS, 3), dtype=np.uint8
+    )
+
+
+@pytest.mark.parametrize("planar", [0, 1])
+def test_native(tmp_path, pixels, planar):
+    ds = _dataset(ExplicitVRLittleEndian, planar=planar)
+    data = pixels.transpose(0, 3, 1, 2) if planar else pixels
+    ds.PixelData = data.tobytes()
+    reader = CineReader(_save(ds, tmp_path))
+
+    assert reader.isCine()
+    assert reader.frameRate == 25
+    assert all(np.array_equal(a, b) for a, b in zip(reader.frames(), pixels))
+    assert all(np.array_equal(a, b) for a, b in zip(reader.frames(2), pixels[2:]))
+    assert np.array_equal(reader.frame(FRAMES - 1), pixels[-1])
+    with pytest.raises(IndexError):
+        reader.frame(FRAMES)
+
+
+def test_native_ybr_full_422(tmp_path):
+    ds = _dataset(ExplicitVRLittleEndian, "YBR_FULL_422")
+    # Pairs of pixels as Y Y Cb Cr
+    stored = np.random.default_rng(0).integers(
+        0, 256, (FRAMES, ROWS, COLUMNS // 2, 4), dtype=np.uint8
+    )
+    ds.PixelData = stored.tobytes()
+    path = _save(ds, tmp_path)
+    expected = pydicom.dcmread(path).pixel_array
+
+    reader = CineReader(path)
+    frames = list(reader.frames())
+    assert len(frames) == FRAMES
+    assert all(np.array_equal(a, b) for a, b in zip(frames, expected))
+    assert np.array_equal(reader.frame(FRAMES - 1), expected[-1])
+
+
+@pytest.mark.parametrize("has_bot", [True, False])
+def test_rle(tmp_path, pixels, has_bot):
+    ds = _dataset(RLELossless, planar=1)
+    ds.PixelData = encapsulate(
+        [rle_encode_frame(frame) for frame in pixels], has_bot=has_bot
+    )
+    ds["PixelData"].VR = "OB"
+    ds["PixelData"].is_undefined_length = True
+    reader = CineReader(_save(ds, tmp_path))
+
+    for index in (4, 0, FRAMES - 1, 2):
+        assert np.array_equal(reader.frame(index), pixels[index])
+    assert all(np.array_equal(a, b) for a, b in zip(reader.frames(3), pixels[3:]))
+    with pytest.raises(IndexError):
+        reader.frame(FRAMES)
+
+
+def _jpeg_pixel_data(frames, has_bot):
+    """Encapsulate `frames` with three fragments each."""
+    items = [b"".join(itemize_frame(frame, 3)) for frame in frames]
+    offsets = []
+    if has_bot:
+        offsets = [sum(len(item) for item in items[:ii]) for ii in range(len(items))]
+    table = struct.pack("<%dL" % len(offsets), *offsets)
+
+    return (
+        b"\xfe\xff\x00\xe0" + struct.pack("<L", len(table)) + table
+        + b"".join(items)
+        + b"\xfe\xff\xdd\xe0\x00\x00\x00\x00"
+    )
+
+
+@pytest.mark.parametrize("has_bot", [True, False])
+def test_jpeg_frame_offsets(tmp_path, pixels, has_bot):
+    frames = [cv2.imencode(".jpg", frame)[1].tobytes() for frame in pixels]
+    ds = _dataset(JPEGBaseline8Bit, "YBR_FULL_422")
+    ds.PixelData = _jpeg_pixel_data(frames, has_bot)
+    ds["PixelData"].VR = "OB"
+    ds["PixelData"].is_undefined_length = True
+    reader = CineReader(_save(ds, tmp_path))
+
+    # Fragments are padded to an even length
+    data = [frame.rstrip(b"\x00") for frame in reader._encapsulatedFrameData(2)]
+    assert data == [frame.rstrip(b"\x00") for frame in frames[2:]]
+    assert len(reader._frameStarts) == FRAMES
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from pydicom.pixel_data_handlers.util import convert_color_space
+
+from colorspace import yuvToBgr, yuvToRgb
+
+
+@pytest.fixture
+def frames():
+    return np.random.default_rng(0).integers(0, 256, (5, 12, 10, 3), dtype=np.uint8)
+
+
+def _close(a, b):
+    # Rounding may differ from pydicom's by one level
+    return a.dtype == b.dtype and np.abs(a.astype(int) - b.astype(int)).max() <= 1
+
+
+def test_yuv_to_rgb_matches_pydicom(frames):
+    expected = convert_color_space(frames, "YBR_FULL", "RGB")
+    assert _close(yuvToRgb(frames), expected)
+
+
+def test_yuv_to_bgr_matches_pydicom(frames):
+    expected = convert_color_space(frames, "YBR_FULL", "RGB")[..., ::-1]
+    assert _close(yuvToBgr(frames), expected)
+
+
+def test_single_frame(frames):
+    assert np.array_equal(yuvToBgr(frames[0]), yuvToBgr(frames)[0])
+
+
+def test_out_buffer(frames):
+    out = np.empty_like(frames)
+    assert yuvToBgr(frames, out) is out
+    assert np.array_equal(out, yuvToBgr(frames))
@@ -0,0 +1,221 @@
+import os
+import types
+
+import cv2
+import numpy as np
+import pydicom
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.pixel_data_handlers.util import convert_color_space
+from pydicom.uid import ExplicitVRLittleEndian, JPEGBaseline8Bit, generate_uid
+
+from cine import CineReader, decodedColorSpace
+from colorspace import yuvToBgr
+from converter import (
+    BatchConverter,
+    ConversionManifest,
+    bgrPixels,
+    readFrame,
+    writeVideo,
+)
+from formats import Format
+
+ROWS = 16
+COLUMNS = 8
+
+
+def _dataset(photometric, frames=1, transfer_syntax=ExplicitVRLittleEndian):
+    ds = Dataset()
+    ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.6.1"
+    ds.SOPInstanceUID = generate_uid()
+    ds.Rows = ROWS
+    ds.Columns = COLUMNS
+    ds.SamplesPerPixel = 3
+    ds.PhotometricInterpretation = photometric
+    ds.PlanarConfiguration = 0
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PixelRepresentation = 0
+    if frames > 1:
+        ds.NumberOfFrames = frames
+
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = ds.SOPClassUID
+    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    ds.file_meta.TransferSyntaxUID = transfer_syntax
+    ds.is_little_endian = True
+    ds.is_implicit_VR = False
+    return ds
+
+
+@pytest.fixture
+def pixels():
+    return np.random.default_rng(0).integers(
+        0, 256, (4, ROWS, COLUMNS, 3), dtype=np.uint8
+    )
+
+
+def _handler(converts):
+    """A pixel data handler that does, or doesn't, convert YBR to RGB."""
+    return types.SimpleNamespace(
+        is_available=lambda: True,
+        supports_transfer_syntax=lambda transfer_syntax: True,
+        needs_to_convert_to_RGB=lambda ds: converts,
+    )
+
+
+@pytest.mark.parametrize("converts, expected", [(False, "YBR_FULL_422"), (True, "RGB")])
+def test_decoded_color_space(monkeypatch, converts, expected):
+    monkeypatch.setattr(pydicom.config, "pixel_data_handlers", [_handler(converts)])
+    ds = _dataset("YBR_FULL_422", transfer_syntax=JPEGBaseline8Bit)
+
+    assert decodedColorSpace(ds) == expected
+
+
+def test_bgr_pixels_ybr(pixels):
+    ds = _dataset("YBR_FULL")
+    ds.PixelData = pixels[0].tobytes()
+
+    expected = convert_color_space(pixels[0], "YBR_FULL", "RGB")[:, :, ::-1]
+    assert np.array_equal(bgrPixels(ds), expected)
+
+
+def test_bgr_pixels_rgb(pixels):
+    ds = _dataset("RGB", frames=4)
+    ds.PixelData = pixels.tobytes()
+
+    assert np.array_equal(bgrPixels(ds), pixels[0][:, :, ::-1])
+
+
+@pytest.mark.parametrize("photometric", ["RGB", "YBR_FULL"])
+def test_cine_frames_match_images(tmp_path, pixels, photometric):
+    ds = _dataset(photometric, frames=4)
+    ds.PixelData = pixels.tobytes()
+    path = str(tmp_path / "US.dcm")
+    ds.save_as(path, write_like_original=False)
+
+    expected = bgrPixels(pydicom.dcmread(path))
+    # The video conversion may round differently by one level
+    difference = readFrame(path).astype(int) - expected
+    assert np.abs(difference).max() <= 1
+
+    reader = CineReader(path)
+    assert reader.isYbr() == (photometric == "YBR_FULL")
+    if photometric == "RGB":
+        assert np.array_equal(readFrame(path), expected)
+    else:
+        assert np.array_equal(readFrame(path), yuvToBgr(pixels[0]))
+
+
+def test_write_video_rgb(tmp_path, monkeypatch, pixels):
+    ds = _dataset("RGB", frames=4)
+    ds.PixelData = pixels.tobytes()
+    path = str(tmp_path / "US.dcm")
+    ds.save_as(path, write_like_original=False)
+
+    written = []
+
+    class VideoWriter:
+        def __init__(self, *args):
+            pass
+
+        def write(self, frame):
+            written.append(frame.copy())
+
+        def release(self):
+            pass
+
+    monkeypatch.setattr(cv2, "VideoWriter", VideoWriter)
+    writeVideo(CineReader(path), "US", str(tmp_path))
+
+    assert np.array_equal(np.stack(written), pixels[..., ::-1])
+
+
+def _source(tmp_path, name="US.1.2.3"):
+    path = tmp_path / name
+    path.write_bytes(b"DICOM")
+    return str(path)
+
+
+def _output(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b"")
+    return str(path)
+
+
+def test_manifest_current(tmp_path):
+    source = _source(tmp_path)
+    png = _output(tmp_path, "1.2.3.png")
+    jpg = str(tmp_path / "1.2.3.jpg")
+    manifest = ConversionManifest(str(tmp_path / "manifest.json"))
+    manifest.record(source, png)
+
+    assert manifest.isCurrent(source, [png])
+    assert not manifest.isCurrent(source, [jpg])
+
+    # Changed since it was converted
+    with open(source, "ab") as f:
+        f.write(b"!")
+    assert not manifest.isCurrent(source, [png])
+
+
+def test_manifest_video_kept_across_formats(tmp_path):
+    source = _source(tmp_path)
+    video = _output(tmp_path, "1.2.3.mp4")
+    manifest = ConversionManifest(str(tmp_path / "manifest.json"))
+    manifest.record(source, video)
+
+    assert manifest.isCurrent(source, [str(tmp_path / "1.2.3.png"), video])
+    assert manifest.isCurrent(source, [str(tmp_path / "1.2.3.jpg"), video])
+
+
+def test_manifest_deleted_output(tmp_path):
+    source = _source(tmp_path)
+    png = _output(tmp_path, "1.2.3.png")
+    manifest = ConversionManifest(str(tmp_path / "manifest.json"))
+    manifest.record(source, png)
+
+    os.unlink(png)
+    assert not manifest.isCurrent(source, [png])
+
+
+def test_manifest_save_keeps_other_entries(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    first = _source(tmp_path, "US.1")
+    second = _source(tmp_path, "US.2")
+    outputs = [_output(tmp_path, "1.png"), _output(tmp_path, "2.png")]
+
+    # Two processes recording in the same manifest
+    viewer = ConversionManifest(path)
+    server = ConversionManifest(path)
+    viewer.record(first, outputs[0])
+    server.record(second, outputs[1])
+    viewer.save()
+    server.save()
+
+    manifest = ConversionManifest(path)
+    assert manifest.isCurrent(first, outputs[:1])
+    assert manifest.isCurrent(second, outputs[1:])
+
+
+def test_manifest_keyed_by_format_read_as_empty(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text('{"PNG": {"1.2.3": {"mtime": 1, "size": 1, "output": "x"}}}')
+
+    assert ConversionManifest(str(path)).entries == {}
+
+
+def test_batch_skips_videos_after_format_change(tmp_path, pixels):
+    ds = _dataset("RGB", frames=4)
+    ds.PixelData = pixels.tobytes()
+    path = str(tmp_path / "US.1.2.3")
+    ds.save_as(path, write_like_original=False)
+    videos = tmp_path / "Videos"
+    videos.mkdir()
+    manifest = ConversionManifest(str(tmp_path / "manifest.json"))
+
+    converter = BatchConverter(1)
+    for format, converted in ((Format.PNG, 1), (Format.JPG, 0)):
+        done = converter.run([path], format, str(tmp_path), str(videos), manifest=manifest)
+        assert done == converted
@@ -0,0 +1,46 @@
+import logging
+from concurrent.futures import Future
+
+import pytest
+
+from converter import ConversionManifest, ExportRule
+from exporter import Exporter, parse_rule
+from formats import Format
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("PNG:archive/PNG", ExportRule(Format.PNG, "archive/PNG", 100)),
+        ("jpg:archive/JPG:90", ExportRule(Format.JPG, "archive/JPG", 90)),
+        # Only a trailing number is a quality
+        ("PNG:C:/archive", ExportRule(Format.PNG, "C:/archive", 100)),
+        ("PNG:C:/archive:5", ExportRule(Format.PNG, "C:/archive", 5)),
+    ],
+)
+def test_parse_rule(value, expected):
+    assert parse_rule(value) == expected
+
+
+@pytest.mark.parametrize("value", ["PNG", "GIF:archive", ""])
+def test_parse_rule_invalid(value):
+    with pytest.raises(ValueError):
+        parse_rule(value)
+
+
+def test_exports_recorded(tmp_path):
+    source = tmp_path / "US.1.2.3"
+    source.write_bytes(b"DICOM")
+    output = tmp_path / "PNG" / "1.2.3.png"
+    output.parent.mkdir()
+    output.write_bytes(b"")
+    manifest_path = str(tmp_path / "manifest.json")
+
+    exporter = Exporter([], None, 1, logging.getLogger("test"), manifest_path)
+    future = Future()
+    future.set_result([str(output)])
+    exporter._done(str(source), future)
+    exporter.shutdown()
+
+    manifest = ConversionManifest(manifest_path)
+    assert manifest.isCurrent(str(source), [str(output)])
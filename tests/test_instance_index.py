@@ -0,0 +1,169 @@
+from types import SimpleNamespace
+
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian
+
+from instance_index import COLUMNS, InstanceIndex, read_row
+
+
+def _row(uid, study, series, modality, patient="DOE^JANE", patient_id="P1",
+         date="20240101", received="2024-01-01T00:00:00"):
+    row = dict.fromkeys(COLUMNS)
+    row.update(
+        sop_instance_uid=uid,
+        patient_id=patient_id,
+        patient_name=patient,
+        study_instance_uid=study,
+        study_date=date,
+        series_instance_uid=series,
+        modality=modality,
+        number_of_frames=1,
+        path=f"/archive/{uid}",
+        received_at=received,
+    )
+    return row
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = InstanceIndex(str(tmp_path / "index.sqlite"))
+    index.add(
+        [
+            # A study with an ultrasound and an SR series
+            _row("1", "S1", "S1.1", "US"),
+            _row("2", "S1", "S1.1", "US"),
+            _row("3", "S1", "S1.2", "SR"),
+            # Another patient's CT study
+            _row("4", "S2", "S2.1", "CT", "SMITH^JOHN", "P2", "20240301"),
+            _row("5", "S2", "S2.1", "CT", "SMITH^JOHN", "P2", "20240301"),
+        ]
+    )
+    yield index
+    index.close()
+
+
+def test_query(index):
+    rows = index.query(
+        "SELECT sop_instance_uid FROM instances WHERE study_instance_uid = ?"
+        " ORDER BY sop_instance_uid",
+        ("S1",),
+    )
+    assert rows == [{"sop_instance_uid": uid} for uid in ("1", "2", "3")]
+
+
+def test_add_replaces(index):
+    index.add([_row("1", "S1", "S1.1", "US", patient="DOE^JOHN")])
+    rows = index.query(
+        "SELECT patient_name FROM instances WHERE sop_instance_uid = '1'"
+    )
+    assert rows == [{"patient_name": "DOE^JOHN"}]
+
+
+def test_staged_rows_added_at_association_end(index):
+    assoc = object()
+    index.stage(assoc, _row("6", "S3", "S3.1", "MR"))
+    assert index.query("SELECT * FROM instances WHERE study_instance_uid = 'S3'") == []
+
+    index.handle_association_end(SimpleNamespace(assoc=assoc))
+    rows = index.query(
+        "SELECT sop_instance_uid FROM instances WHERE study_instance_uid = 'S3'"
+    )
+    assert rows == [{"sop_instance_uid": "6"}]
+
+
+def test_flush(index):
+    index.stage(object(), _row("6", "S3", "S3.1", "MR"))
+    index.flush()
+    assert len(index.query("SELECT * FROM instances")) == 6
+
+
+def test_clear(index):
+    index.clear()
+    assert index.query("SELECT * FROM instances") == []
+
+
+def test_read_row(tmp_path):
+    ds = Dataset()
+    ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.6.1"
+    ds.SOPInstanceUID = "1.2.3.4"
+    ds.PatientID = "P1"
+    ds.PatientName = "DOE^JANE"
+    ds.StudyInstanceUID = "1.2.3"
+    ds.StudyDate = "20240101"
+    ds.SeriesInstanceUID = "1.2.3.1"
+    ds.Modality = "US"
+    ds.Rows = 4
+    ds.Columns = 2
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = ds.SOPClassUID
+    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    path = str(tmp_path / "US.1.2.3.4")
+    ds.save_as(path, write_like_original=False)
+
+    row = read_row(path, "/archive/US.1.2.3.4", 10)
+    assert set(row) == set(COLUMNS)
+    assert row["sop_instance_uid"] == "1.2.3.4"
+    assert row["patient_name"] == "DOE^JANE"
+    assert row["modality"] == "US"
+    assert row["rows"] == 4
+    assert row["number_of_frames"] == 1
+    assert row["transfer_syntax_uid"] == ExplicitVRLittleEndian
+    assert row["path"] == "/archive/US.1.2.3.4"
+    assert row["size"] == 10
+
+
+def _studies(rows):
+    return {row["study_instance_uid"]: row for row in rows}
+
+
+def test_all_studies(index):
+    studies = _studies(index.search_studies())
+    assert set(studies) == {"S1", "S2"}
+    assert studies["S1"]["series"] == 2
+    assert studies["S1"]["instances"] == 3
+    assert sorted(studies["S1"]["modalities"].split(",")) == ["SR", "US"]
+
+
+def test_modality_filter_keeps_study_totals(index):
+    studies = _studies(index.search_studies(modality="SR"))
+    assert set(studies) == {"S1"}
+    assert studies["S1"]["series"] == 2
+    assert studies["S1"]["instances"] == 3
+    assert sorted(studies["S1"]["modalities"].split(",")) == ["SR", "US"]
+
+
+def test_date_filter(index):
+    assert set(_studies(index.search_studies(date_from="20240201"))) == {"S2"}
+    assert set(_studies(index.search_studies(date_to="20240201"))) == {"S1"}
+    assert index.search_studies(date_from="20240102", date_to="20240201") == []
+
+
+@pytest.mark.parametrize("patient", ["smith", "SMITH^J", "p2", "P2"])
+def test_patient_prefix(index, patient):
+    assert set(_studies(index.search_studies(patient=patient))) == {"S2"}
+
+
+def test_patient_is_a_prefix(index):
+    assert index.search_studies(patient="JOHN") == []
+
+
+def test_limit(index):
+    assert len(index.search_studies(limit=1)) == 1
+
+
+def test_series_and_instances(index):
+    series = index.series("S1")
+    assert [(row["series_instance_uid"], row["instances"]) for row in series] == [
+        ("S1.1", 2),
+        ("S1.2", 1),
+    ]
+    assert [row["path"] for row in index.instances("S1.1")] == [
+        "/archive/1",
+        "/archive/2",
+    ]
+
+
+def test_modalities(index):
+    assert index.modalities() == ["CT", "SR", "US"]
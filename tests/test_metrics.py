@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+from urllib.request import urlopen
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Metrics created by a test are kept out of the module's registry."""
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+    return metrics.REGISTRY
+
+
+def test_counter(registry):
+    counter = metrics.Counter("test_total", "Test.", ["status"])
+    counter.inc(status="0x0000")
+    counter.inc(2, status="0x0000")
+    counter.inc(status='a"b\\c\nd')
+
+    assert metrics.render() == (
+        "# HELP test_total Test.\n"
+        "# TYPE test_total counter\n"
+        'test_total{status="0x0000"} 3\n'
+        'test_total{status="a\\"b\\\\c\\nd"} 1\n'
+    )
+
+
+def test_gauge_function(registry):
+    gauge = metrics.Gauge("test_depth", "Test.")
+    gauge.set_function(lambda: 7)
+
+    assert gauge.render()[-1] == "test_depth 7"
+
+
+def test_histogram(registry):
+    histogram = metrics.Histogram("test_seconds", "Test.", buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{le="0.1"} 1',
+        'test_seconds_bucket{le="1"} 2',
+        'test_seconds_bucket{le="+Inf"} 3',
+        "test_seconds_sum 5.55",
+        "test_seconds_count 3",
+    ]
+
+
+def _event(name, assoc):
+    return SimpleNamespace(event=SimpleNamespace(name=name), assoc=assoc)
+
+
+def _active():
+    return metrics.ACTIVE_ASSOCIATIONS._values[()]
+
+
+def test_handle_association():
+    accepted = object()
+    rejected = object()
+    active = _active()
+
+    metrics.handle_association(_event("EVT_REQUESTED", accepted))
+    metrics.handle_association(_event("EVT_ACCEPTED", accepted))
+    assert _active() == active + 1
+
+    # Only accepted associations are counted as active
+    metrics.handle_association(_event("EVT_REQUESTED", rejected))
+    metrics.handle_association(_event("EVT_REJECTED", rejected))
+    metrics.handle_association(_event("EVT_ABORTED", rejected))
+    assert _active() == active + 1
+
+    metrics.handle_association(_event("EVT_RELEASED", accepted))
+    metrics.handle_association(_event("EVT_ABORTED", accepted))
+    assert _active() == active
+
+
+def test_http_server():
+    server = metrics.start_http_server(0)
+    try:
+        port = server.server_address[1]
+        with urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+
+    assert "# TYPE storescp_c_store_total counter" in body
+    assert "storescp_associations_active " in body
@@ -0,0 +1,71 @@
+from enum import Enum
+
+import cv2
+import numpy as np
+import pytest
+
+from mosaic import composeMosaic, gridFromCorners
+
+
+def _image(width, height, value):
+    return np.full((height, width, 3), value, np.uint8)
+
+
+def test_matches_concatenation():
+    grid = [
+        [_image(4, 3, 10), _image(5, 3, 20)],
+        [_image(9, 2, 30)],
+    ]
+    expected = cv2.vconcat([cv2.hconcat(grid[0]), grid[1][0]])
+
+    assert np.array_equal(composeMosaic(grid), expected)
+
+
+def test_rows_aligned_top_left():
+    mosaic = composeMosaic([[_image(2, 2, 10), _image(2, 4, 20)], [_image(1, 1, 30)]])
+
+    assert mosaic.shape == (5, 4, 3)
+    assert (mosaic[2:4, :2] == 0).all()
+    assert (mosaic[4, 0] == 30).all()
+    assert (mosaic[4, 1:] == 0).all()
+
+
+def test_border():
+    mosaic = composeMosaic([[_image(2, 2, 10)]], border=1, borderColor=(1, 2, 3))
+
+    assert mosaic.shape == (4, 4, 3)
+    assert (mosaic[0] == (1, 2, 3)).all()
+    assert (mosaic[:, -1] == (1, 2, 3)).all()
+    assert (mosaic[1:3, 1:3] == 10).all()
+
+
+def test_cell_size():
+    image = np.arange(16 * 8 * 3, dtype=np.uint8).reshape(8, 16, 3)
+    mosaic = composeMosaic([[image, None], [None, image]], cellSize=(4, 2))
+    resized = cv2.resize(image, (4, 2), interpolation=cv2.INTER_AREA)
+
+    assert mosaic.shape == (4, 8, 3)
+    assert np.array_equal(mosaic[:2, :4], resized)
+    assert np.array_equal(mosaic[2:, 4:], resized)
+    assert (mosaic[:2, 4:] == 0).all()
+
+
+def test_grayscale():
+    image = np.full((2, 3), 7, np.uint8)
+    mosaic = composeMosaic([[image, image]], border=1)
+
+    assert mosaic.shape == (4, 8)
+    assert mosaic[0, 0] == 255
+    assert (mosaic[1:3, 1:7] == 7).all()
+
+
+def test_no_images():
+    with pytest.raises(ValueError):
+        composeMosaic([[None]])
+
+
+def test_grid_from_corners():
+    Corner = Enum("Corner", {"TOP_LEFT": [0, 0], "BOTTOM_RIGHT": [1, 1]})
+    images = {"TOP_LEFT": "a", "BOTTOM_RIGHT": "b"}
+
+    assert gridFromCorners(images, Corner) == [["a", None], [None, "b"]]
@@ -0,0 +1,12 @@
+import pytest
+
+from server_events import ServerEvents, startServer
+
+
+def test_spooling_rejected(tmp_path):
+    argv = ["11112", "-od", str(tmp_path), "--spool"]
+
+    with pytest.raises(ValueError):
+        startServer(argv, ServerEvents())
+
+    assert list(tmp_path.iterdir()) == []
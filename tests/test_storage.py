@@ -0,0 +1,278 @@
+import logging
+import os
+import threading
+import time
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+from pydicom import dcmread
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.filebase import DicomBytesIO
+from pydicom.filewriter import write_dataset, write_file_meta_info
+from pydicom.uid import UID, ExplicitVRLittleEndian
+from pynetdicom.sop_class import UltrasoundImageStorage
+
+import storage
+from instance_index import InstanceIndex
+from storage import StoragePipeline, handle_store
+
+LOGGER = logging.getLogger("test")
+
+
+def test_drain_writes_queued_datasets(tmp_path):
+    stored = []
+    release = threading.Event()
+
+    def on_stored(filename):
+        # Hold the writer so datasets are still queued when draining starts
+        release.wait()
+        stored.append(filename)
+
+    pipeline = StoragePipeline(1, 16, LOGGER, on_stored)
+    pipeline.start()
+    filenames = [str(tmp_path / f"US.{ii}") for ii in range(10)]
+    for ii, filename in enumerate(filenames):
+        assert pipeline.put(filename, b"data %d" % ii)
+
+    threading.Timer(0.1, release.set).start()
+    pipeline.drain()
+
+    assert sorted(stored) == sorted(filenames)
+    for ii, filename in enumerate(filenames):
+        with open(filename, "rb") as f:
+            assert f.read() == b"data %d" % ii
+    # Only the renamed files, no partial ones
+    assert len(list(tmp_path.iterdir())) == len(filenames)
+
+
+def test_put_fails_when_full(tmp_path):
+    release = threading.Event()
+    pipeline = StoragePipeline(1, 1, LOGGER, lambda f: release.wait())
+    pipeline.start()
+
+    # One being written, one queued, then the queue is full
+    assert pipeline.put(str(tmp_path / "US.1"), b"1")
+    while not release.is_set() and pipeline._queue.qsize():
+        time.sleep(0.01)
+    assert pipeline.put(str(tmp_path / "US.2"), b"2")
+    assert not pipeline.put(str(tmp_path / "US.3"), b"3")
+
+    release.set()
+    pipeline.drain()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["US.1", "US.2"]
+
+
+def _dataset(sop_instance="1.2.3.4"):
+    ds = Dataset()
+    ds.SOPClassUID = UltrasoundImageStorage
+    ds.SOPInstanceUID = sop_instance
+    ds.PatientID = "P1"
+    ds.PatientName = "DOE^JANE"
+    ds.StudyInstanceUID = "1.2.3"
+    ds.SeriesInstanceUID = "1.2.3.1"
+    ds.Modality = "US"
+    return ds
+
+
+def _event(ds, tmp_path=None):
+    """A C-STORE request event for `ds`, spooled to `tmp_path` if given."""
+    fp = DicomBytesIO()
+    fp.is_little_endian = True
+    fp.is_implicit_VR = False
+    write_dataset(fp, ds)
+
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = ds.SOPClassUID
+    file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    event = SimpleNamespace(
+        request=SimpleNamespace(
+            AffectedSOPClassUID=UID(ds.SOPClassUID),
+            AffectedSOPInstanceUID=ds.SOPInstanceUID,
+            DataSet=BytesIO(fp.getvalue()),
+        ),
+        dataset=ds,
+        file_meta=file_meta,
+        context=SimpleNamespace(transfer_syntax=ExplicitVRLittleEndian),
+        assoc=object(),
+        dataset_path=None,
+    )
+
+    if tmp_path is not None:
+        event.dataset_path = str(tmp_path / "spooled.dcm")
+        with open(event.dataset_path, "wb") as f:
+            f.write(b"\x00" * 128 + b"DICM")
+            write_file_meta_info(f, file_meta)
+            f.write(fp.getvalue())
+
+    return event
+
+
+def _args(output_directory, **kwargs):
+    args = dict(
+        ignore=False,
+        spool=False,
+        raw_store=False,
+        layout="flat",
+        output_directory=str(output_directory),
+    )
+    args.update(kwargs)
+    return SimpleNamespace(**args)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = InstanceIndex(str(tmp_path / "index.sqlite"))
+    yield index
+    index.close()
+
+
+def _indexed(index):
+    return [row["path"] for row in index.query("SELECT path FROM instances")]
+
+
+def test_store(tmp_path, index):
+    stored = []
+    event = _event(_dataset())
+    status = handle_store(
+        event, _args(tmp_path / "out"), LOGGER, index=index, on_stored=stored.append
+    )
+
+    path = str(tmp_path / "out" / "US.1.2.3.4")
+    assert status == 0x0000
+    assert stored == [path]
+    assert dcmread(path).PatientName == "DOE^JANE"
+
+    index.handle_association_end(event)
+    assert _indexed(index) == [os.path.abspath(path)]
+
+
+def test_raw_store(tmp_path):
+    event = _event(_dataset())
+    # Raw storing never decodes the dataset
+    event.dataset = None
+    status = handle_store(event, _args(tmp_path, raw_store=True), LOGGER)
+
+    assert status == 0x0000
+    ds = dcmread(tmp_path / "US.1.2.3.4")
+    assert ds.SOPInstanceUID == "1.2.3.4"
+    assert ds.file_meta.TransferSyntaxUID == ExplicitVRLittleEndian
+
+
+def test_decode_failure(tmp_path):
+    event = _event(_dataset())
+    event.dataset = None
+
+    assert handle_store(event, _args(tmp_path), LOGGER) == 0xC210
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_encode_failure(tmp_path):
+    ds = _dataset()
+    # A value that can't be encoded as an unsigned short
+    with pytest.warns(UserWarning):
+        ds.Rows = 70000
+    event = _event(_dataset())
+    event.dataset = ds
+
+    assert handle_store(event, _args(tmp_path), LOGGER) == 0xA701
+    assert list(tmp_path.iterdir()) == []
+
+def test_pipeline_indexes_after_write(tmp_path, index):
+    release = threading.Event()
+    pipeline = StoragePipeline(1, 4, LOGGER, lambda f: None)
+    pipeline.start()
+
+    # Writing waits until released, after the association has ended
+    real_write_file = storage.write_file
+
+    def write_file(filename, data, app_logger):
+        release.wait()
+        return real_write_file(filename, data, app_logger)
+
+    storage.write_file = write_file
+    try:
+        event = _event(_dataset())
+        status = handle_store(event, _args(tmp_path / "out"), LOGGER, pipeline, index)
+        assert status == 0x0000
+
+        index.handle_association_end(event)
+        assert _indexed(index) == []
+
+        release.set()
+        pipeline.drain()
+    finally:
+        storage.write_file = real_write_file
+
+    assert _indexed(index) == [os.path.abspath(tmp_path / "out" / "US.1.2.3.4")]
+
+
+def test_pipeline_failed_write_not_indexed(tmp_path, index):
+    pipeline = StoragePipeline(1, 4, LOGGER)
+    pipeline.start()
+
+    # The output path is a file, so the dataset can't be written below it
+    (tmp_path / "out").write_bytes(b"")
+    event = _event(_dataset())
+    args = _args(tmp_path / "out", layout="hashed")
+    handle_store(event, args, LOGGER, pipeline, index)
+    pipeline.drain()
+    index.handle_association_end(event)
+
+    assert _indexed(index) == []
+
+
+def test_queue_full(tmp_path, index):
+    release = threading.Event()
+    pipeline = StoragePipeline(1, 1, LOGGER, lambda f: release.wait())
+    pipeline.start()
+
+    statuses = []
+    events = [_event(_dataset(f"1.2.3.{ii}")) for ii in range(3)]
+    for event in events:
+        statuses.append(
+            handle_store(event, _args(tmp_path / "out"), LOGGER, pipeline, index)
+        )
+        # The first dataset is taken by the writer, the second is queued
+        while pipeline._queue.qsize() and len(statuses) == 1:
+            time.sleep(0.01)
+
+    release.set()
+    pipeline.drain()
+    for event in events:
+        index.handle_association_end(event)
+
+    assert statuses == [0x0000, 0x0000, 0xA700]
+    assert len(_indexed(index)) == 2
+
+
+def test_spool_move(tmp_path):
+    event = _event(_dataset(), tmp_path)
+    status = handle_store(event, _args(tmp_path / "out", spool=True), LOGGER)
+
+    assert status == 0x0000
+    assert not os.path.exists(event.dataset_path)
+    assert dcmread(tmp_path / "out" / "US.1.2.3.4").PatientID == "P1"
+
+
+@pytest.mark.parametrize("spool", [False, True])
+def test_hierarchy_layout(tmp_path, spool):
+    event = _event(_dataset(), tmp_path if spool else None)
+    args = _args(tmp_path / "out", spool=spool, layout="hierarchy")
+
+    assert handle_store(event, args, LOGGER) == 0x0000
+    path = tmp_path / "out" / "P1" / "1.2.3" / "1.2.3.1" / "US.1.2.3.4"
+    assert dcmread(path).SOPInstanceUID == "1.2.3.4"
+
+
+def test_hierarchy_layout_unreadable_header(tmp_path):
+    event = _event(_dataset(), tmp_path)
+    # Nothing to read the patient, study and series from
+    with open(event.dataset_path, "wb") as f:
+        f.write(b"\xff" * 16)
+    args = _args(tmp_path / "out", spool=True, layout="hierarchy")
+
+    assert handle_store(event, args, LOGGER) == 0xC210
+    assert not os.path.exists(tmp_path / "out")
@@ -0,0 +1,87 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+import storescp
+
+LOGGER = logging.getLogger("test")
+
+
+class _Clock:
+    """Stands in for time.monotonic and the termination event's wait()."""
+
+    def __init__(self, until):
+        self.now = 0
+        self.until = until
+
+    def monotonic(self):
+        return self.now
+
+    def wait(self, timeout):
+        self.now += timeout
+        return self.now > self.until
+
+
+class _Process:
+    def __init__(self, clock, lifetime):
+        self.clock = clock
+        self.exit_at = clock.now + lifetime
+        self.returncode = None
+
+    def poll(self):
+        if self.clock.now >= self.exit_at:
+            self.returncode = 1
+
+        return self.returncode
+
+    def terminate(self):
+        self.returncode = -15
+
+    def wait(self):
+        return self.returncode
+
+
+def _supervise(monkeypatch, until, lifetime):
+    """Run _supervise for `until` seconds, returning the workers' start times."""
+    clock = _Clock(until)
+    starts = []
+
+    def start_worker(worker_id):
+        starts.append(clock.now)
+        return _Process(clock, lifetime)
+
+    monkeypatch.setattr(storescp, "_start_worker", start_worker)
+    monkeypatch.setattr(storescp, "_termination_event", lambda: clock)
+    monkeypatch.setattr(storescp.time, "monotonic", clock.monotonic)
+
+    storescp._supervise(SimpleNamespace(workers=1, port=11112), LOGGER)
+    return starts
+
+
+def test_restarts_with_backoff(monkeypatch):
+    monkeypatch.setattr(storescp, "RESTART_DELAY", 2)
+    monkeypatch.setattr(storescp, "RESTART_DELAY_MAX", 8)
+    monkeypatch.setattr(storescp, "MAX_RESTARTS", 10)
+
+    # Exits are noticed a second later, then the restart waits 2, 4, 8, 8s
+    starts = _supervise(monkeypatch, 45, 0)
+    assert starts == [0, 3, 8, 17, 26, 35, 44]
+
+
+def test_gives_up(monkeypatch):
+    monkeypatch.setattr(storescp, "RESTART_DELAY", 1)
+    monkeypatch.setattr(storescp, "MAX_RESTARTS", 2)
+
+    with pytest.raises(SystemExit):
+        _supervise(monkeypatch, 1000, 0)
+
+
+def test_stable_worker_failures_reset(monkeypatch):
+    monkeypatch.setattr(storescp, "RESTART_DELAY", 1)
+    monkeypatch.setattr(storescp, "MAX_RESTARTS", 1)
+    monkeypatch.setattr(storescp, "STABLE_SECONDS", 10)
+
+    # Each run outlasts STABLE_SECONDS, so the failures never add up
+    starts = _supervise(monkeypatch, 100, 20)
+    assert starts == [0, 21, 42, 63, 84]
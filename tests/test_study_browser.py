@@ -0,0 +1,125 @@
+import pytest
+from PySide6.QtCore import QPersistentModelIndex
+
+from instance_index import COLUMNS, InstanceIndex
+from study_browser import StudyModel, UidRole
+
+
+def _row(uid, study, series, modality, patient="DOE^JANE", patient_id="P1",
+         date="20240101"):
+    row = dict.fromkeys(COLUMNS)
+    row.update(
+        sop_instance_uid=uid,
+        patient_id=patient_id,
+        patient_name=patient,
+        study_instance_uid=study,
+        study_date=date,
+        series_instance_uid=series,
+        modality=modality,
+        number_of_frames=1,
+        path=f"/archive/{uid}",
+        received_at=f"2024-01-01T00:00:{uid:0>2}",
+    )
+    return row
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = InstanceIndex(str(tmp_path / "index.sqlite"))
+    index.add(
+        [
+            _row("1", "S1", "S1.1", "US"),
+            _row("2", "S1", "S1.1", "US"),
+            _row("3", "S2", "S2.1", "CT", "SMITH^JOHN", "P2", "20240301"),
+        ]
+    )
+    yield index
+    index.close()
+
+
+def _tree(model, parent=None):
+    """Return the model's rows as nested (text, ..., [children]) tuples."""
+    parent = parent or model.invisibleRootItem()
+    rows = []
+    for ii in range(parent.rowCount()):
+        cells = [parent.child(ii, column).text() for column in range(4)]
+        rows.append((*cells, _tree(model, parent.child(ii))))
+
+    return rows
+
+
+def _fetch(model, *uids):
+    """Expand the rows with `uids`, fetching their children."""
+    parent = model.invisibleRootItem()
+    for uid in uids:
+        item = next(parent.child(ii) for ii in range(parent.rowCount())
+                    if parent.child(ii).data(UidRole) == uid)
+        if model.canFetchMore(item.index()):
+            model.fetchMore(item.index())
+        parent = item
+
+    return item
+
+
+def test_search(index):
+    model = StudyModel(index)
+    assert model.search() == 2
+    assert _tree(model) == [
+        ("DOE^JANE (P1)", "", "", "2", [("S1", "20240101", "US", "2", [])]),
+        ("SMITH^JOHN (P2)", "", "", "1", [("S2", "20240301", "CT", "1", [])]),
+    ]
+
+    assert model.search(modality="CT") == 1
+    assert model.studyCount() == 1
+
+
+def test_merge_updates_in_place(index):
+    model = StudyModel(index)
+    model.search()
+    series = _fetch(model, "P1", "S1", "S1.1")
+    kept = QPersistentModelIndex(series.index())
+
+    index.add(
+        [
+            _row("4", "S1", "S1.1", "US"),
+            _row("5", "S1", "S1.2", "SR"),
+            _row("6", "S3", "S3.1", "US", date="20231201"),
+            _row("7", "S4", "S4.1", "MR", "BROWN^ANN", "P3"),
+        ]
+    )
+    model.merge()
+
+    # The fetched series' row is kept, so it stays expanded and selected
+    assert kept.isValid() and kept.data(UidRole) == "S1.1"
+    assert model.studyCount() == 4
+    assert _tree(model) == [
+        ("BROWN^ANN (P3)", "", "", "1", [("S4", "20240101", "MR", "1", [])]),
+        ("DOE^JANE (P1)", "", "", "5", [
+            ("S3", "20231201", "US", "1", []),
+            ("S1", "20240101", "US,SR", "4", [
+                ("S1.1", "", "US", "3", [
+                    ("1", "", "", "1", []),
+                    ("2", "", "", "1", []),
+                    ("4", "", "", "1", []),
+                ]),
+                ("S1.2", "", "SR", "1", []),
+            ]),
+        ]),
+        ("SMITH^JOHN (P2)", "", "", "1", [("S2", "20240301", "CT", "1", [])]),
+    ]
+
+    # Nothing changed since
+    before = _tree(model)
+    model.merge()
+    assert _tree(model) == before
+
+
+def test_merge_keeps_filter(index):
+    model = StudyModel(index)
+    model.search(modality="US")
+
+    index.add([_row("4", "S3", "S3.1", "CT"), _row("5", "S4", "S4.1", "US")])
+    model.merge()
+
+    studies = [study[0] for patient in _tree(model) for study in patient[4]]
+    assert studies == ["S1", "S4"]
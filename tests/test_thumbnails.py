@@ -0,0 +1,76 @@
+import os
+
+import cv2
+import numpy as np
+
+from thumbnails import ThumbnailCache
+
+
+def _image(path, value):
+    cv2.imwrite(str(path), np.full((32, 32, 3), value, np.uint8))
+    return str(path)
+
+
+def _thumbnails(cache):
+    return sorted(os.path.basename(path) for _, _, path in cache._thumbnails())
+
+
+def test_thumbnail(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "cache"), 1 << 20)
+    image = _image(tmp_path / "a.png", 10)
+
+    thumb = cache.thumbnail(image, 8, 4)
+    assert cv2.imread(thumb).shape == (4, 8, 3)
+    assert cache.thumbnail(image, 8, 4) == thumb
+
+
+def test_copies_share_thumbnails(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "cache"), 1 << 20)
+    first = _image(tmp_path / "a.png", 10)
+    copy = _image(tmp_path / "b.png", 10)
+
+    assert cache.thumbnail(first, 8, 8) == cache.thumbnail(copy, 8, 8)
+
+
+def test_changed_image_pruned(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "cache"), 1 << 20)
+    image = _image(tmp_path / "a.png", 10)
+    old = cache.thumbnail(image, 8, 8)
+
+    _image(image, 200)
+    os.utime(image, ns=(0, 0))
+    new = cache.thumbnail(image, 8, 8)
+
+    assert new != old
+    assert not os.path.exists(old)
+    assert _thumbnails(cache) == [os.path.basename(new)]
+
+
+def test_deleted_image_pruned_on_load(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "cache"), 1 << 20)
+    kept = _image(tmp_path / "a.png", 10)
+    deleted = _image(tmp_path / "b.png", 200)
+    thumb = cache.thumbnail(kept, 8, 8)
+    cache.thumbnail(deleted, 8, 8)
+    cache.save()
+
+    os.unlink(deleted)
+    cache = ThumbnailCache(str(tmp_path / "cache"), 1 << 20)
+
+    assert _thumbnails(cache) == [os.path.basename(thumb)]
+    # The kept image's digest is still known
+    assert cache.thumbnail(kept, 8, 8) == thumb
+
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "cache"), 1 << 20)
+    images = [_image(tmp_path / f"{ii}.png", ii * 20) for ii in range(4)]
+    thumbs = [cache.thumbnail(image, 8, 8) for image in images]
+    for ii, thumb in enumerate(thumbs):
+        os.utime(thumb, (ii, ii))
+
+    # Eviction cuts the cache to 90%, which leaves room for the last two
+    cache.maxBytes = sum(os.path.getsize(thumb) for thumb in thumbs[2:]) / 0.9 + 1
+    cache.evict()
+
+    assert [os.path.exists(thumb) for thumb in thumbs] == [False, False, True, True]
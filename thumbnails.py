@@ -0,0 +1,218 @@
+from sys import platform
+
+import hashlib
+import json
+import os
+import threading
+
+if platform == "linux":
+    import cv2
+elif platform == "win32":
+    from cv2 import cv2
+else:
+    raise Exception("Unsupported platform")
+
+
+CACHE_PATH = 'cache/thumbnails'
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_defaultCache = None
+
+
+def defaultCache():
+    """The thumbnail cache shared by all the layout views."""
+    global _defaultCache
+    if _defaultCache is None:
+        _defaultCache = ThumbnailCache(CACHE_PATH, CACHE_MAX_BYTES)
+
+    return _defaultCache
+
+
+class ThumbnailCache:
+    """On-disk cache of image thumbnails.
+
+    Thumbnails are stored under the SHA-1 of the image's contents, so copies
+    of an image share them and a changed image gets new ones. The digest of
+    each path is remembered along with its mtime and size so unchanged
+    images aren't hashed again. Entries of deleted or changed images are
+    pruned when the index is loaded or the image is changed, along with
+    the thumbnails no other image shares. Once the thumbnails take more
+    than `maxBytes` the least recently used ones are removed.
+    """
+
+    def __init__(self, path, maxBytes):
+        self.path = path
+        self.maxBytes = maxBytes
+        self._lock = threading.Lock()
+        self._indexPath = os.path.join(path, 'index.json')
+        self._digests = {}
+        self._keys = {}  # Current index key of each path
+        self._dirty = False
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(self._indexPath):
+            try:
+                with open(self._indexPath, 'r') as f:
+                    self._digests = json.load(f)
+            except (OSError, ValueError) as e:
+                print("ERROR! COULD NOT READ THUMBNAIL INDEX: " + self._indexPath)
+                print(e)
+
+        self.prune()
+
+    def thumbnail(self, imagePath, width, height):
+        """Return the path of a width x height thumbnail of `imagePath`.
+
+        The thumbnail is created if it isn't cached yet.
+        """
+        digest = self.digest(imagePath)
+        thumbPath = os.path.join(self.path, digest[:2], '%s_%dx%d.png' % (digest, width, height))
+
+        if os.path.exists(thumbPath):
+            # Marks the thumbnail as recently used
+            os.utime(thumbPath)
+            return thumbPath
+
+        image = cv2.imread(imagePath)
+        if image is None:
+            raise ValueError("Could not read image " + imagePath)
+
+        thumb = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+        os.makedirs(os.path.dirname(thumbPath), exist_ok=True)
+        # Another thread may be creating the same thumbnail
+        partial = '%s.%d.part.png' % (thumbPath, threading.get_ident())
+        cv2.imwrite(partial, thumb)
+        os.replace(partial, thumbPath)
+
+        with self._lock:
+            self._bytes += os.path.getsize(thumbPath)
+            full = self._bytes > self.maxBytes
+        if full:
+            self.evict()
+
+        return thumbPath
+
+    def digest(self, imagePath):
+        stat = os.stat(imagePath)
+        key = _key(os.path.abspath(imagePath), stat)
+
+        with self._lock:
+            digest = self._digests.get(key)
+            old = self._keys.get(os.path.abspath(imagePath))
+        if digest is not None:
+            return digest
+
+        # The image changed since it was last seen
+        if old is not None:
+            self._forget([old])
+
+        sha1 = hashlib.sha1()
+        with open(imagePath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha1.update(chunk)
+        digest = sha1.hexdigest()
+
+        with self._lock:
+            self._digests[key] = digest
+            self._keys[os.path.abspath(imagePath)] = key
+            self._dirty = True
+
+        return digest
+
+    def prune(self):
+        """Forget deleted and changed images and delete orphaned thumbnails."""
+        with self._lock:
+            keys = list(self._digests)
+
+        stale = []
+        for key in keys:
+            path = key.rsplit('|', 2)[0]
+            try:
+                current = _key(path, os.stat(path))
+            except OSError:
+                current = None
+            if current != key:
+                stale.append(key)
+
+        with self._lock:
+            self._keys = {key.rsplit('|', 2)[0]: key for key in keys if key not in stale}
+
+        self._forget(stale)
+
+    def _forget(self, keys):
+        """Remove index entries, and the thumbnails of digests left unused."""
+        with self._lock:
+            for key in keys:
+                self._digests.pop(key, None)
+                path = key.rsplit('|', 2)[0]
+                if self._keys.get(path) == key:
+                    del self._keys[path]
+            self._dirty = self._dirty or bool(keys)
+            used = set(self._digests.values())
+
+        total = 0
+        for _, size, path in self._thumbnails():
+            if os.path.basename(path).split('_', 1)[0] in used:
+                total += size
+                continue
+
+            try:
+                os.unlink(path)
+            except OSError:
+                total += size
+
+        with self._lock:
+            self._bytes = total
+
+    def evict(self):
+        """Remove the least recently used thumbnails while over budget."""
+        thumbs = sorted(self._thumbnails())
+        total = sum(size for _, size, _ in thumbs)
+
+        # Down to 90% so every new thumbnail doesn't trigger an eviction
+        for _, size, path in thumbs:
+            if total <= 0.9 * self.maxBytes:
+                break
+
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+        with self._lock:
+            self._bytes = total
+
+    def _thumbnails(self):
+        """Yield the mtime, size and path of every cached thumbnail."""
+        for dirpath, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                if not filename.endswith('.png') or filename.endswith('.part.png'):
+                    continue
+
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                yield stat.st_mtime, stat.st_size, path
+
+    def save(self):
+        """Write the digest index, so images aren't hashed again next time."""
+        with self._lock:
+            if not self._dirty:
+                return
+
+            partial = self._indexPath + '.part'
+            with open(partial, 'w') as f:
+                json.dump(self._digests, f)
+
+            os.replace(partial, self._indexPath)
+            self._dirty = False
+
+
+def _key(path, stat):
+    """Index key of an image's current contents."""
+    return '%s|%d|%d' % (path, stat.st_mtime_ns, stat.st_size)